@@ -0,0 +1,283 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# HCopy (config/config.HCopy) と同じ MFCC_E_D を numpy で計算する
+# 16 kHz, 25 ms の Hamming 窓, 10 ms シフト, 高域強調 0.97, 24 チャンネル, 12 次元, ZMEANSOURCE = T, RAWENERGY = F
+# （HTK のデフォルトのまま: CEPLIFTER = 22, DELTAWINDOW = 2, ENORMALISE = T, SILFLOOR = 50, ESCALE = 0.1）
+# 計算の順番は HTK (HParm.c, HSigP.c) と同じで、Julius の libsent/src/wav2mfcc も同じことをしている。
+# HTK は float で計算するので、結果は HCopy と TOLERANCE 程度ずれる（python3 frontend.py check で確かめられる）。
+#
+#   python3 frontend.py (wav) (mfcc)                 1 ファイル
+#   python3 frontend.py -l (wav のリスト) (ark) (scp)   リストの全 wav をまとめて計算してアーカイブに書く（--cmn で global CMN も）
+#   python3 frontend.py check (wav) (HCopy の mfcc)   HCopy の出力との差を表示
+
+import optparse
+import sys
+import wave
+import numpy as np
+
+import htk
+
+SAMPLE_RATE = 16000
+SAMP_PERIOD = 625      # SOURCERATE [100ns]
+TARGET_RATE = 100000   # TARGETRATE [100ns]
+WINDOW_SIZE = 400      # WINDOWSIZE = 250000 [100ns] のサンプル数
+FRAME_SHIFT = 160      # TARGETRATE のサンプル数
+PREEMCOEF = 0.97
+NUMCHANS = 24
+NUMCEPS = 12
+CEPLIFTER = 22
+DELTAWINDOW = 2
+SILFLOOR = 50.0        # [dB]
+ESCALE = 0.1
+PARM_KIND = 'MFCC_E_D'
+
+BATCH_FRAMES = 8192    # 一度に FFT するフレーム数
+TOLERANCE = 1e-3       # HCopy の出力との差の許容値（各次元の最大絶対誤差）
+
+LZERO = -1.0E10        # HTK の log(0)
+MINLARG = 2.45E-308
+
+
+def read_wav(filename):
+  # 16 kHz, 16 bit, モノラルの wav（ファイル名か読み込み用のファイル）を int16 の配列で返す
+  with wave.open(filename, 'rb') as f:
+    if f.getsampwidth() != 2 or f.getnchannels() != 1:
+      raise ValueError('expected 16 bit mono wav')
+    if f.getframerate() != SAMPLE_RATE:
+      raise ValueError('expected %d Hz wav, got %d Hz' % (SAMPLE_RATE, f.getframerate()))
+    return np.frombuffer(f.readframes(f.getnframes()), dtype='<i2')
+
+
+def mel(k, fres):
+  # HTK の Mel(k, fres)
+  return 1127 * np.log(1 + (k - 1) * fres)
+
+
+def make_fbank(fft_n=512, nchans=NUMCHANS, samp_period=SAMP_PERIOD):
+  # HTK の InitFBank と同じ三角フィルタを nchans * (fft_n/2 + 1) の行列（rfft の出力に掛ける）にする
+  nv2 = fft_n // 2
+  fres = 1.0E7 / (samp_period * fft_n * 700.0)
+  klo, khi = 2, nv2
+  mlo, mhi = 0, mel(nv2 + 1, fres)
+  cf = np.arange(1, nchans + 2) / (nchans + 1) * (mhi - mlo) + mlo # cf[chan - 1] がチャンネル chan の中心
+
+  fbank = np.zeros([nchans, nv2 + 1])
+  for k in range(klo, khi + 1):
+    # k は HTK の 1 始まりの FFT の番号（rfft では k - 1）
+    melk = mel(k, fres)
+    chan = np.searchsorted(cf, melk) # melk 以上の中心を持つ最初のチャンネル (0 始まり) = HTK の loChan
+    if chan > 0:
+      weight = (cf[chan] - melk) / (cf[chan] - cf[chan - 1])
+      fbank[chan - 1, k - 1] += weight
+    else:
+      weight = (cf[0] - melk) / (cf[0] - mlo)
+    if chan < nchans:
+      fbank[chan, k - 1] += 1 - weight
+  return fbank
+
+
+def make_dct(nchans=NUMCHANS, nceps=NUMCEPS, lifter=CEPLIFTER):
+  # log フィルタバンク --> リフタリングした c1..c12 の nchans * nceps の行列
+  j = np.arange(1, nceps + 1)
+  k = np.arange(1, nchans + 1)
+  dct = np.sqrt(2.0 / nchans) * np.cos(np.pi / nchans * np.outer(k - 0.5, j))
+  return dct * (1.0 + lifter / 2.0 * np.sin(np.pi * j / lifter))
+
+
+def normalise_energy(energy, sil_floor=SILFLOOR, escale=ESCALE, max_energy=None):
+  # ENORMALISE: 発話中の最大値が 1 になるように log energy を正規化する（max_energy を与えるとそれを最大値とする）
+  if max_energy is None:
+    max_energy = np.max(energy)
+  floor = max_energy - sil_floor * np.log(10.0) / 10.0
+  return 1.0 - (max_energy - np.maximum(energy, floor)) * escale
+
+
+def delta(static, window=DELTAWINDOW):
+  # 回帰係数。前後は最初と最後のフレームを繰り返す（HTK と同じ）
+  nframes = len(static)
+  padded = np.concatenate([np.repeat(static[:1], window, axis=0), static,
+                           np.repeat(static[-1:], window, axis=0)])
+  d = np.zeros_like(static)
+  for theta in range(1, window + 1):
+    d += theta * (padded[window + theta:window + theta + nframes] - padded[window - theta:window - theta + nframes])
+  return d / (2 * sum(theta * theta for theta in range(1, window + 1)))
+
+
+def frame_count(nsamples):
+  # HTK のフレーム数（窓に満たない端は捨てる）
+  return 0 if nsamples < WINDOW_SIZE else (nsamples - WINDOW_SIZE) // FRAME_SHIFT + 1
+
+
+class Frontend(object):
+  # 窓・フィルタバンク・DCT を一度だけ作って、音声 --> MFCC_E_D を計算する
+
+  def __init__(self):
+    self.fft_n = 2
+    while self.fft_n < WINDOW_SIZE:
+      self.fft_n *= 2
+    self.hamming = 0.54 - 0.46 * np.cos(2 * np.pi * np.arange(WINDOW_SIZE) / (WINDOW_SIZE - 1))
+    self.fbank = make_fbank(self.fft_n).T # (fft_n/2 + 1) * nchans
+    self.dct = make_dct()
+
+  def frames(self, samples):
+    # nframes * WINDOW_SIZE の窓（コピーしないビュー）
+    samples = np.asarray(samples)
+    nframes = frame_count(len(samples))
+    if nframes == 0:
+      return np.zeros([0, WINDOW_SIZE], dtype=samples.dtype)
+    return np.lib.stride_tricks.sliding_window_view(samples, WINDOW_SIZE)[::FRAME_SHIFT][:nframes]
+
+  def static(self, frames):
+    # nframes * WINDOW_SIZE の窓 --> nframes * 13 (c1..c12, log energy)。エネルギーは正規化する前
+    out = np.zeros([len(frames), NUMCEPS + 1])
+    for start in range(0, len(frames), BATCH_FRAMES):
+      x = np.array(frames[start:start + BATCH_FRAMES], dtype=np.float64)
+      x -= np.mean(x, axis=1)[:, np.newaxis]               # ZMEANSOURCE（フレームごと）
+      x[:, 1:] -= PREEMCOEF * x[:, :-1]                      # 高域強調
+      x[:, 0] *= 1.0 - PREEMCOEF
+      x *= self.hamming
+      energy = np.sum(x * x, axis=1)                         # RAWENERGY = F: 窓を掛けた後のエネルギー
+      with np.errstate(divide='ignore'):
+        out[start:start + len(x), NUMCEPS] = np.where(energy < MINLARG, LZERO, np.log(energy))
+      spectrum = np.abs(np.fft.rfft(x, self.fft_n))          # 振幅スペクトル (USEPOWER = F)
+      fbank = np.log(np.maximum(np.dot(spectrum, self.fbank), 1.0))
+      out[start:start + len(x), :NUMCEPS] = np.dot(fbank, self.dct)
+    return out
+
+  def finish(self, static):
+    # 発話全体の静的特徴量 --> MFCC_E_D（エネルギーの正規化と回帰係数）
+    static = static.copy()
+    if len(static):
+      static[:, NUMCEPS] = normalise_energy(static[:, NUMCEPS])
+    return np.hstack([static, delta(static)]).astype(np.float32)
+
+  def compute(self, samples):
+    # 1 発話の音声 (int16 など) --> nframes * 26 の MFCC_E_D (float32)
+    return self.finish(self.static(self.frames(samples)))
+
+  def compute_batch(self, signals):
+    # 複数の発話の窓をまとめて FFT・行列積にかけ、発話ごとの MFCC_E_D のリストを返す
+    frames = [self.frames(samples) for samples in signals]
+    if not frames:
+      return []
+    static = self.static(np.concatenate(frames))
+    bounds = np.cumsum([0] + [len(f) for f in frames])
+    return [self.finish(static[bounds[i]:bounds[i + 1]]) for i in range(len(frames))]
+
+  def compute_wav(self, filename):
+    return self.compute(read_wav(filename))
+
+
+class FrontendStream(object):
+  # マイクなどから少しずつ届く音声を MFCC_E_D にする
+  # 回帰係数に DELTAWINDOW フレーム先まで使うので、その分だけ遅れてフレームを返す。
+  # 発話全体の最大値がまだわからないので、エネルギーはそれまでに届いたフレームの最大値で正規化する（最大値が変わらなければ compute と同じ）
+
+  def __init__(self, frontend=None):
+    self.frontend = frontend or Frontend()
+    self.reset()
+
+  def reset(self):
+    self.samples = np.zeros(0)               # まだ窓に使い切っていない音声
+    self.static = np.zeros([0, NUMCEPS + 1]) # 回帰係数を計算するために取っておく静的特徴量（正規化前）
+    self.emitted = 0                         # static のうち、出力済みのフレーム数
+    self.max_energy = None
+
+  def feed(self, samples):
+    # int16 の配列か 16 bit リトルエンディアンの bytes を受け取り、確定したフレーム (nframes * 26) を返す
+    if isinstance(samples, (bytes, bytearray, memoryview)):
+      samples = np.frombuffer(samples, dtype='<i2')
+    self.samples = np.concatenate([self.samples, np.asarray(samples, dtype=np.float64)])
+    nframes = frame_count(len(self.samples))
+    if nframes == 0:
+      return np.zeros([0, 2 * (NUMCEPS + 1)], dtype=np.float32)
+    static = self.frontend.static(self.frontend.frames(self.samples))
+    self.samples = self.samples[nframes * FRAME_SHIFT:]
+    self.static = np.concatenate([self.static, static])
+    self.max_energy = max(np.max(static[:, NUMCEPS]), -np.inf if self.max_energy is None else self.max_energy)
+    return self.emit(len(self.static) - DELTAWINDOW)
+
+  def flush(self):
+    # 発話の終わり: 残りのフレームを（最後のフレームを繰り返して）返す
+    out = self.emit(len(self.static), final=True)
+    self.reset()
+    return out
+
+  def emit(self, end, final=False):
+    # static[emitted:end] のフレームを出力する
+    if end <= self.emitted:
+      return np.zeros([0, 2 * (NUMCEPS + 1)], dtype=np.float32)
+    # 出力するフレームの前後 DELTAWINDOW フレームだけを使って回帰係数を計算する
+    lo = max(self.emitted - DELTAWINDOW, 0)
+    hi = len(self.static) if final else min(end + DELTAWINDOW, len(self.static))
+    static = self.static[lo:hi].copy()
+    static[:, NUMCEPS] = normalise_energy(static[:, NUMCEPS], max_energy=self.max_energy)
+    out = np.hstack([static, delta(static)])[self.emitted - lo:end - lo]
+
+    # 古いフレームは回帰係数に必要な分だけ残す
+    keep = max(end - DELTAWINDOW, 0)
+    self.static = self.static[keep:]
+    self.emitted = end - keep
+    return out.astype(np.float32)
+
+
+# 窓・フィルタバンク・DCT は一つあればよい
+frontend = Frontend()
+
+
+def compute_wav(filename):
+  # wav ファイル --> nframes * 26 の MFCC_E_D
+  return frontend.compute_wav(filename)
+
+
+def check(wav, mfccfile):
+  # HCopy の出力との各次元の最大絶対誤差
+  reference = htk.read(mfccfile)
+  mfcc = compute_wav(wav)
+  if mfcc.shape != reference.shape:
+    raise ValueError('frame count differs: %s vs HCopy %s' % (mfcc.shape, reference.shape))
+  return np.max(np.abs(mfcc - reference), axis=0)
+
+
+# -------------------- ここから main --------------------
+def main():
+  from global_cmn import global_cmn
+
+  usage="""usage: %prog wav mfcc
+       %prog -l wavlist ark scp [--cmn]
+       %prog check wav hcopy_mfcc"""
+  parser = optparse.OptionParser(usage=usage)
+  parser.add_option('-l', '--list', help='compute every wav in a list (first column) into an archive')
+  parser.add_option('--cmn', action='store_true', default=False, help='apply global CMN as global_cmn.py does')
+  options, args = parser.parse_args()
+
+  if len(args) == 3 and args[0] == 'check' and not options.list:
+    error = check(args[1], args[2])
+    print(' '.join('%.2e' % e for e in error))
+    exit(0 if np.max(error) <= TOLERANCE else 1)
+
+  if len(args) != 2:
+    print("Error: wrong argument", file=sys.stderr)
+    parser.print_help()
+    exit(1)
+  normalize = global_cmn if options.cmn else (lambda mfcc: mfcc)
+
+  if not options.list:
+    htk.write_htk(args[1], normalize(compute_wav(args[0])), PARM_KIND, TARGET_RATE)
+    return
+
+  # 発話をまとめて計算する
+  wavs = htk.read_keyed_list(options.list)
+  with htk.ArchiveWriter(args[0], args[1]) as writer:
+    batch = []
+    for i, (key, wav) in enumerate(wavs):
+      batch.append((key, read_wav(wav)))
+      if sum(len(samples) for _, samples in batch) >= BATCH_FRAMES * FRAME_SHIFT or i == len(wavs) - 1:
+        for (key, _), mfcc in zip(batch, frontend.compute_batch([samples for _, samples in batch])):
+          writer.write(key, normalize(mfcc), PARM_KIND, TARGET_RATE)
+        batch = []
+
+
+if __name__ == '__main__':
+  main()
@@ -1,41 +1,136 @@
 #!/usr/bin/python3
 
 # 入力された mfcc ファイルに global CMN を施す
+#
+#   python3 global_cmn.py infile outfile            1 ファイル
+#   python3 global_cmn.py -l list --in-place        リスト（または .scp）の全ファイルをその場で書き換える
+#   python3 global_cmn.py -l list ark scp           リスト（または .scp）の全ファイルを CMN してアーカイブに書く
+#
+# リストをまとめて処理すると、ファイルごとに python を起動しなくて済む。
+# --online を付けると global mean の代わりに直前 --window フレームの平均を引く（OnlineCMN、マイク入力用と同じ処理）
 
 import sys
 import optparse
 import numpy as np
 
+import htk
+
 D = 26 # 次元数。MFCC_E_D なら 26
 D_MFCC = 12 # 生の MFCC の次元数
+WINDOW = 300 # OnlineCMN で平均を取るフレーム数（10ms シフトで 3 秒）
+
+
+def global_cmn(mfcc):
+  # 生の MFCC の部分だけ global mean を引いた nframes * D の配列を返す
+  # global mean（ただし、CMN を施すのは生の MFCC の部分だけ）
+  mfcc_mean = np.mean(mfcc, axis=0)
+  mfcc_mean[D_MFCC:] = 0 # 生の MFCC 以外の次元はゼロ埋め
+
+  # MFCC から global mean を引く
+  return mfcc - mfcc_mean
+
+
+def global_cmn_inplace(mfcc):
+  # global_cmn と同じ値を、mfcc（書き込み可能な mmap のビューなど）に直接書き込む
+  mfcc_mean = np.mean(mfcc, axis=0)
+  mfcc[:, :D_MFCC] -= mfcc_mean[:D_MFCC]
+
+
+class OnlineCMN(object):
+  # sliding window CMN: 各フレームから、そのフレームまでの直近 window フレームの平均を引く
+  # フレームは何回かに分けて渡してよく、分け方によらず同じ結果になる（マイクから届いた分ずつ処理する）
+
+  def __init__(self, window=WINDOW, d_mfcc=D_MFCC):
+    self.window = window
+    self.d_mfcc = d_mfcc
+    self.history = np.zeros([0, d_mfcc]) # 直近 window - 1 フレームの生の MFCC
+
+  def reset(self):
+    self.history = np.zeros([0, self.d_mfcc])
+
+  def process(self, frames):
+    # nframes * D のフレームを受け取り、CMN した nframes * D の配列を返す
+    frames = np.array(frames, dtype=np.float64, ndmin=2)
+    nframes = len(frames)
+    if nframes == 0:
+      return frames
+    raw = np.concatenate([self.history, frames[:, :self.d_mfcc]])
+    nhist = len(self.history)
+
+    # 累積和から、各フレームで終わる窓の和を求める
+    cumsum = np.zeros([len(raw) + 1, self.d_mfcc])
+    np.cumsum(raw, axis=0, out=cumsum[1:])
+    end = np.arange(nhist + 1, nhist + nframes + 1)
+    begin = np.maximum(end - self.window, 0)
+    mean = (cumsum[end] - cumsum[begin]) / (end - begin)[:, np.newaxis]
+
+    frames[:, :self.d_mfcc] -= mean
+    self.history = raw[max(len(raw) - self.window + 1, 0):]
+    return frames
+
+
+def online_cmn(mfcc, window=WINDOW):
+  # ファイル全体を OnlineCMN に通す（学習データをマイク入力と同じ条件にするとき）
+  return OnlineCMN(window).process(mfcc)
+
+
+def cmn_file(infile, outfile, normalize=global_cmn):
+  # 1 ファイルを CMN して書く（ヘッダはそのまま）
+  header, mfcc = htk.open_htk(infile)
+  htk.write_htk(outfile, normalize(mfcc), header.parm_kind, header.samp_period)
+
+
+def cmn_inplace(specs):
+  # ファイル（または ark:offset）をその場で書き換える
+  for spec in specs:
+    global_cmn_inplace(htk.open_htk(spec, mode='r+')[1])
+
 
-usage="""usage: %prog infile outfile"""
-parser = optparse.OptionParser(usage=usage)
-options, args = parser.parse_args()
+def cmn_archive(keyed_specs, ark, scp, normalize=global_cmn):
+  # [(キー, ファイル or ark:offset), ...] を CMN しながらアーカイブに書く
+  with htk.ArchiveWriter(ark, scp) as writer:
+    for key, spec in keyed_specs:
+      header, mfcc = htk.open_htk(spec)
+      writer.write(key, normalize(mfcc), header.parm_kind, header.samp_period)
 
-if not len(args) == 2:
-  print("Error: wrong argument", file=sys.stderr)
-  parser.print_help()
-  exit(1)
-mfccfile = args[0]
-mfccfile_cmn = args[1]
 
+# -------------------- ここから main --------------------
+def main():
+  usage="""usage: %prog infile outfile
+       %prog -l list --in-place
+       %prog -l list ark scp
+(list: a list of MFCC files, or an .scp index of an htk.py archive)"""
+  parser = optparse.OptionParser(usage=usage)
+  parser.add_option('-l', '--list', help='normalize every file in a list or .scp in one process')
+  parser.add_option('--in-place', action='store_true', default=False,
+                    help='overwrite the listed files instead of writing an archive')
+  parser.add_option('--online', action='store_true', default=False,
+                    help='subtract a sliding-window mean instead of the global mean')
+  parser.add_option('--window', type='int', default=WINDOW,
+                    help='window of the online CMN in frames (default: %default)')
+  options, args = parser.parse_args()
 
-# MFCC を 配列に格納
-# ヘッダは先頭12バイト
-mfcc = np.fromfile(mfccfile, dtype='<f4')
-header, mfcc = mfcc[:3], mfcc[3:]
-nsample = len(mfcc) // D
-mfcc = np.reshape(mfcc, (nsample, D))
+  if options.list:
+    ok = len(args) == 0 if options.in_place else len(args) == 2
+  else:
+    ok = len(args) == 2 and not options.in_place
+  if not ok or (options.online and options.in_place):
+    print("Error: wrong argument", file=sys.stderr)
+    parser.print_help()
+    exit(1)
 
-# MFCC の global mean（ただし、CMN を施すのは生の MFCC の部分だけ）
-mfcc_mean = np.mean(mfcc, axis=0)
-mfcc_mean[D_MFCC:] = 0 # 生の MFCC 以外の次元はゼロ埋め
+  if options.online:
+    normalize = lambda mfcc: online_cmn(mfcc, options.window)
+  else:
+    normalize = global_cmn
 
-# MFCC から global mean を引く
-mfcc -= mfcc_mean
+  if not options.list:
+    cmn_file(args[0], args[1], normalize)
+  elif options.in_place:
+    cmn_inplace(htk.read_list(options.list))
+  else:
+    cmn_archive(htk.read_keyed_list(options.list), args[0], args[1], normalize)
 
-# ヘッダを付けて出力
-mfcc = np.r_[header, mfcc.flatten()]
-mfcc.tofile(mfccfile_cmn)
 
+if __name__ == '__main__':
+  main()
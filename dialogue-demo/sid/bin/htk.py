@@ -0,0 +1,209 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# HTK の特徴量ファイルと、それを一つにまとめたアーカイブ（Kaldi の ark/scp のようなもの）
+# ヘッダは 12 バイト: nSamples (int32), sampPeriod (int32, 100ns 単位), sampSize (int16, バイト数), parmKind (int16)
+# config.HCopy は NATURALREADORDER / NATURALWRITEORDER = TRUE なのでリトルエンディアン
+#
+# ark は「ヘッダ + データ」をそのまま並べたもの（どの位置から読んでも一つの HTK ファイルになっている）、
+# scp は 1 行に「キー ark のパス:オフセット」を書いた索引。特徴量は np.memmap の上のビューとして読むのでコピーしない。
+#
+#   python3 htk.py pack (ark) (scp) (MFCC ファイル) ...   MFCC ファイルをアーカイブにまとめる（-l でリストから）
+#   python3 htk.py info (MFCC ファイル or ark:offset) ...  ヘッダを表示
+
+import collections
+import optparse
+import os
+import struct
+import sys
+import numpy as np
+
+HEADER = struct.Struct('<iihh')
+
+BASE_KINDS = ['WAVEFORM', 'LPC', 'LPREFC', 'LPCEPSTRA', 'LPDELCEP', 'IREFC',
+              'MFCC', 'FBANK', 'MELSPEC', 'USER', 'DISCRETE', 'PLP']
+QUALIFIERS = [('_E', 0o100), ('_N', 0o200), ('_D', 0o400), ('_A', 0o1000), ('_C', 0o2000),
+              ('_Z', 0o4000), ('_K', 0o10000), ('_0', 0o20000), ('_V', 0o40000), ('_T', 0o100000)]
+BASE_MASK = 0o77
+
+
+def parm_kind_name(parm_kind):
+  # 6 | 0o100 | 0o400 --> 'MFCC_E_D'
+  parm_kind &= 0xffff
+  name = BASE_KINDS[parm_kind & BASE_MASK]
+  for qualifier, bit in QUALIFIERS:
+    if parm_kind & bit:
+      name += qualifier
+  return name
+
+
+def parm_kind_code(name):
+  # 'MFCC_E_D' --> 6 | 0o100 | 0o400
+  parts = name.upper().split('_')
+  code = BASE_KINDS.index(parts[0])
+  for part in parts[1:]:
+    code |= dict(QUALIFIERS)['_' + part]
+  return code
+
+
+class HTKHeader(collections.namedtuple('HTKHeader', ['nsamples', 'samp_period', 'samp_size', 'parm_kind'])):
+
+  @property
+  def dim(self):
+    # 1 フレームの次元数（float32）
+    return self.samp_size // 4
+
+  @property
+  def kind(self):
+    return parm_kind_name(self.parm_kind)
+
+  def pack(self):
+    return HEADER.pack(*self)
+
+
+def parse_header(data, offset=0):
+  header = HTKHeader(*HEADER.unpack_from(data, offset))
+  if header.parm_kind & dict(QUALIFIERS)['_C']:
+    raise ValueError('compressed HTK files are not supported (SAVECOMPRESSED = F)')
+  if header.nsamples < 0 or header.samp_size <= 0 or header.samp_size % 4:
+    raise ValueError('not an HTK feature file header: %r' % (header,))
+  return header
+
+
+# 開いたファイル・アーカイブの mmap（アーカイブは一度だけ開く）
+mapped = {}
+
+
+def mmap_file(filename, cache=True, mode='r'):
+  # mode='r+' で開くとビューへの書き込みがそのままファイルに反映される（キャッシュはしない）
+  filename = os.path.abspath(filename)
+  if mode == 'r' and filename in mapped:
+    return mapped[filename]
+  data = np.memmap(filename, dtype=np.uint8, mode=mode)
+  if cache and mode == 'r':
+    mapped[filename] = data
+  return data
+
+
+def split_spec(spec):
+  # 'foo.ark:1234' --> ('foo.ark', 1234)、'foo.mfcc' --> ('foo.mfcc', None)
+  path, sep, offset = spec.rpartition(':')
+  if sep and offset.isdigit():
+    return path, int(offset)
+  return spec, None
+
+
+def open_htk(spec, mode='r'):
+  # HTK ファイル（または ark:offset の 1 レコード）を (ヘッダ, nframes * dim の float32 ビュー) で返す
+  # データはコピーせず、ファイルの mmap をそのまま見る
+  path, offset = split_spec(spec)
+  data = mmap_file(path, cache=offset is not None, mode=mode)
+  offset = offset or 0
+  header = parse_header(data, offset)
+  count = header.nsamples * header.dim
+  frames = np.frombuffer(data, dtype='<f4', count=count, offset=offset + HEADER.size)
+  return header, frames.reshape(header.nsamples, header.dim)
+
+
+def read(spec):
+  # nframes * dim のフレームだけ
+  return open_htk(spec)[1]
+
+
+def write_htk(f, frames, parm_kind, samp_period=100000):
+  # nframes * dim のフレームを HTK 形式で書く（f はファイル名か書き込み用のファイル）
+  frames = np.ascontiguousarray(frames, dtype='<f4')
+  if not isinstance(parm_kind, int):
+    parm_kind = parm_kind_code(parm_kind)
+  header = HTKHeader(len(frames), samp_period, frames.shape[1] * 4, parm_kind)
+  if isinstance(f, str):
+    with open(f, 'wb') as out:
+      out.write(header.pack())
+      out.write(frames.tobytes())
+  else:
+    f.write(header.pack())
+    f.write(frames.tobytes())
+
+
+class ArchiveWriter(object):
+  # ark にレコードを追記し、scp に「キー ark:offset」を書く
+
+  def __init__(self, ark, scp):
+    self.ark_path = os.path.abspath(ark)
+    self.ark = open(ark, 'wb')
+    self.scp = open(scp, 'w')
+    mapped.pop(self.ark_path, None)
+
+  def write(self, key, frames, parm_kind, samp_period=100000):
+    offset = self.ark.tell()
+    write_htk(self.ark, frames, parm_kind, samp_period)
+    self.scp.write('%s %s:%d\n' % (key, self.ark_path, offset))
+
+  def close(self):
+    self.ark.close()
+    self.scp.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def read_scp(scp):
+  # [(キー, 'ark:offset'), ...]
+  with open(scp) as f:
+    return [tuple(line.split(None, 1)) for line in f.read().splitlines() if line.strip()]
+
+
+def utterance_key(filename):
+  # アーカイブのキー（拡張子を除いたファイル名）
+  return os.path.splitext(os.path.basename(filename))[0]
+
+
+def read_keyed_list(listfile):
+  # [(キー, 特徴量ファイル or ark:offset), ...]（.scp ならそのキー、それ以外はファイル名から）
+  if listfile.endswith('.scp'):
+    return [(key, spec.strip()) for key, spec in read_scp(listfile)]
+  with open(listfile) as f:
+    return [(utterance_key(line.split()[0]), line.split()[0]) for line in f if line.strip()]
+
+
+def read_list(listfile):
+  # 特徴量ファイルのリスト（.scp なら ark:offset のリスト）
+  return [spec for _, spec in read_keyed_list(listfile)]
+
+
+def pack(ark, scp, filenames):
+  # HTK ファイルをアーカイブにまとめる
+  with ArchiveWriter(ark, scp) as writer:
+    for filename in filenames:
+      header, frames = open_htk(filename)
+      writer.write(utterance_key(filename), frames, header.parm_kind, header.samp_period)
+
+
+# -------------------- ここから main --------------------
+def main():
+  usage="""usage: %prog pack ark scp [-l list] [mfcc files]
+       %prog info [mfcc files or ark:offset]"""
+  parser = optparse.OptionParser(usage=usage)
+  parser.add_option('-l', '--list', help='read the file names from a list')
+  options, args = parser.parse_args()
+
+  if len(args) < 1 or args[0] not in ('pack', 'info') or (args[0] == 'pack' and len(args) < 3):
+    print("Error: wrong argument", file=sys.stderr)
+    parser.print_help()
+    exit(1)
+
+  if args[0] == 'pack':
+    filenames = args[3:] + (read_list(options.list) if options.list else [])
+    pack(args[1], args[2], filenames)
+  else:
+    for spec in args[1:] + (read_list(options.list) if options.list else []):
+      header = open_htk(spec)[0]
+      print('%s\t%s\t%d frames\t%d dims\t%.1f ms' % (spec, header.kind, header.nsamples, header.dim,
+                                                     header.samp_period / 1e4))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# calc_ivector.py の並列版
+# UBM と T, T_invS, 混合ごとの T_c Σ_c^-1 T_c^T を共有メモリ（/dev/shm に置いた .npy を各プロセスが mmap）に一度だけ置き、
+# 特徴量ファイルのリストを複数のプロセスに分けて i-vector を計算する。出力の順番はリストの順番のまま。
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+import htk
+from spkid import UBM, IvectorExtractor, GaussianSelection
+
+CHUNK = 16 # 1 回の仕事で 1 つのプロセスが扱うファイル数
+
+SHARED = ['mu', 'sigma', 'w', 'T', 'T_invS', 'TT']
+
+
+# 各ワーカープロセスの IvectorExtractor（共有メモリを mmap したもの）と、統計量を計算するもの（UBM か GaussianSelection）
+extractor = None
+stats = None
+
+
+def init_worker(directory, selection=None):
+  global extractor, stats
+  a = dict((name, np.load(os.path.join(directory, name + '.npy'), mmap_mode='r')) for name in SHARED)
+  ubm = UBM(np.asarray(a['mu']), np.asarray(a['sigma']), np.asarray(a['w']))
+  extractor = IvectorExtractor(a['T'], ubm, T_invS=a['T_invS'], TT=a['TT'])
+  stats = GaussianSelection(ubm, **selection) if selection else ubm
+
+
+def extract_chunk(files):
+  # ファイルのまとまりの i-vector と、フレーム数、かかった時間
+  start = time.time()
+  ubm = extractor.ubm
+  N = np.zeros([len(files), ubm.nmix])
+  F = np.zeros([len(files), ubm.ndim*ubm.nmix])
+  nframes = 0
+  for ix in range(len(files)):
+    mfcc = htk.read(files[ix])
+    N[ix, :], F[ix, :] = stats.bw_stats_frames(mfcc)
+    nframes += len(mfcc)
+  return extractor.extract_batch(N, F), nframes, time.time() - start
+
+
+class IvectorPool(object):
+  # 共有メモリのモデルを持つワーカープロセスの集まり
+
+  def __init__(self, extractor, processes=None, selection=None):
+    # selection: GaussianSelection を使うときはそれ（各ワーカーで同じものを作り直す）
+    shm = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    self.directory = tempfile.mkdtemp(prefix='ivector_', dir=shm)
+    ubm = extractor.ubm
+    arrays = {'mu': ubm.mu, 'sigma': ubm.sigma, 'w': ubm.w,
+              'T': extractor.T, 'T_invS': extractor.T_invS, 'TT': extractor.TT}
+
+    self.processes = processes or multiprocessing.cpu_count()
+    params = selection.params() if selection is not None else None
+    try:
+      for name in SHARED:
+        np.save(os.path.join(self.directory, name + '.npy'), arrays[name])
+      self.pool = multiprocessing.Pool(self.processes, init_worker, (self.directory, params))
+    except BaseException:
+      # /dev/shm が一杯などで起動できなかったら、置いた .npy を消してから例外を投げ直す
+      shutil.rmtree(self.directory, ignore_errors=True)
+      raise
+
+  def extract(self, files, chunk=CHUNK, report=sys.stderr):
+    # リストの順番どおりに i-vector を 1 ファイルずつ返し、まとまりごとに処理速度を report に書く
+    chunks = [files[i:i + chunk] for i in range(0, len(files), chunk)]
+    start = time.time()
+    done = 0
+    nframes = 0
+    for iv, chunk_frames, elapsed in self.pool.imap(extract_chunk, chunks):
+      for row in iv:
+        yield row
+      done += len(iv)
+      nframes += chunk_frames
+      if report is not None:
+        total = time.time() - start
+        report.write('i-vector: %d/%d files, %.1f files/s, %.0f frames/s (%.3f s/file in a worker)\n'
+                     % (done, len(files), done / total, nframes / total, elapsed / len(iv)))
+
+    if report is not None and done:
+      total = time.time() - start
+      report.write('i-vector: %d files in %.2f s with %d processes (%.1f files/s)\n'
+                   % (done, total, self.processes, done / total))
+
+  def close(self):
+    try:
+      self.pool.close()
+      self.pool.join()
+    finally:
+      shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,907 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# 常駐型の話者識別サービス
+# test_iv.sh の HCopy → global_cmn.py → extract_mu_sigma_w → calc_ivector.py → svm-scale → svm-predict を
+# 一つのプロセスの中で行う。UBM, T 行列, SVM モデルは起動時に一度だけ読み込む。
+# wav の MFCC は frontend.py で計算する（--hcopy を付けると HCopy を呼ぶ）。
+#
+#   python3 spkid.py identify (wav or mfcc) ...   その場で識別して話者番号を出力
+#   python3 spkid.py serve [--port N]             常駐して 1 行 1 ファイルのリクエストに話者番号を返す
+#   python3 spkid.py query (wav or mfcc) ...      常駐サービスに問い合わせる（起動していないか、別のモデルを読んでいればその場で識別）
+#   python3 spkid.py compile [--ubm jmodel]       UBM を mmap できるバンドル (jmodel.bundle) に変換する
+#   python3 spkid.py stream [wav]                 標準入力 (16 kHz, 16 bit の raw) か wav を少しずつ読み、暫定の話者番号を出力する
+#                                                 （確定したらそこで終わる。例: arecord -r 16000 -f S16_LE | python3 spkid.py stream）
+
+import collections
+import hashlib
+import json
+import optparse
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import tempfile
+import numpy as np
+
+import frontend
+import htk
+from global_cmn import global_cmn, OnlineCMN, WINDOW as CMN_WINDOW
+
+bin_path = os.path.dirname(os.path.abspath(__file__))
+sid_path = os.path.dirname(bin_path)
+
+HCopybin = os.path.join(sid_path, '..', 'bin', 'HCopy')
+HCopyConf = os.path.join(sid_path, 'config', 'config.HCopy')
+UBMfile = os.path.join(sid_path, 'UBM', 'jmodel')
+TVmatrix = os.path.join(sid_path, 'tvmatrix', 'tvmatrix_it3.npy')
+SVMmodel = os.path.join(sid_path, 'SVM', 'model')      # train_iv.sh が書き出すもの
+SVMscale = os.path.join(sid_path, 'SVM', 'scale.dat')
+
+D = 26 # 次元数。MFCC_E_D なら 26
+E_INDEX = 12 # 第13列がエネルギー
+
+DEFAULT_PORT = 10600
+
+BATCH_SIZE = 32 # まとめて Cholesky 分解する発話数（1 発話あたり tv_dim^2 の精度行列を持つ）
+SOLVE_BLOCK = 64 # 三角行列の代入を行うブロックの大きさ
+
+TOP_C = 20 # Gaussian selection でフレームごとに残す混合の数
+SHORTLIST = 48 # クラスタごとに評価する混合の数
+CHUNK_FRAMES = 1000 # 近似版の統計量で一度に処理するフレーム数
+CLUSTER_ITERATIONS = 10
+SHORTLIST_SAMPLES = 20000 # shortlist を作るために UBM から作るサンプル数
+
+UPDATE_FRAMES = 50 # OnlineIdentifier が暫定の話者番号を出し直す間隔（フレーム数, 0.5 秒）
+MIN_FRAMES = 100 # これより短いうちは打ち切らない（1 秒）
+STABLE_UPDATES = 3 # 同じ話者番号が続いたら打ち切る回数
+STREAM_CHUNK = 1600 # spkid.py stream で一度に読むサンプル数 (0.1 秒)
+
+
+# -------------------- 特徴量 --------------------
+
+def read_htk(feaFilename):
+  # HTK の特徴量ファイル（または ark:offset）を (ヘッダ, nframes * D の mmap のビュー) で返す
+  return htk.open_htk(feaFilename)
+
+
+def hcopy(wav):
+  # wav --> MFCC_E_D（HCopy を呼ぶのはここだけ）
+  with tempfile.TemporaryDirectory() as tmpdir:
+    mfccfile = os.path.join(tmpdir, 'tmp.mfcc')
+    subprocess.check_call([HCopybin, '-C', HCopyConf, wav, mfccfile])
+    return read_htk(mfccfile)[1]
+
+
+def load_features(filename, use_hcopy=False):
+  # wav または HCopy 済みの MFCC_E_D (CMN 前) を読んで、CMN した nframes * 26 の MFCC_E_D を返す
+  if filename.endswith('.wav'):
+    mfcc = hcopy(filename) if use_hcopy else frontend.compute_wav(filename)
+  else:
+    mfcc = read_htk(filename)[1]
+  return global_cmn(mfcc)
+
+
+# -------------------- UBM --------------------
+
+def read_htk_gmm(gmmFilename):
+  # HTK 形式の GMM を読んで平均・分散・重みを返す（extract_mu_sigma_w.c と同じく ndim * nmix）
+  with open(gmmFilename) as f:
+    tokens = f.read().replace('<', ' <').replace('>', '> ').split()
+
+  mu, sigma, w = [], [], []
+  i = 0
+  while i < len(tokens):
+    token = tokens[i].upper()
+    if token == '<MIXTURE>':
+      w.append(float(tokens[i + 2]))
+      i += 3
+    elif token in ('<MEAN>', '<VARIANCE>'):
+      n = int(tokens[i + 1])
+      values = [float(x) for x in tokens[i + 2:i + 2 + n]]
+      (mu if token == '<MEAN>' else sigma).append(values)
+      i += 2 + n
+    else:
+      i += 1
+
+  return np.array(mu).T, np.array(sigma).T, np.array(w)
+
+
+class UBM(object):
+  # UBM の平均 mu, 分散 sigma, 重み w と、フレームごとに使い回す定数
+
+  def __init__(self, mu, sigma, w):
+    self.mu = mu
+    self.sigma = sigma
+    self.w = w
+    self.ndim, self.nmix = np.shape(mu)
+
+    self.log_det = np.sum(np.log(sigma), axis=0)
+    self.C = np.sum(mu**2 * 1./sigma, axis=0) + self.log_det
+    self.inv_sigma = (1./sigma).T
+    self.mu_inv_sigma = (mu*1./sigma).T
+    self.log_w = np.log(w)
+
+    # スーパーベクトル上の平均と、各次元が属する混合の番号
+    self.m = np.reshape(mu.T, self.ndim*self.nmix)
+    self.idx_sv = np.reshape(np.tile(np.arange(self.nmix), [self.ndim, 1]).T, self.ndim*self.nmix)
+
+  @classmethod
+  def from_arrays(cls, arrays):
+    # 計算済みの配列（compile_ubm のバンドル）から、何も計算せずに作る
+    ubm = cls.__new__(cls)
+    for name in UBM_ARRAYS:
+      setattr(ubm, name, arrays[name])
+    ubm.ndim, ubm.nmix = np.shape(ubm.mu)
+    return ubm
+
+  @classmethod
+  def load(cls, gmmFilename, bundle=None):
+    # jmodel から作ったバンドルを mmap する（なければ、または jmodel が変わっていれば作り直す）
+    sha1 = file_sha1(gmmFilename)
+    ubm = cls.from_arrays(load_ubm_bundle(gmmFilename, bundle, sha1))
+    # T のバンドル（IvectorExtractor.load）はこの UBM から計算するので、jmodel のハッシュも覚えておく
+    ubm.sha1 = sha1
+    return ubm
+
+  def lgmmprob(self, data, skip=None):
+    # compute the log probability of observations given the GMM
+    # skip: data が ndim+1 次元のとき無視する次元（MFCC_E_D のエネルギーを np.delete でコピーせずに飛ばす）
+    inv_sigma, mu_inv_sigma = self.inv_sigma, self.mu_inv_sigma
+    if skip is not None:
+      inv_sigma = np.insert(inv_sigma, skip, 0, axis=1)
+      mu_inv_sigma = np.insert(mu_inv_sigma, skip, 0, axis=1)
+    D = np.dot(inv_sigma, data**2) - 2 * np.dot(mu_inv_sigma, data) + self.ndim * np.log(2 * np.pi)
+    return -0.5 * (self.C[:,np.newaxis] + D) + self.log_w[:,np.newaxis]
+
+  def postprob(self, data, skip=None):
+    # compute the posterior probability of mixtures for each frame
+    post = self.lgmmprob(data, skip)
+    llk = logsumexp(post, 0)
+    return np.exp(post - llk)
+
+  def bw_stats(self, data, skip=None):
+    # Baum-Welch 統計量 (0次 N, 中心化した1次 F)
+    post = self.postprob(data, skip)
+    N = np.sum(post, axis=1)
+    F = np.dot(data, post.T)
+    if skip is not None:
+      F = np.delete(F, skip, axis=0)
+    F = np.reshape(F.T, self.ndim*self.nmix)
+    return N, F - N[self.idx_sv] * self.m
+
+  def bw_stats_frames(self, mfcc):
+    # nframes * 26 の MFCC_E_D（memmap のビューのまま）から、エネルギーを無視して統計量
+    return self.bw_stats(mfcc.T, skip=E_INDEX)
+
+
+# -------------------- UBM と T のバンドル --------------------
+# jmodel をテキストのまま毎回読む代わりに、平均・分散・重みと派生量を一つのファイルにまとめておき mmap する
+# T 行列も同じ形式で、T_c Σ_c^-1 T_c^T などの派生量と一緒にまとめる（T と jmodel のどちらかが変われば作り直す）
+# 形式: UBM_MAGIC, ヘッダ長 (<I), JSON ヘッダ {version, sha1, arrays: {名前: [offset, dtype, shape]}}, 64 バイト境界の配列
+
+UBM_MAGIC = b'SIDUBM\n'
+UBM_VERSION = 1
+UBM_ARRAYS = ['mu', 'sigma', 'w', 'log_det', 'C', 'inv_sigma', 'mu_inv_sigma', 'log_w', 'm', 'idx_sv']
+TV_ARRAYS = ['T', 'T_invS', 'TT']
+
+
+def ubm_bundle_path(gmmFilename):
+  return gmmFilename + '.bundle'
+
+
+def tv_bundle_path(T_matrix):
+  return T_matrix + '.bundle'
+
+
+def file_sha1(filename):
+  with open(filename, 'rb') as f:
+    return hashlib.sha1(f.read()).hexdigest()
+
+
+def write_bundle(bundle, sha1, arrays):
+  # {名前: 配列} をハッシュ sha1 付きのバンドルに書き出す（一時ファイルに書いてから置き換える）
+  layout = {}
+  offset = 0
+  for name, array in arrays.items():
+    array = np.ascontiguousarray(array)
+    layout[name] = [offset, array.dtype.str, list(np.shape(array))]
+    offset += (array.nbytes + 63) // 64 * 64
+  header = json.dumps({'version': UBM_VERSION, 'sha1': sha1, 'arrays': layout}).encode('utf-8')
+  start = (len(UBM_MAGIC) + 4 + len(header) + 63) // 64 * 64
+
+  tmpfile = bundle + '.tmp'
+  with open(tmpfile, 'wb') as f:
+    f.write(UBM_MAGIC)
+    f.write(struct.pack('<I', len(header)))
+    f.write(header)
+    for name, array in arrays.items():
+      f.seek(start + layout[name][0])
+      f.write(np.ascontiguousarray(array).tobytes())
+  os.replace(tmpfile, bundle)
+
+
+def compile_ubm(gmmFilename, bundle=None, sha1=None):
+  # HTK の GMM を読んで派生量ごとバンドルに書き出す
+  bundle = bundle or ubm_bundle_path(gmmFilename)
+  ubm = UBM(*read_htk_gmm(gmmFilename))
+  write_bundle(bundle, sha1 or file_sha1(gmmFilename), dict((name, getattr(ubm, name)) for name in UBM_ARRAYS))
+  return ubm
+
+
+def read_bundle(bundle):
+  # バンドルを mmap して (ヘッダ, {名前: 配列}) を返す（形式が違えば None）
+  try:
+    with open(bundle, 'rb') as f:
+      if f.read(len(UBM_MAGIC)) != UBM_MAGIC:
+        return None
+      length, = struct.unpack('<I', f.read(4))
+      header = json.loads(f.read(length).decode('utf-8'))
+  except (OSError, ValueError, struct.error):
+    return None
+  if header.get('version') != UBM_VERSION:
+    return None
+
+  start = (len(UBM_MAGIC) + 4 + length + 63) // 64 * 64
+  data = np.memmap(bundle, dtype=np.uint8, mode='r')
+  arrays = {}
+  for name, (offset, dtype, shape) in header['arrays'].items():
+    count = int(np.prod(shape))
+    arrays[name] = np.frombuffer(data, dtype=dtype, count=count, offset=start + offset).reshape(shape)
+  return header, arrays
+
+
+def load_bundle(bundle, sha1, build):
+  # ハッシュが一致するバンドルがあればそれを、なければ build() の {名前: 配列} で作り直して返す
+  cached = read_bundle(bundle)
+  if cached is not None and cached[0]['sha1'] == sha1:
+    return cached[1]
+
+  arrays = build()
+  try:
+    write_bundle(bundle, sha1, arrays)
+  except OSError:
+    # 書き込めない場所ならその場で計算したものを使う
+    return arrays
+  return read_bundle(bundle)[1]
+
+
+def load_ubm_bundle(gmmFilename, bundle=None, sha1=None):
+  # jmodel のハッシュが一致するバンドルがあればそれを、なければ作り直して返す
+  def build():
+    ubm = UBM(*read_htk_gmm(gmmFilename))
+    return dict((name, getattr(ubm, name)) for name in UBM_ARRAYS)
+  return load_bundle(bundle or ubm_bundle_path(gmmFilename), sha1 or file_sha1(gmmFilename), build)
+
+
+def logsumexp(x, dim):
+  # compute log(sum(exp(x),dim)) while avoiding numerical underflow
+  xmax = np.max(x, axis=dim)
+  return xmax + np.log(np.sum(np.exp(x - xmax), axis=dim))
+
+
+# -------------------- Gaussian selection --------------------
+# 長い発話では、全フレーム・全混合の事後確率 (nmix * nframes, float64) の計算がいちばん重い。
+# GaussianSelection は UBM と同じ bw_stats / bw_stats_frames を持ち、次の近似で N, F を計算する:
+#  - フレームを chunk ずつ float32 で処理する（メモリは nmix * chunk で頭打ち）
+#  - フレームごとに対数尤度の大きい top 個の混合だけで事後確率を計算し、N, F には疎なまま足し込む
+#  - clusters > 0 なら、混合を clusters 個にまとめた小さな UBM で各フレームに一番近いクラスタを選び、
+#    そのクラスタの shortlist 個の混合だけを評価する
+
+def cluster_ubm(ubm, nclusters, iterations=CLUSTER_ITERATIONS):
+  # 混合の平均を k-means でまとめた小さな UBM (mu, sigma, w: ndim * nclusters) と、各混合のクラスタ番号
+  z = ubm.mu.T / np.sqrt(np.mean(ubm.sigma, axis=1)) # 分散で正規化した nmix * ndim の平均
+  centers = z[np.argsort(-ubm.w, kind='stable')[:nclusters]]
+  for _ in range(iterations):
+    assign = np.argmin(np.sum((z[:, np.newaxis, :] - centers[np.newaxis, :, :])**2, axis=2), axis=1)
+    for k in range(nclusters):
+      members = assign == k
+      if np.any(members):
+        centers[k] = np.dot(ubm.w[members], z[members]) / np.sum(ubm.w[members])
+
+  # クラスタごとに混合をモーメントが一致するようにまとめる
+  w = np.bincount(assign, weights=ubm.w, minlength=nclusters)
+  w = np.maximum(w, np.min(ubm.w)) # 空のクラスタ
+  mu = np.empty([ubm.ndim, nclusters])
+  sigma = np.empty([ubm.ndim, nclusters])
+  for k in range(nclusters):
+    members = assign == k
+    if not np.any(members):
+      members = np.arange(ubm.nmix) == np.argmin(np.sum((z - centers[k])**2, axis=1))
+    wk = ubm.w[members] / np.sum(ubm.w[members])
+    mu[:, k] = np.dot(ubm.mu[:, members], wk)
+    sigma[:, k] = np.dot(ubm.sigma[:, members] + ubm.mu[:, members]**2, wk) - mu[:, k]**2
+  return UBM(mu, np.maximum(sigma, np.min(ubm.sigma)), w / np.sum(w)), assign
+
+
+def make_shortlists(ubm, small, shortlist, samples=SHORTLIST_SAMPLES):
+  # 小さな UBM のクラスタごとに、そのクラスタに入るフレームで事後確率の大きい混合 shortlist 個（クラスタ数 * shortlist）
+  # フレームの代わりに UBM 自身から（乱数の種を固定して）サンプルを作り、クラスタごとに事後確率の和で並べる
+  rng = np.random.RandomState(0)
+  comp = rng.choice(ubm.nmix, size=samples, p=ubm.w / np.sum(ubm.w))
+  x = ubm.mu[:, comp] + np.sqrt(ubm.sigma[:, comp]) * rng.standard_normal([ubm.ndim, samples])
+  post = ubm.postprob(x)
+  nearest = np.argmax(small.lgmmprob(x), axis=0)
+
+  mass = np.zeros([small.nmix, ubm.nmix])
+  for k in range(small.nmix):
+    mass[k] = np.sum(post[:, nearest == k], axis=1)
+  # サンプルが一つも入らなかったクラスタは、平均が近い混合の順
+  var = ubm.sigma[:, np.newaxis, :] + small.sigma[:, :, np.newaxis]
+  diff = small.mu[:, :, np.newaxis] - ubm.mu[:, np.newaxis, :]
+  score = np.log(ubm.w) - 0.5 * np.sum(diff**2 / var + np.log(var), axis=0)
+  empty = np.sum(mass, axis=1) == 0
+  mass[empty] = np.exp(score[empty] - np.max(score[empty], axis=1)[:, np.newaxis]) if np.any(empty) else 0
+  return np.argsort(-mass, axis=1, kind='stable')[:, :shortlist]
+
+
+class GaussianSelection(object):
+  # UBM の代わりに渡す、近似版の Baum-Welch 統計量
+
+  def __init__(self, ubm, top=TOP_C, clusters=0, shortlist=SHORTLIST, chunk=CHUNK_FRAMES, dtype=np.float32):
+    self.ubm = ubm
+    self.ndim, self.nmix = ubm.ndim, ubm.nmix
+    self.top, self.clusters, self.shortlist, self.chunk = top, clusters, shortlist, chunk
+    self.dtype = np.dtype(dtype)
+    self.weights = {}
+
+    # 対数尤度 = [x^2, x] と重みの積 + 定数（skip ごとに作る重みは self.weights に置いておく）
+    self.const = (ubm.log_w - 0.5 * (ubm.C + self.ndim * np.log(2 * np.pi))).astype(self.dtype)
+
+    if clusters > 0:
+      self.small, self.assign = cluster_ubm(ubm, clusters)
+      self.small_const = (self.small.log_w - 0.5 * (self.small.C + self.ndim * np.log(2 * np.pi))).astype(self.dtype)
+      self.shortlists = make_shortlists(ubm, self.small, min(shortlist, self.nmix))
+
+  def params(self):
+    # 同じ GaussianSelection を作るための引数（ivector_pool.py のワーカーに渡す）
+    return dict(top=self.top, clusters=self.clusters, shortlist=self.shortlist, chunk=self.chunk, dtype=self.dtype.str)
+
+  def weight(self, ubm, skip):
+    # nmix * (2 * 次元数) の [-Σ^-1 / 2, μ Σ^-1]（skip の次元は 0）
+    key = (id(ubm), skip)
+    if key not in self.weights:
+      inv_sigma, mu_inv_sigma = ubm.inv_sigma, ubm.mu_inv_sigma
+      if skip is not None:
+        inv_sigma = np.insert(inv_sigma, skip, 0, axis=1)
+        mu_inv_sigma = np.insert(mu_inv_sigma, skip, 0, axis=1)
+      self.weights[key] = np.hstack([-0.5 * inv_sigma, mu_inv_sigma]).astype(self.dtype)
+    return self.weights[key]
+
+  def select(self, feats, skip):
+    # フレームごとの (候補の混合番号, その対数尤度): どちらも nframes * 候補数
+    W = self.weight(self.ubm, skip)
+    if self.clusters <= 0:
+      loglik = np.dot(feats, W.T) + self.const
+      index = np.broadcast_to(np.arange(self.nmix), loglik.shape)
+    else:
+      nearest = np.argmax(np.dot(feats, self.weight(self.small, skip).T) + self.small_const, axis=1)
+      index = self.shortlists[nearest]
+      loglik = np.empty(index.shape, dtype=self.dtype)
+      for k in np.unique(nearest):
+        rows = nearest == k
+        mix = self.shortlists[k]
+        loglik[rows] = np.dot(feats[rows], W[mix].T) + self.const[mix]
+
+    if self.top < loglik.shape[1]:
+      best = np.argpartition(-loglik, self.top - 1, axis=1)[:, :self.top]
+      index = np.take_along_axis(index, best, axis=1)
+      loglik = np.take_along_axis(loglik, best, axis=1)
+    return index, loglik
+
+  def bw_stats(self, data, skip=None):
+    # UBM.bw_stats と同じ (dim * nframes の data から N, 中心化した F)
+    dim = np.shape(data)[0]
+    N = np.zeros(self.nmix)
+    F = np.zeros([self.nmix, dim])
+    for start in range(0, np.shape(data)[1], self.chunk):
+      x = np.asarray(data[:, start:start + self.chunk].T, dtype=self.dtype) # nframes * dim
+      index, loglik = self.select(np.hstack([x * x, x]), skip)
+
+      # 選んだ混合の中で正規化した事後確率を疎なまま足し込む
+      post = np.exp(loglik - np.max(loglik, axis=1)[:, np.newaxis])
+      post /= np.sum(post, axis=1)[:, np.newaxis]
+      N += np.bincount(index.ravel(), weights=post.ravel(), minlength=self.nmix)
+      sparse = np.zeros([len(x), self.nmix], dtype=self.dtype)
+      np.put_along_axis(sparse, index, post, axis=1)
+      F += np.dot(sparse.T, x)
+
+    if skip is not None:
+      F = np.delete(F, skip, axis=1)
+    return N, np.reshape(F, self.ndim * self.nmix) - N[self.ubm.idx_sv] * self.ubm.m
+
+  def bw_stats_frames(self, mfcc):
+    return self.bw_stats(mfcc.T, skip=E_INDEX)
+
+
+def ivector_drift(exact, approx):
+  # 近似した i-vector (nfiles * tv_dim) の厳密な i-vector からのずれ
+  exact = np.atleast_2d(exact)
+  approx = np.atleast_2d(approx)
+  cos = np.sum(exact * approx, axis=1) / (np.linalg.norm(exact, axis=1) * np.linalg.norm(approx, axis=1))
+  rel = np.linalg.norm(exact - approx, axis=1) / np.linalg.norm(exact, axis=1)
+  return {'files': len(exact), 'min_cosine': float(np.min(cos)), 'mean_cosine': float(np.mean(cos)),
+          'max_relative_error': float(np.max(rel)), 'mean_relative_error': float(np.mean(rel))}
+
+
+def format_drift(drift):
+  return ('i-vector drift over %(files)d files: cosine min %(min_cosine).6f mean %(mean_cosine).6f, '
+          'relative error max %(max_relative_error).2e mean %(mean_relative_error).2e' % drift)
+
+
+# -------------------- i-vector --------------------
+
+class IvectorExtractor(object):
+  # calc_ivector.py の extract_ivector をまとめて解く版
+  # 精度行列 L = I + sum_c N_c T_c Σ_c^-1 T_c^T の混合ごとの項は起動時に一度だけ計算しておき、
+  # 発話ごとには N との行列積（重み付き和）と Cholesky 分解だけを行う
+
+  def __init__(self, T, ubm, batch_size=BATCH_SIZE, T_invS=None, TT=None):
+    # T_invS, TT は計算済みのもの（ivector_pool.py が共有メモリに置いたもの）を渡してもよい
+    if np.shape(T)[0] > np.shape(T)[1]:
+      T = T.T
+    self.T = T
+    self.ubm = ubm
+    self.tv_dim = np.shape(T)[0]
+    self.batch_size = batch_size
+    self.triu = np.triu_indices(self.tv_dim)
+
+    if T_invS is None:
+      S = np.reshape(ubm.sigma.T, [ubm.ndim*ubm.nmix, 1])
+      T_invS = T / S.T
+    self.T_invS = T_invS
+
+    # T_c Σ_c^-1 T_c^T は対称なので上三角だけを nmix * (tv_dim (tv_dim+1) / 2) に詰める
+    if TT is None:
+      TT = np.empty([ubm.nmix, len(self.triu[0])])
+      for c in range(ubm.nmix):
+        sv = slice(c*ubm.ndim, (c+1)*ubm.ndim)
+        TT[c] = np.dot(T_invS[:, sv], T[:, sv].T)[self.triu]
+    self.TT = TT
+
+  @classmethod
+  def load(cls, T_matrix, ubm, bundle=None):
+    # UBM.load() で読んだ UBM なら T と派生量もバンドルを mmap する（T か jmodel が変わっていれば作り直す）
+    if getattr(ubm, 'sha1', None) is None:
+      return cls(np.load(T_matrix), ubm)
+
+    def build():
+      extractor = cls(np.load(T_matrix), ubm)
+      return dict((name, getattr(extractor, name)) for name in TV_ARRAYS)
+    arrays = load_bundle(bundle or tv_bundle_path(T_matrix), file_sha1(T_matrix) + ' ' + ubm.sha1, build)
+    return cls(arrays['T'], ubm, T_invS=arrays['T_invS'], TT=arrays['TT'])
+
+  def precision(self, N):
+    # nfiles * nmix の N から nfiles * tv_dim * tv_dim の精度行列 L
+    packed = np.dot(N, self.TT)
+    L = np.empty([len(N), self.tv_dim, self.tv_dim])
+    L[:, self.triu[1], self.triu[0]] = packed
+    L[:, self.triu[0], self.triu[1]] = packed
+    L[:, np.arange(self.tv_dim), np.arange(self.tv_dim)] += 1
+    return L
+
+  def extract_batch(self, N, F):
+    # nfiles * nmix の N と nfiles * (ndim*nmix) の F から nfiles * tv_dim の i-vector
+    N = np.atleast_2d(N)
+    F = np.atleast_2d(F)
+    iv = np.empty([len(N), self.tv_dim])
+    for start in range(0, len(N), self.batch_size):
+      batch = slice(start, start + self.batch_size)
+      B = np.dot(F[batch], self.T_invS.T)
+      iv[batch] = cho_solve(np.linalg.cholesky(self.precision(N[batch])), B)
+    return iv
+
+  def extract(self, N, F):
+    return self.extract_batch(N, F)[0]
+
+
+def solve_lower(G, b, transpose=False):
+  # 下三角 G (nfiles * n * n) について G y = b（transpose なら G^T y = b）をブロックごとに前進・後退代入で解く
+  n = np.shape(G)[-1]
+  y = np.empty_like(b)
+  starts = list(range(0, n, SOLVE_BLOCK))
+  for start in (reversed(starts) if transpose else starts):
+    end = min(start + SOLVE_BLOCK, n)
+    if transpose:
+      block = np.swapaxes(G[:, start:end, start:end], 1, 2)
+      r = b[:, start:end] - np.einsum('bji,bj->bi', G[:, end:, start:end], y[:, end:])
+    else:
+      block = G[:, start:end, start:end]
+      r = b[:, start:end] - np.einsum('bij,bj->bi', G[:, start:end, :start], y[:, :start])
+    # 対角ブロックは三角行列だが、numpy にはバッチで三角行列を解く関数がないので（scipy には依存しない）一般の solve (LU) で解く。
+    # 列ごとの代入を python で回すと 1 ブロックに 0.5 ms 程度かかるが、np.linalg.solve は 0.06 ms 程度で、
+    # 余分な LU 分解を含めても Cholesky 分解（tv_dim = 600 で 9 ms 程度）の 1 割ほど。解は代入と丸め誤差の範囲で一致する。
+    y[:, start:end] = np.linalg.solve(block, r[..., np.newaxis])[..., 0]
+  return y
+
+
+def cho_solve(G, b):
+  # Cholesky 分解 L = G G^T から L x = b を解く
+  return solve_lower(G, solve_lower(G, b), transpose=True)
+
+
+# -------------------- SVM --------------------
+
+class SVM(object):
+  # svm-scale -r と svm-predict（libsvm の c_svc, rbf）をメモリ上で行う
+
+  def __init__(self, modelFilename, scaleFilename):
+    self.read_model(modelFilename)
+    self.read_scale(scaleFilename)
+
+  def read_model(self, modelFilename):
+    header = {}
+    with open(modelFilename) as f:
+      for line in f:
+        line = line.split()
+        if line[0] == 'SV':
+          break
+        header[line[0]] = line[1:]
+      rows = [line.split() for line in f if line.strip()]
+
+    if header['svm_type'][0] != 'c_svc' or header['kernel_type'][0] != 'rbf':
+      raise ValueError('only c_svc with an rbf kernel is supported: ' + modelFilename)
+
+    self.gamma = float(header['gamma'][0])
+    self.nr_class = int(header['nr_class'][0])
+    self.rho = np.array([float(x) for x in header['rho']])
+    self.label = [int(x) for x in header['label']]
+    self.nr_sv = [int(x) for x in header['nr_sv']]
+    self.start = np.r_[0, np.cumsum(self.nr_sv)]
+
+    ncoef = self.nr_class - 1
+    dim = max(int(item.split(':')[0]) for row in rows for item in row[ncoef:])
+    self.sv_coef = np.array([[float(x) for x in row[:ncoef]] for row in rows]).T
+    self.SV = np.zeros([len(rows), dim])
+    for i, row in enumerate(rows):
+      for item in row[ncoef:]:
+        index, value = item.split(':')
+        self.SV[i, int(index) - 1] = float(value)
+    self.SV_norm = np.sum(self.SV**2, axis=1)
+
+  def read_scale(self, scaleFilename):
+    with open(scaleFilename) as f:
+      lines = [line.split() for line in f if line.strip()]
+    if lines[0] != ['x']:
+      raise ValueError('y scaling is not supported: ' + scaleFilename)
+
+    self.lower, self.upper = float(lines[1][0]), float(lines[1][1])
+
+    # 末尾の次元がすべて 0 だと SV には出てこないので、次元数は多い方に合わせる
+    dim = max(np.shape(self.SV)[1], max(int(line[0]) for line in lines[2:]))
+    self.SV = np.c_[self.SV, np.zeros([np.shape(self.SV)[0], dim - np.shape(self.SV)[1]])]
+    self.feature_min = np.zeros(dim)
+    self.feature_max = np.zeros(dim)
+    for index, fmin, fmax in lines[2:]:
+      self.feature_min[int(index) - 1] = float(fmin)
+      self.feature_max[int(index) - 1] = float(fmax)
+
+  def scale(self, x):
+    # svm-scale と同じ（min == max の次元は出力されない = 0）
+    x = np.asarray(x, dtype=float)
+    span = self.feature_max - self.feature_min
+    with np.errstate(divide='ignore', invalid='ignore'):
+      y = self.lower + (self.upper - self.lower) * (x - self.feature_min) / span
+    y[x == self.feature_min] = self.lower
+    y[x == self.feature_max] = self.upper
+    y[span == 0] = 0
+    return y
+
+  def predict(self, x):
+    # one-vs-one の多数決（svm-predict と同じく同数なら先のラベル）
+    return self.label[int(np.argmax(self.votes(x)))]
+
+  def decision_values(self, x):
+    # one-vs-one の決定値（libsvm の svm_predict_values と同じ (0,1), (0,2), ..., (1,2), ... の順）
+    x = self.scale(x)
+    kvalue = np.exp(-self.gamma * (self.SV_norm - 2 * np.dot(self.SV, x) + np.dot(x, x)))
+
+    dec_values = np.zeros(len(self.rho))
+    p = 0
+    for i in range(self.nr_class):
+      for j in range(i + 1, self.nr_class):
+        si, sj = self.start[i], self.start[j]
+        ei, ej = self.start[i + 1], self.start[j + 1]
+        s = np.dot(self.sv_coef[j - 1, si:ei], kvalue[si:ei]) + np.dot(self.sv_coef[i, sj:ej], kvalue[sj:ej])
+        dec_values[p] = s - self.rho[p]
+        p += 1
+    return dec_values
+
+  def votes(self, x):
+    # クラスごとの one-vs-one の勝ち数（ラベルの順）
+    dec_values = self.decision_values(x)
+    vote = np.zeros(self.nr_class, dtype=int)
+    p = 0
+    for i in range(self.nr_class):
+      for j in range(i + 1, self.nr_class):
+        if dec_values[p] > 0:
+          vote[i] += 1
+        else:
+          vote[j] += 1
+        p += 1
+    return vote
+
+
+# -------------------- 話者識別 --------------------
+
+class SpeakerIdentifier(object):
+  # UBM, T 行列, SVM を一度だけ読んで、発話ごとの話者番号をメモリ上で返す
+
+  def __init__(self, ubm=UBMfile, T_matrix=TVmatrix, model=SVMmodel, scale=SVMscale, use_hcopy=False,
+               top=0, clusters=0):
+    # top > 0 なら統計量を GaussianSelection で近似する
+    self.ubm = UBM.load(ubm)
+    self.extractor = IvectorExtractor.load(T_matrix, self.ubm)
+    self.svm = SVM(model, scale)
+    self.use_hcopy = use_hcopy
+    # serve したとき、問い合わせてきた側のモデルと同じファイルか確かめるためのパス
+    self.models = dict(ubm=ubm, tvmatrix=T_matrix, model=model, scale=scale)
+    self.stats = GaussianSelection(self.ubm, top, clusters) if top > 0 else self.ubm
+
+  def ivector(self, mfcc):
+    # CMN した nframes * 26 の MFCC_E_D から i-vector（エネルギーは無視）
+    N, F = self.stats.bw_stats_frames(mfcc)
+    return self.extractor.extract(N, F)
+
+  def identify_frames(self, mfcc):
+    # HCopy (または frontend.py) で計算した nframes * 26 の MFCC_E_D (CMN 前) から話者番号
+    return self.svm.predict(self.ivector(global_cmn(mfcc)))
+
+  def identify_samples(self, samples):
+    # メモリ上の 16 kHz の音声 (int16) から話者番号
+    return self.identify_frames(frontend.frontend.compute(samples))
+
+  def identify(self, filename):
+    # wav または MFCC_E_D ファイルから話者番号
+    return self.svm.predict(self.ivector(load_features(filename, self.use_hcopy)))
+
+
+Decision = collections.namedtuple('Decision', ['label', 'confidence', 'nframes', 'final'])
+
+
+class OnlineIdentifier(object):
+  # マイクから届く音声（または MFCC）を少しずつ受け取って Baum-Welch 統計量を足し込み、いつでも暫定の話者番号を返す
+  # 統計量はフレームについての和なので、途中まで足した N, F から解いた i-vector は、そこまでの発話全体から解いたものと同じ。
+  # 発話全体の平均はわからないので CMN は OnlineCMN（直前 window フレームの平均）で行う。
+  #
+  # update フレームごとに i-vector を解き直して SVM にかけ、min_frames 以上たってから
+  # 同じ話者が stable 回続けて one-vs-one で全勝したら確定する（final）。確定したら、それ以降のフレームは無視する。
+
+  def __init__(self, identifier, update=UPDATE_FRAMES, min_frames=MIN_FRAMES, stable=STABLE_UPDATES, window=CMN_WINDOW):
+    self.identifier = identifier
+    self.update = update
+    self.min_frames = min_frames
+    self.stable = stable
+    self.window = window
+    self.stream = frontend.FrontendStream()
+    self.reset()
+
+  def reset(self):
+    # 次の発話のために統計量を捨てる
+    ubm = self.identifier.ubm
+    self.stream.reset()
+    self.cmn = OnlineCMN(self.window)
+    self.N = np.zeros(ubm.nmix)
+    self.F = np.zeros(ubm.ndim * ubm.nmix)
+    self.nframes = 0
+    self.next_update = self.update
+    self.history = []
+    self.decision = None
+
+  @property
+  def final(self):
+    return self.decision is not None and self.decision.final
+
+  def feed(self, samples):
+    # 16 kHz の音声 (int16 の配列か 16 bit の bytes) を足し込み、暫定の判定を出し直したらそれを返す（なければ None）
+    return self.feed_frames(self.stream.feed(samples))
+
+  def feed_frames(self, mfcc):
+    # CMN 前の nframes * 26 の MFCC_E_D を足し込む
+    if self.final or len(mfcc) == 0:
+      return None
+    return self.accumulate(self.cmn.process(mfcc))
+
+  def accumulate(self, mfcc):
+    # CMN 済みの nframes * 26 の MFCC_E_D を update フレームずつ足し込み、最後に出し直した判定を返す
+    decision = None
+    start = 0
+    while start < len(mfcc) and not self.final:
+      end = min(len(mfcc), start + self.next_update - self.nframes)
+      N, F = self.identifier.stats.bw_stats_frames(mfcc[start:end])
+      self.N += N
+      self.F += F
+      self.nframes += end - start
+      start = end
+      if self.nframes >= self.next_update:
+        self.next_update += self.update
+        decision = self.decide()
+    return decision
+
+  def ivector(self):
+    # ここまでの統計量から解いた暫定の i-vector
+    return self.identifier.extractor.extract(self.N, self.F)
+
+  def decide(self, end=False):
+    # 暫定の話者番号と確信度（one-vs-one で勝った割合）
+    svm = self.identifier.svm
+    vote = svm.votes(self.ivector())
+    best = int(np.argmax(vote))
+    confidence = float(vote[best]) / max(svm.nr_class - 1, 1)
+    label = svm.label[best]
+
+    self.history.append((label, confidence))
+    recent = self.history[-self.stable:]
+    confident = (self.nframes >= self.min_frames and len(recent) == self.stable and
+                 all(l == label and c == 1.0 for l, c in recent))
+    self.decision = Decision(label, confidence, self.nframes, confident or end)
+    return self.decision
+
+  def finish(self):
+    # 発話の終わり: 残りのフレームを足し込んで最終的な判定を返す
+    if not self.final:
+      mfcc = self.stream.flush()
+      if len(mfcc):
+        self.accumulate(self.cmn.process(mfcc))
+    if not self.final:
+      if self.nframes == 0:
+        return None
+      self.decide(end=True)
+    return self.decision
+
+
+class SpeakerIdHandler(socketserver.StreamRequestHandler):
+  # 1 行に 1 つのファイルパスを受け取り、1 行で話者番号（失敗したら ERROR ...）を返す
+  # USE {"model": パス, ...} の行には、読み込んだモデルと同じファイルなら OK、違えば ERROR を返す
+
+  def handle(self):
+    for line in self.rfile:
+      line = line.decode('utf-8').strip()
+      if not line:
+        continue
+      try:
+        if line.startswith('USE '):
+          reply = self.use(json.loads(line[len('USE '):]))
+        else:
+          reply = str(self.server.identifier.identify(line))
+      except Exception as e:
+        reply = 'ERROR ' + str(e).replace('\n', ' ')
+      self.wfile.write((reply + '\n').encode('utf-8'))
+      self.wfile.flush()
+
+  def use(self, models):
+    # 知らない名前も違うモデルとみなす
+    serving = self.server.identifier.models
+    for name in sorted(models):
+      if name not in serving or os.path.realpath(models[name]) != os.path.realpath(serving[name]):
+        return 'ERROR different models: %s %s (serving %s)' % (name, models[name], serving.get(name))
+    return 'OK'
+
+
+class SpeakerIdServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+  allow_reuse_address = True
+  daemon_threads = True
+
+  def __init__(self, address, identifier):
+    socketserver.TCPServer.__init__(self, address, SpeakerIdHandler)
+    self.identifier = identifier
+
+
+def query(filenames, host='localhost', port=DEFAULT_PORT, models=None):
+  # 常駐サービスに問い合わせる（起動していなければ None）
+  # models（ubm, tvmatrix, model, scale のパス）を渡すと、常駐サービスが別のモデルを読んでいれば警告して None
+  try:
+    sock = socket.create_connection((host, port), timeout=60)
+  except OSError:
+    return None
+  with sock, sock.makefile('rwb') as f:
+    if models is not None:
+      models = dict((name, os.path.abspath(path)) for name, path in models.items())
+      f.write(('USE ' + json.dumps(models, sort_keys=True) + '\n').encode('utf-8'))
+      f.flush()
+      reply = f.readline().decode('utf-8').strip()
+      if reply != 'OK':
+        print('Warning: the server at %s:%d does not use the requested models, identifying here: %s'
+              % (host, port, reply), file=sys.stderr)
+        return None
+    results = []
+    for filename in filenames:
+      f.write((os.path.abspath(filename) + '\n').encode('utf-8'))
+      f.flush()
+      reply = f.readline().decode('utf-8').strip()
+      if reply.startswith('ERROR') or not reply:
+        raise RuntimeError(filename + ': ' + reply)
+      results.append(int(reply))
+    return results
+
+
+def stream(identifier, wav=None):
+  # 音声を STREAM_CHUNK サンプルずつ OnlineIdentifier に渡し、判定が出るたびに「話者番号 確信度 フレーム数」を出力する
+  online = OnlineIdentifier(identifier)
+  if wav is None:
+    read = lambda: sys.stdin.buffer.read(STREAM_CHUNK * 2)
+  else:
+    samples = frontend.read_wav(wav)
+    chunks = iter(range(0, len(samples), STREAM_CHUNK))
+    read = lambda: samples[next(chunks, len(samples)):][:STREAM_CHUNK]
+
+  def report(decision):
+    print('%d %.2f %d%s' % (decision.label, decision.confidence, decision.nframes, ' final' if decision.final else ''))
+    sys.stdout.flush()
+
+  while not online.final:
+    data = read()
+    if len(data) == 0:
+      break
+    decision = online.feed(data)
+    if decision is not None:
+      report(decision)
+  if not online.final:
+    decision = online.finish()
+    if decision is not None:
+      report(decision)
+
+
+# -------------------- ここから main --------------------
+def main():
+  usage="""usage: %prog identify|serve|query|compile [options] [wav or mfcc files]
+       %prog stream [options] [wav]"""
+  parser = optparse.OptionParser(usage=usage)
+  parser.add_option('--ubm', default=UBMfile)
+  parser.add_option('--tvmatrix', default=TVmatrix)
+  parser.add_option('--model', default=SVMmodel)
+  parser.add_option('--scale', default=SVMscale)
+  parser.add_option('--host', default='localhost')
+  parser.add_option('--port', type='int', default=DEFAULT_PORT)
+  parser.add_option('--hcopy', action='store_true', default=False,
+                    help='compute the MFCC of wav files with HCopy instead of frontend.py')
+  parser.add_option('--top', type='int', default=0,
+                    help='keep only the N best UBM mixtures per frame, in float32 (0: exact)')
+  parser.add_option('--clusters', type='int', default=0,
+                    help='with --top, preselect mixtures through a UBM clustered to N components')
+  options, args = parser.parse_args()
+
+  if len(args) < 1 or args[0] not in ('identify', 'serve', 'query', 'compile', 'stream'):
+    print("Error: wrong argument", file=sys.stderr)
+    parser.print_help()
+    exit(1)
+  command, filenames = args[0], args[1:]
+
+  if command == 'compile':
+    # UBM のバンドルを作り直す
+    compile_ubm(options.ubm)
+    print(ubm_bundle_path(options.ubm))
+    return
+
+  if command == 'query':
+    results = query(filenames, options.host, options.port,
+                    dict(ubm=options.ubm, tvmatrix=options.tvmatrix, model=options.model, scale=options.scale))
+    if results is not None:
+      for result in results:
+        print(result)
+      return
+    command = 'identify'
+
+  identifier = SpeakerIdentifier(options.ubm, options.tvmatrix, options.model, options.scale, options.hcopy,
+                                 options.top, options.clusters)
+
+  if command == 'identify':
+    for filename in filenames:
+      print(identifier.identify(filename))
+  elif command == 'stream':
+    stream(identifier, filenames[0] if filenames else None)
+  else:
+    server = SpeakerIdServer((options.host, options.port), identifier)
+    print('speaker id server: %s:%d' % (options.host, options.port), file=sys.stderr)
+    try:
+      server.serve_forever()
+    except KeyboardInterrupt:
+      pass
+    finally:
+      server.server_close()
+
+
+if __name__ == '__main__':
+  main()
@@ -46,14 +46,14 @@ cut -f 1 $cutwavspklist | while read wav; do
     fi
 
     segid=$(basename $wav .wav)
-    mfcctempfile=${bin_path}/mfcc/${segid}_tmp.mfcc
     mfccfile=${bin_path}/mfcc/${segid}.mfcc
-    $HCopybin -T 1 -C $HCopyConf $wav $mfcctempfile
-    python3 $global_cmn $mfcctempfile $mfccfile
-    rm -f $mfcctempfile
+    $HCopybin -T 1 -C $HCopyConf $wav $mfccfile
     echo $mfccfile >> ${bin_path}/tmp/mfcc.txt
 done
 
+# global CMN（全ファイルを一つのプロセスでその場で書き換える）
+python3 $global_cmn -l ${bin_path}/tmp/mfcc.txt --in-place
+
 paste ${bin_path}/tmp/mfcc.txt ${bin_path}/tmp/speaker.txt > ${bin_path}/tmp/mfcclist.txt
 
 
@@ -19,7 +19,6 @@ HCopyConf=${bin_path}/config/config.HCopy
 global_cmn=${bin_path}/bin/global_cmn.py
 #makeGMMbin=${bin_path}/bin/makeGMM.sh
 #extractSVbin=${bin_path}/bin/extract_svs
-extract_mu_sigma_w=${bin_path}/bin/extract_mu_sigma_w
 calc_ivector=${bin_path}/bin/calc_ivector.py
 UBM=${bin_path}/UBM/jmodel
 TVmatrix=${bin_path}/tvmatrix/tvmatrix_it3.npy
@@ -41,11 +40,8 @@ cut -f 1 $cutwavspklist | while read wav; do
     fi
 
     segid=$(basename $wav .wav)
-    mfcctempfile=${bin_path}/mfcc/${segid}_tmp.mfcc
     mfccfile=${bin_path}/mfcc/${segid}.mfcc
-    $HCopybin -T 1 -C $HCopyConf $wav $mfcctempfile
-    python3 $global_cmn $mfcctempfile $mfccfile
-    rm -f $mfcctempfile
+    $HCopybin -T 1 -C $HCopyConf $wav $mfccfile
     echo $mfccfile >> ${bin_path}/tmp/mfcc.txt
 done
 
@@ -68,16 +64,16 @@ paste -d ' ' ${bin_path}/tmp/speaker.txt ${bin_path}/tmp/train_tmp.dat > ${bin_p
 #__COMMENT__
 
 
-# i-vector の計算
-mu_ubm=${bin_path}/tmp/mu_ubm.txt
-sigma_ubm=${bin_path}/tmp/sigma_ubm.txt
-w_ubm=${bin_path}/tmp/w_ubm.txt
+# global CMN をかけながら、MFCC を一つのアーカイブ tmp/mfcc.ark（索引 tmp/mfcc.scp）にまとめる
+# （全ファイルを一つのプロセスで処理する。./mfcc の下は HCopy の出力のまま）
+python3 $global_cmn -l ${bin_path}/tmp/mfcc.txt ${bin_path}/tmp/mfcc.ark ${bin_path}/tmp/mfcc.scp
 
-$extract_mu_sigma_w $UBM $mu_ubm $sigma_ubm $w_ubm
-python ${calc_ivector} ${bin_path}/tmp/mfcc.txt $mu_ubm $sigma_ubm $w_ubm $TVmatrix > ${bin_path}/tmp/train_tmp.dat
+# i-vector の計算（UBM は jmodel から作ったバンドル UBM/jmodel.bundle を mmap して使う）
+python3 ${calc_ivector} -j 0 ${bin_path}/tmp/mfcc.scp $UBM $TVmatrix > ${bin_path}/tmp/train_tmp.dat
 paste -d ' ' ${bin_path}/tmp/speaker.txt ${bin_path}/tmp/train_tmp.dat > ${bin_path}/tmp/train.dat
 
 rm -f ${bin_path}/tmp/gmmlist.txt ${bin_path}/tmp/speaker.txt ${bin_path}/tmp/gmmlist.txt ${bin_path}/tmp/svs_bin ${bin_path}/tmp/train_tmp.dat
+rm -f ${bin_path}/tmp/mfcc.ark ${bin_path}/tmp/mfcc.scp
 
 
 # SVM を学習
@@ -0,0 +1,84 @@
+from collections import OrderedDict
+
+import pygame
+
+# alpha levels precomputed per sprite (0 and 255 included)
+default_fade_steps = 32
+
+# sprites whose fade frames are kept
+default_max_sprites = 8
+
+# animation lengths [ms]
+send_out_duration = 1000
+faint_duration = 1000
+evolution_duration = 1000
+flicker_duration = 2000
+
+
+class FadeFrames():
+    """
+    Alpha-blended copies of sprites, computed once per sprite.
+
+    frame(surface, alpha) returns the precomputed copy closest to `alpha`, so a
+    fade costs `steps` surface copies the first time a sprite fades and none
+    afterwards. The frames of the least recently faded sprites are dropped once
+    more than `max_sprites` are kept.
+    """
+
+    def __init__(self, steps=default_fade_steps, max_sprites=default_max_sprites):
+
+        self.steps = steps
+        self.max_sprites = max_sprites
+
+        # id(surface) -> (surface, frames), the surface is kept so its id stays unique
+        self.sprites = OrderedDict()
+
+    def frames(self, surface):
+
+        key = id(surface)
+        if key in self.sprites:
+            self.sprites.move_to_end(key)
+            return self.sprites[key][1]
+
+        frames = []
+        for i in range(self.steps):
+            alpha = round(255 * i / (self.steps - 1))
+            frame = surface.copy()
+            frame.fill((255, 255, 255, alpha), None, pygame.BLEND_RGBA_MULT)
+            frames.append(frame)
+
+        self.sprites[key] = (surface, frames)
+        while len(self.sprites) > self.max_sprites:
+            self.sprites.popitem(last=False)
+        return frames
+
+    def frame(self, surface, alpha):
+
+        if alpha >= 255:
+            return surface
+
+        frames = self.frames(surface)
+        return frames[round(max(alpha, 0) / 255 * (self.steps - 1))]
+
+
+def animate(renderer, duration, draw_frame):
+    """
+    Call draw_frame(progress) once per frame with progress going from 0 to 1
+    over `duration` milliseconds of the renderer's clock, presenting each frame.
+    """
+
+    elapsed = 0
+    while True:
+        progress = min(elapsed / duration, 1)
+        draw_frame(progress)
+        renderer.present()
+        if progress >= 1:
+            return
+
+        # keep the window responsive, the events stay queued for the game loop
+        pygame.event.pump()
+        elapsed += renderer.tick() * renderer.clock.step
+
+
+# fade frames shared by every pokemon
+fade_frames = FadeFrames()
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# where the cache lives and how it behaves (can be overridden with environment variables)
+default_cache_path = os.environ.get(
+    'POKEMON_DIALOGUE_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'pokemon-dialogue', 'pokeapi.sqlite3'))
+default_ttl = 30 * 24 * 60 * 60  # 30 days
+default_max_bytes = 64 * 1024 * 1024  # 64 MB of compressed payloads
+default_offline = os.environ.get('POKEMON_DIALOGUE_OFFLINE', '') not in ('', '0', 'false', 'False')
+default_max_workers = 8  # parallel downloads in get_many_json
+
+
+class OfflineCacheMiss(LookupError):
+    """ Raised when a resource is needed but the cache is offline and does not have it """
+
+
+class ApiCache():
+    """
+    Content-addressed on-disk cache for PokeAPI responses and sprite images.
+
+    Each url points to the sha256 digest of its payload, and payloads are stored
+    zlib-compressed once per digest. Entries older than `ttl` seconds are fetched
+    again when online, and the least recently used payloads are evicted once the
+    total compressed size exceeds `max_bytes`. In offline mode nothing is ever
+    downloaded; stale entries are still served and a miss raises OfflineCacheMiss.
+    """
+
+    def __init__(self, path=default_cache_path, ttl=default_ttl, max_bytes=default_max_bytes,
+                 offline=default_offline, max_workers=default_max_workers):
+
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.max_workers = max_workers
+
+        # one pooled session so parallel downloads reuse their keep-alive connections
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # number of requests answered from disk / from the network
+        self.hits = 0
+        self.misses = 0
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        # the connection is shared between threads, so every access goes through the lock
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute('''CREATE TABLE IF NOT EXISTS urls (
+                                 url TEXT PRIMARY KEY,
+                                 digest TEXT NOT NULL,
+                                 fetched_at REAL NOT NULL)''')
+            self.db.execute('''CREATE TABLE IF NOT EXISTS blobs (
+                                 digest TEXT PRIMARY KEY,
+                                 body BLOB NOT NULL,
+                                 size INTEGER NOT NULL,
+                                 accessed_at REAL NOT NULL)''')
+            self.db.execute('CREATE INDEX IF NOT EXISTS urls_digest ON urls (digest)')
+
+    def lookup(self, url):
+        """ Return (payload, is_fresh) for a cached url, or (None, False) """
+
+        with self.lock:
+            row = self.db.execute('''SELECT blobs.digest, blobs.body, urls.fetched_at
+                                     FROM urls JOIN blobs ON urls.digest = blobs.digest
+                                     WHERE urls.url = ?''', (url,)).fetchone()
+            if row is None:
+                return None, False
+
+            digest, body, fetched_at = row
+            with self.db:
+                self.db.execute('UPDATE blobs SET accessed_at = ? WHERE digest = ?', (time.time(), digest))
+
+        is_fresh = self.ttl is None or time.time() - fetched_at < self.ttl
+        return zlib.decompress(body), is_fresh
+
+    def store(self, url, payload):
+
+        digest = hashlib.sha256(payload).hexdigest()
+        body = zlib.compress(payload, 9)
+        now = time.time()
+
+        with self.lock, self.db:
+            self.db.execute('''INSERT OR IGNORE INTO blobs (digest, body, size, accessed_at)
+                               VALUES (?, ?, ?, ?)''', (digest, body, len(body), now))
+            self.db.execute('UPDATE blobs SET accessed_at = ? WHERE digest = ?', (now, digest))
+            self.db.execute('INSERT OR REPLACE INTO urls (url, digest, fetched_at) VALUES (?, ?, ?)',
+                            (url, digest, now))
+            self.evict()
+
+    def evict(self):
+        """ Drop the least recently used payloads until the cache fits in max_bytes (call with the lock held) """
+
+        if self.max_bytes is None:
+            return
+
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for digest, size in self.db.execute('SELECT digest, size FROM blobs ORDER BY accessed_at').fetchall():
+            self.db.execute('DELETE FROM urls WHERE digest = ?', (digest,))
+            self.db.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def download(self, url):
+
+        req = self.session.get(url)
+        req.raise_for_status()
+        return req.content
+
+    def get_bytes(self, url):
+
+        payload, is_fresh = self.lookup(url)
+        if payload is not None and (is_fresh or self.offline):
+            self.hits += 1
+            return payload
+
+        if self.offline:
+            raise OfflineCacheMiss(f'{url} is not in the cache and offline mode is on')
+
+        try:
+            fresh_payload = self.download(url)
+        except requests.RequestException:
+            # fall back to the stale copy if the network is gone
+            if payload is not None:
+                self.hits += 1
+                return payload
+            raise
+
+        self.misses += 1
+        self.store(url, fresh_payload)
+        return fresh_payload
+
+    def get_json(self, url):
+
+        return json.loads(self.get_bytes(url))
+
+    def get_many_json(self, urls):
+        """ Resolve several urls in parallel, returning {url: json} with duplicates fetched only once """
+
+        unique_urls = list(dict.fromkeys(urls))
+        if len(unique_urls) <= 1:
+            return {url: self.get_json(url) for url in unique_urls}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            payloads = list(pool.map(self.get_json, unique_urls))
+
+        return dict(zip(unique_urls, payloads))
+
+    def clear(self):
+
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM urls')
+            self.db.execute('DELETE FROM blobs')
+
+    def close(self):
+
+        self.session.close()
+        with self.lock:
+            self.db.close()
+
+
+class LazyApiCache():
+    """
+    Stand-in for an ApiCache that is only opened on first use.
+
+    Importing a module that shares the cache should not create the cache
+    directory or open the SQLite database (eg. the simulator reading a
+    snapshot, or the tests); the first attribute access does both, once.
+    """
+
+    def __init__(self, **kwargs):
+
+        self.kwargs = kwargs
+        self.instance = None
+        self.instance_lock = threading.Lock()
+
+    def get(self):
+
+        # several download threads may be the first users at the same time
+        with self.instance_lock:
+            if self.instance is None:
+                self.instance = ApiCache(**self.kwargs)
+            return self.instance
+
+    def __getattr__(self, name):
+
+        # only called for what the stand-in itself does not have (copy/pickle probe dunders first)
+        if name.startswith('__') or name in ('kwargs', 'instance', 'instance_lock'):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+
+# cache shared by the whole game, opened the first time it is used
+api_cache = LazyApiCache()
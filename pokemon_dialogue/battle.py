@@ -0,0 +1,408 @@
+import argparse
+import copy
+import math
+import multiprocessing
+import os
+import random
+import time
+from collections import namedtuple
+
+from pokemon_dialogue.records import records
+
+# base url of the API (eg. a local stand-in from pokeapi_local.py)
+base_url = os.environ.get('POKEMON_DIALOGUE_API', 'https://pokeapi.co/api/v2')
+
+# critical hits: randint(1, crit_range) <= crit_threshold
+crit_threshold = 625
+crit_range = 5000
+
+# the rival's level is lowered to make the battle easier
+rival_handicap = .75
+
+# hp healed by one potion
+potion_hp = 30
+
+# kind is 'attack', 'potion', 'no potion', 'evolve' or 'faint'
+BattleEvent = namedtuple('BattleEvent', ['kind', 'actor', 'target', 'move', 'damage', 'critical'],
+                         defaults=[None, None, 0, False])
+
+
+class Combatant():
+    """ The battle side of a pokemon: stats, hp, potions and moves, without anything to draw """
+
+    def __init__(self, name, level, species=None, source=None, api_url=None):
+
+        # the species record is parsed once per url and shared by every combatant (see records.py)
+        # source is anything with get_json/get_many_json/get_bytes, eg. a SnapshotResolver
+        if species is None:
+            species = records.species(f'{api_url or base_url}/pokemon/{name.lower()}', source)
+        self.species = species
+
+        # set the pokemon's name and level
+        self.name = name
+        self.level = level
+
+        # number of potions left
+        self.num_potions = 3
+
+        # stats and types of the species
+        self.current_hp = species.hp + self.level
+        self.max_hp = species.hp + self.level
+        self.attack = species.attack
+        self.defense = species.defense
+        self.speed = species.speed
+        self.types = list(species.types)
+
+        self.move_pool = []
+        self.moves = []
+
+    def take_damage(self, damage):
+
+        self.current_hp -= damage
+
+        # hp should not go below 0
+        if self.current_hp < 0:
+            self.current_hp = 0
+
+    def use_potion(self):
+
+        # check if there are potions left
+        if self.num_potions > 0:
+
+            # add 30 hp (but don't go over the max hp)
+            self.current_hp += potion_hp
+            if self.current_hp > self.max_hp:
+                self.current_hp = self.max_hp
+
+            # decrease the number of potions left
+            self.num_potions -= 1
+
+    def learnable_move_urls(self):
+
+        # red-blue level-up moves up to the pokemon's level
+        return self.species.learnable_move_urls(self.level)
+
+    def set_moves(self, moves=None, rng=random, source=None):
+
+        self.move_pool = []
+
+        # parse every candidate move once (unless resolve_moves already did)
+        urls = self.learnable_move_urls()
+        if moves is None:
+            moves = records.moves(urls, source)
+
+        for url in urls:
+            move = moves[url]
+
+            # only include attack moves
+            if move.power is not None:
+                self.move_pool.append(move)
+
+        self.choose_moves(rng)
+
+    def choose_moves(self, rng=random):
+
+        # select up to 4 random moves
+        self.moves = list(self.move_pool)
+        if len(self.moves) > 4:
+            self.moves = rng.sample(self.moves, 4)
+
+    def reset(self, rng=random):
+
+        # full hp, full potions and a new set of moves for another battle
+        self.current_hp = self.max_hp
+        self.num_potions = 3
+        self.choose_moves(rng)
+
+
+def resolve_moves(*pokemons, source=None):
+
+    # fetch the moves of all the pokemons in one parallel batch (moves they share are fetched once)
+    urls = []
+    for pokemon in pokemons:
+        urls.extend(pokemon.learnable_move_urls())
+    moves = records.moves(urls, source)
+
+    for pokemon in pokemons:
+        pokemon.set_moves(moves)
+
+
+def calc_damage(attacker, defender, move, rng=random):
+    """ Return (damage, is_critical) of one attack """
+
+    # calculate the damage
+    damage = (2 * attacker.level + 10) / 250 * attacker.attack / defender.defense * move.power
+
+    # same type attack bonus (STAB)
+    if move.type in attacker.types:
+        damage *= 1.5
+
+    # critical hit (625 / 5000 chance)
+    is_critical = rng.randint(1, crit_range) <= crit_threshold
+    if is_critical:
+        damage *= 1.5
+
+    # round down the damage
+    return math.floor(damage), is_critical
+
+
+class Battle():
+    """
+    Headless battle between the player's and the rival's pokemon.
+
+    Every call to step() plays the turn of whoever moves next and returns the
+    BattleEvents it produced. The player's turn needs an action, ('attack', i)
+    with the index of one of player.moves or ('potion',); the rival always
+    attacks with a random move. `evolutions` maps a pokemon name to a callable
+    that receives the fainted pokemon and the battle's rng and returns its
+    evolution, which then takes over the player's side (ヒトカゲ → リザードン
+    in the game).
+    """
+
+    def __init__(self, player, rival, seed=None, rng=None, evolutions=None):
+
+        self.player = player
+        self.rival = rival
+        self.rng = rng if rng is not None else random.Random(seed)
+        self.evolutions = evolutions if evolutions is not None else {}
+
+        self.turns = 0
+        self.winner = None
+        self.evolved = False
+
+        # determine who goes first
+        if rival.speed > player.speed:
+            self.turn = 'rival'
+        else:
+            self.turn = 'player'
+
+    def attack(self, attacker, defender, move):
+
+        damage, is_critical = calc_damage(attacker, defender, move, self.rng)
+        defender.take_damage(damage)
+        return BattleEvent('attack', attacker, defender, move, damage, is_critical)
+
+    def step(self, action=None):
+
+        if self.winner is not None:
+            raise ValueError('the battle is already over')
+
+        if self.turn == 'player':
+            if action is None:
+                raise ValueError("the player's turn needs an action")
+            actor, target = self.player, self.rival
+        else:
+            # the rival selects a random move
+            action = ('attack', self.rng.randrange(len(self.rival.moves)))
+            actor, target = self.rival, self.player
+
+        if action[0] == 'potion':
+            if actor.num_potions == 0:
+                # nothing happens and it is still the same turn
+                return [BattleEvent('no potion', actor)]
+            actor.use_potion()
+            events = [BattleEvent('potion', actor)]
+        elif action[0] == 'attack':
+            events = [self.attack(actor, target, actor.moves[action[1]])]
+        else:
+            raise ValueError(f'unknown action {action!r}')
+
+        self.turns += 1
+        self.turn = 'rival' if self.turn == 'player' else 'player'
+        events.extend(self.check_fainted())
+        return events
+
+    def check_fainted(self):
+
+        player, rival = self.player, self.rival
+
+        # the player's pokemon may evolve instead of fainting (only once per battle)
+        if player.current_hp == 0 and player.name in self.evolutions and not self.evolved:
+            self.player = self.evolutions[player.name](player, self.rng)
+            self.evolved = True
+            self.turn = 'player'
+            return [BattleEvent('evolve', player, self.player)]
+
+        if player.current_hp == 0:
+            self.winner = 'rival'
+            return [BattleEvent('faint', player)]
+
+        if rival.current_hp == 0:
+            self.winner = 'player'
+            return [BattleEvent('faint', rival)]
+
+        return []
+
+
+# ------------------------- batch simulation -------------------------
+
+def simple_policy(battle):
+    """ Player model for simulations: heal below a third of max hp while potions last, else attack at random """
+
+    player = battle.player
+    if player.current_hp < player.max_hp / 3 and player.num_potions > 0:
+        return ('potion',)
+    return ('attack', battle.rng.randrange(len(player.moves)))
+
+
+class Evolution():
+    """ Picklable evolution callback that copies a prepared template (eg. level 99 Charizard with 1 hp) """
+
+    def __init__(self, template, current_hp=1):
+
+        self.template = template
+        self.current_hp = current_hp
+
+    def __call__(self, pokemon, rng):
+
+        evolved = copy.copy(self.template)
+        evolved.choose_moves(rng)
+        evolved.current_hp = self.current_hp
+        return evolved
+
+
+class BattleStats():
+
+    def __init__(self, battles=0, player_wins=0, turns=0, evolutions=0):
+
+        self.battles = battles
+        self.player_wins = player_wins
+        self.turns = turns
+        self.evolutions = evolutions
+
+    def add(self, other):
+
+        self.battles += other.battles
+        self.player_wins += other.player_wins
+        self.turns += other.turns
+        self.evolutions += other.evolutions
+
+    @property
+    def win_rate(self):
+
+        return self.player_wins / self.battles if self.battles else 0.0
+
+    @property
+    def average_turns(self):
+
+        return self.turns / self.battles if self.battles else 0.0
+
+    def __repr__(self):
+
+        return (f'BattleStats(battles={self.battles}, win_rate={self.win_rate:.4f}, '
+                f'average_turns={self.average_turns:.2f}, evolutions={self.evolutions})')
+
+
+def run_battles(player_template, rival_template, n, seed, evolutions=None, max_turns=1000):
+
+    rng = random.Random(seed)
+    stats = BattleStats()
+
+    for _ in range(n):
+        player = copy.copy(player_template)
+        rival = copy.copy(rival_template)
+        player.reset(rng)
+        rival.reset(rng)
+
+        battle = Battle(player, rival, rng=rng, evolutions=evolutions)
+        while battle.winner is None and battle.turns < max_turns:
+            if battle.turn == 'player':
+                battle.step(simple_policy(battle))
+            else:
+                battle.step()
+
+        stats.battles += 1
+        stats.turns += battle.turns
+        stats.evolutions += battle.evolved
+        if battle.winner == 'player':
+            stats.player_wins += 1
+
+    return stats
+
+
+def run_battles_chunk(args):
+
+    return run_battles(*args)
+
+
+def load_matchup(player_name, rival_name, level=30, handicap=rival_handicap, source=None):
+    """ Build the player/rival templates (and Charmander's evolution) from the api cache or `source` """
+
+    player = Combatant(player_name, level, source=source)
+    rival = Combatant(rival_name, level, source=source)
+
+    # lower the rival pokemon's level after its hp was set, like the game does
+    rival.level = int(rival.level * handicap)
+    resolve_moves(player, rival, source=source)
+
+    evolutions = {}
+    if player_name == 'Charmander':
+        charizard = Combatant('Charizard', 99, source=source)
+        charizard.set_moves(source=source)
+        evolutions['Charmander'] = Evolution(charizard)
+
+    return player, rival, evolutions
+
+
+def simulate(player_name, rival_name, battles, processes=None, seed=0, level=30, handicap=rival_handicap,
+             source=None):
+    """ Run `battles` battles across a process pool and return the combined BattleStats """
+
+    player, rival, evolutions = load_matchup(player_name, rival_name, level, handicap, source)
+
+    processes = processes or multiprocessing.cpu_count()
+    chunks = processes * 4
+    sizes = [battles // chunks + (1 if i < battles % chunks else 0) for i in range(chunks)]
+    jobs = [(player, rival, size, f'{seed}-{i}', evolutions) for i, size in enumerate(sizes) if size > 0]
+
+    stats = BattleStats()
+    if processes == 1:
+        for job in jobs:
+            stats.add(run_battles_chunk(job))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            for chunk_stats in pool.imap_unordered(run_battles_chunk, jobs):
+                stats.add(chunk_stats)
+
+    return stats
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Simulate battles without pygame and report win rates')
+    parser.add_argument('player', nargs='?', help='player pokemon (default: every starter matchup)')
+    parser.add_argument('rival', nargs='?', help='rival pokemon')
+    parser.add_argument('-n', '--battles', type=int, default=10000)
+    parser.add_argument('-p', '--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--level', type=int, default=30)
+    parser.add_argument('--handicap', type=float, default=rival_handicap)
+    parser.add_argument('--snapshot', help='read the pokemons from a pokeapi_local snapshot instead of the api')
+    args = parser.parse_args()
+
+    # one matchup needs both pokemons (without either, every starter matchup is simulated)
+    if (args.player is None) != (args.rival is None):
+        parser.error('give both the player and the rival pokemon, or neither')
+
+    source = None
+    if args.snapshot is not None:
+        from pokemon_dialogue.pokeapi_local import SnapshotResolver
+        source = SnapshotResolver(args.snapshot)
+
+    # the same pairs the game uses when the player picks a starter
+    matchups = [('Bulbasaur', 'Charmander'), ('Charmander', 'Squirtle'), ('Squirtle', 'Bulbasaur')]
+    if args.player is not None:
+        matchups = [(args.player.capitalize(), args.rival.capitalize())]
+
+    for player_name, rival_name in matchups:
+        start = time.time()
+        stats = simulate(player_name, rival_name, args.battles, args.processes, args.seed,
+                         args.level, args.handicap, source)
+        elapsed = time.time() - start
+        print(f'{player_name} vs {rival_name}: win rate {stats.win_rate:.4f}, '
+              f'average turns {stats.average_turns:.2f}, evolutions {stats.evolutions}, '
+              f'{stats.battles} battles in {elapsed:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
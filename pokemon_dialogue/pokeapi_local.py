@@ -0,0 +1,231 @@
+import argparse
+import json
+import mmap
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from pokemon_dialogue.api_cache import OfflineCacheMiss, api_cache
+from pokemon_dialogue.battle import base_url
+from pokemon_dialogue.records import Species
+
+# snapshot file: magic, index length, JSON index {key: [offset, length]}, zlib-compressed payloads
+snapshot_magic = b'PKAPI1\n'
+index_length = struct.Struct('<I')
+
+# what the game can ask for: the starters and ヒトカゲ's evolution
+default_names = ['bulbasaur', 'charmander', 'squirtle', 'charizard']
+default_port = 8765
+
+# decompressed payloads kept in memory (the compressed ones stay in the mmap)
+default_max_payload_bytes = 8 * 1024 * 1024
+
+
+def resource_key(url):
+    """ 'https://pokeapi.co/api/v2/move/10/' -> 'pokeapi.co/api/v2/move/10' """
+
+    parts = urlsplit(url)
+    return f'{parts.netloc}{parts.path}'.rstrip('/')
+
+
+def import_snapshot(path, names=default_names, source=api_cache, api_url=base_url):
+    """
+    Snapshot /pokemon/{name} for every name, their red-blue level-up moves and
+    their front/back sprites into one indexed file, return the number of resources.
+    """
+
+    urls = [f'{api_url}/pokemon/{name.lower()}' for name in names]
+    pokemon_jsons = source.get_many_json(urls)
+
+    # the whole red-blue level-up learnset, whatever level the pokemon will be played at
+    for pokemon_json in pokemon_jsons.values():
+        urls.extend(Species.from_json(pokemon_json).learnable_move_urls(100))
+        urls.extend(pokemon_json['sprites'][side] for side in ('front_default', 'back_default'))
+    urls = list(dict.fromkeys(urls))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        payloads = list(pool.map(source.get_bytes, urls))
+
+    index = {}
+    blobs = []
+    offset = 0
+    for url, payload in zip(urls, payloads):
+        blob = zlib.compress(payload, 9)
+        index[resource_key(url)] = [offset, len(blob)]
+        blobs.append(blob)
+        offset += len(blob)
+
+    header = json.dumps({'hosts': sorted({urlsplit(url).netloc for url in urls}), 'index': index},
+                        separators=(',', ':')).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(snapshot_magic)
+        f.write(index_length.pack(len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+
+    return len(urls)
+
+
+class SnapshotResolver():
+    """
+    In-process stand-in for the PokeAPI answering from a snapshot file.
+
+    It has the read side of ApiCache (get_bytes, get_json, get_many_json), so
+    it can be passed wherever the game takes an api source. Urls are looked up
+    by host and path, whatever scheme or trailing slash they come with. The
+    least recently used decompressed payloads are dropped once they add up to
+    more than `max_payload_bytes`; they are decompressed again if asked for.
+    """
+
+    def __init__(self, path, max_payload_bytes=default_max_payload_bytes):
+
+        self.path = path
+        self.max_payload_bytes = max_payload_bytes
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.data[:len(snapshot_magic)] != snapshot_magic:
+            raise ValueError(f'{path} is not a PokeAPI snapshot')
+
+        start = len(snapshot_magic)
+        (length,) = index_length.unpack_from(self.data, start)
+        start += index_length.size
+        header = json.loads(self.data[start:start + length])
+        self.hosts = header['hosts']
+        self.index = header['index']
+        self.payloads_start = start + length
+
+        # decompressed payloads of the resources asked for recently
+        self.payloads = OrderedDict()
+        self.payload_bytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def keys(self):
+
+        return self.index.keys()
+
+    def get_key(self, key):
+
+        with self.lock:
+            if key in self.payloads:
+                self.hits += 1
+                self.payloads.move_to_end(key)
+                return self.payloads[key]
+
+            if key not in self.index:
+                raise OfflineCacheMiss(f'{key} is not in the snapshot {self.path}')
+
+            self.misses += 1
+            offset, length = self.index[key]
+            start = self.payloads_start + offset
+            payload = zlib.decompress(self.data[start:start + length])
+            self.remember(key, payload)
+            return payload
+
+    def remember(self, key, payload):
+        """ Keep a decompressed payload, dropping the least recently used ones over the budget (call with the lock held) """
+
+        self.payloads[key] = payload
+        self.payload_bytes += len(payload)
+        while self.payload_bytes > self.max_payload_bytes and len(self.payloads) > 1:
+            _, dropped = self.payloads.popitem(last=False)
+            self.payload_bytes -= len(dropped)
+
+    def get_bytes(self, url):
+
+        return self.get_key(resource_key(url))
+
+    def get_json(self, url):
+
+        return json.loads(self.get_bytes(url))
+
+    def get_many_json(self, urls):
+
+        return {url: self.get_json(url) for url in dict.fromkeys(urls)}
+
+    def close(self):
+
+        self.data.close()
+
+
+class SnapshotRequestHandler(BaseHTTPRequestHandler):
+    """ GET /<host>/<path> from the snapshot, with the urls inside JSON pointing back at this server """
+
+    resolver = None
+    origin = None
+
+    def do_GET(self):
+
+        key = self.path.split('?', 1)[0].strip('/')
+        try:
+            payload = self.resolver.get_key(key)
+        except OfflineCacheMiss:
+            self.send_error(404)
+            return
+
+        content_type = 'image/png' if key.endswith('.png') else 'application/json'
+        if content_type == 'application/json':
+            for host in self.resolver.hosts:
+                payload = payload.replace(f'https://{host}'.encode(), f'{self.origin}/{host}'.encode())
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+
+        # one line per request is too much during load tests
+        pass
+
+
+def serve(path, host='localhost', port=default_port):
+
+    handler = type('Handler', (SnapshotRequestHandler,), {
+        'resolver': SnapshotResolver(path),
+        'origin': f'http://{host}:{port}',
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f'PokeAPI stand-in: {handler.origin}/{resource_key(base_url)}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Local PokeAPI stand-in')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help='snapshot the resources the game needs')
+    import_parser.add_argument('snapshot')
+    import_parser.add_argument('names', nargs='*', default=default_names)
+
+    serve_parser = commands.add_parser('serve', help='serve a snapshot over HTTP')
+    serve_parser.add_argument('snapshot')
+    serve_parser.add_argument('--host', default='localhost')
+    serve_parser.add_argument('--port', type=int, default=default_port)
+
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        count = import_snapshot(args.snapshot, args.names)
+        print(f'{count} resources written to {args.snapshot}')
+    else:
+        serve(args.snapshot, args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,45 @@
-import pygame
-from pygame.locals import *
 import time
-import math
-import random
-import requests
+
+# startup clock for --profile-startup (started before the heavy imports)
+startup_started = time.perf_counter()
+
+import argparse
 import io
-from urllib.request import urlopen
-import subprocess
+import threading
+
+import pygame
+from pygame.locals import *
 import os
 import logging
-import re  # 正規表現で出力を解析する
 
-pygame.init()
-# create the game window
+from pokemon_dialogue.animation import animate, evolution_duration, faint_duration, fade_frames, flicker_duration, send_out_duration
+from pokemon_dialogue.api_cache import api_cache
+from pokemon_dialogue.battle import Battle, Combatant, base_url
+from pokemon_dialogue.hp_bar import HpBar
+from pokemon_dialogue.pokeapi_local import SnapshotResolver
+from pokemon_dialogue.prefetch import prefetcher, read_file
+from pokemon_dialogue.records import records
+from pokemon_dialogue.recognizer import ASR_RESULT, ASR_TIMEOUT, recognizer
+from pokemon_dialogue.renderer import Renderer, message_box_rect
+from pokemon_dialogue.roster import english_to_japanese, english_to_japanese_moves, level, starters, state_grammars
+from pokemon_dialogue.sprites import sprite_store
+from pokemon_dialogue.typography import typography
+
+# the game window (created in main)
 game_width = 500
 game_height = 500
 size = (game_width, game_height)
-game = pygame.display.set_mode(size)
-pygame.display.set_caption('Pokemon Battle')
+game = None
+
+# everything on screen goes through the renderer's layers (sprites, hp bars, message box)
+renderer = None
+
+# where the pokemon data comes from: the cached PokeAPI or a local stand-in (--snapshot, --api-url)
+api_source = api_cache
+api_url = base_url
 
 vs_sound = "pokemon_dialogue/vstrainer.wav"
 win_sound = "pokemon_dialogue/winpokemon.wav"
-is_battle_music_playing = False
 
 # define colors
 black = (0, 0, 0)
@@ -31,68 +49,29 @@ green = (0, 200, 0)
 red = (200, 0, 0)
 white = (255, 255, 255)
 
-# base url of the API
-base_url = 'https://pokeapi.co/api/v2'
-
-class Move():
-
-    def __init__(self, url):
+class Pokemon(pygame.sprite.Sprite, Combatant):
 
-        # call the moves API endpoint
-        req = requests.get(url)
-        self.json = req.json()
-
-        self.name = self.json['name']
-        self.power = self.json['power']
-        self.type = self.json['type']['name']
-
-class Pokemon(pygame.sprite.Sprite):
-
-    def __init__(self, name, level, x, y):
+    def __init__(self, name, level, x, y, species=None):
 
         pygame.sprite.Sprite.__init__(self)
 
-        # call the pokemon API endpoint
-        req = requests.get(f'{base_url}/pokemon/{name.lower()}')
-        self.json = req.json()
-
-        # set the pokemon's name and level
-        self.name = name
-        self.level = level
+        # stats, hp, potions and moves (see battle.py)
+        Combatant.__init__(self, name, level, species, api_source, api_url)
 
         # set the sprite position on the screen
         self.x = x
         self.y = y
 
-        # number of potions left
-        self.num_potions = 3
-
-        # get the pokemon's stats from the API
-        stats = self.json['stats']
-        for stat in stats:
-            if stat['stat']['name'] == 'hp':
-                self.current_hp = stat['base_stat'] + self.level
-                self.max_hp = stat['base_stat'] + self.level
-            elif stat['stat']['name'] == 'attack':
-                self.attack = stat['base_stat']
-            elif stat['stat']['name'] == 'defense':
-                self.defense = stat['base_stat']
-            elif stat['stat']['name'] == 'speed':
-                self.speed = stat['base_stat']
-
-        # set the pokemon's types
-        self.types = []
-        for i in range(len(self.json['types'])):
-            type = self.json['types'][i]
-            self.types.append(type['type']['name'])
-
         # set the sprite's width
         self.size = 150
 
+        # the health bar widget (redrawn only when the hp it shows changes)
+        self.hp_bar = HpBar()
+
         # set the sprite to the front facing sprite
         self.set_sprite('front_default')
 
-    def perform_attack(self, other, move):
+    def announce_attack(self, move):
         try:
             display_message(f'{english_to_japanese[self.name]}の　{english_to_japanese_moves[move.name]}　攻撃！')
         
@@ -102,157 +81,183 @@ class Pokemon(pygame.sprite.Sprite):
         # pause for 2 seconds
         waitFor(2000)
 
-        # calculate the damage
-        damage = (2 * self.level + 10) / 250 * self.attack / other.defense * move.power
+    def set_sprite(self, side):
 
-        # same type attack bonus (STAB)
-        if move.type in self.types:
-            damage *= 1.5
+        # set the pokemon's sprite (decoded and scaled once, then shared through the sprite store)
+        self.image = sprite_store.get(self.name, side, self.size, self.species.sprites[side])
 
-        # critical hit (6.25% chance)
-        random_num = random.randint(1, 5000)
-        if random_num <= 625:
-            damage *= 1.5
+    def sprite_atlas(self, sizes=(150, 300)):
 
-        # round down the damage
-        damage = math.floor(damage)
+        # every (side, size) combination the battle can ask for
+        return [(self.name, side, size, self.species.sprites[side])
+                for side in ('front_default', 'back_default') for size in sizes]
 
-        other.take_damage(damage)
+    def draw(self, alpha=255):
 
-    def take_damage(self, damage):
+        # the shared sprite as is, a precomputed faded copy while fading
+        sprite = fade_frames.frame(self.image, alpha)
+        renderer.put('sprites', self, sprite, (self.x, self.y))
 
-        self.current_hp -= damage
+    def draw_hp(self, hp=None):
 
-        # hp should not go below 0
-        if self.current_hp < 0:
-            self.current_hp = 0
+        # display the health bar (the current hp unless an animation passes another value)
+        if hp is None:
+            hp = self.current_hp
+        changed = self.hp_bar.render(hp, self.max_hp)
+        renderer.put('hp', self, self.hp_bar.surface, (self.hp_x, self.hp_y))
+        if changed:
+            renderer.refresh('hp', self)
 
-    def use_potion(self):
+    def drain_hp(self):
 
-        # check if there are potions left
-        if self.num_potions > 0:
+        # animate the health bar from the hp it shows to the current hp
+        start = self.hp_bar.shown_hp
+        duration = self.hp_bar.drain_duration(self.current_hp)
+        if duration == 0:
+            self.draw_hp()
+            return
 
-            # add 30 hp (but don't go over the max hp)
-            self.current_hp += 30
-            if self.current_hp > self.max_hp:
-                self.current_hp = self.max_hp
+        def draw_frame(progress):
+            self.draw_hp(round(start + (self.current_hp - start) * progress))
 
-            # decrease the number of potions left
-            self.num_potions -= 1
+        animate(renderer, duration, draw_frame)
 
-    def set_sprite(self, side):
+    def get_rect(self):
 
-        # set the pokemon's sprite
-        image = self.json['sprites'][side]
-        image_stream = urlopen(image).read()
-        image_file = io.BytesIO(image_stream)
-        self.image = pygame.image.load(image_file).convert_alpha()
+        return Rect(self.x, self.y, self.image.get_width(), self.image.get_height())
 
-        # scale the image
-        scale = self.size / self.image.get_width()
-        new_width = self.image.get_width() * scale
-        new_height = self.image.get_height() * scale
-        self.image = pygame.transform.scale(self.image, (new_width, new_height))
 
-    def set_moves(self):
+def play_turn(battle, action=None):
 
-        self.moves = []
+    # the battle engine plays the turn, then the attack is announced on screen
+    events = battle.step(action)
+    for event in events:
+        if event.kind == 'attack':
+            event.actor.announce_attack(event.move)
+            event.target.drain_hp()
+        elif event.kind == 'potion':
+            event.actor.drain_hp()
+    return events
 
-        # go through all moves from the api
-        for i in range(len(self.json['moves'])):
 
-            # get the move from different game versions
-            versions = self.json['moves'][i]['version_group_details']
-            for j in range(len(versions)):
+def evolve(pokemon, rng):
 
-                version = versions[j]
+    # ヒトカゲ → リザードン（レベル 99、HP 1 で復活、データは先読み済み）
+    species, moves = prefetcher.get('evolution', load_evolution)
+    charizard = Pokemon('Charizard', 99, -40, 120, species)
+    charizard.set_moves(moves, rng)
+    charizard.current_hp = 1
+    charizard.size = 320
+    charizard.set_sprite('back_default')
+    charizard.hp_x = 275
+    charizard.hp_y = 250
+    return charizard
 
-                # only get moves from red-blue version
-                if version['version_group']['name'] != 'red-blue':
-                    continue
 
-                # only get moves that can be learned from leveling up (ie. exclude TM moves)
-                learn_method = version['move_learn_method']['name']
-                if learn_method != 'level-up':
-                    continue
+# the message currently in the message box
+shown_message = None
 
-                # add move if pokemon level is high enough
-                level_learned = version['level_learned_at']
-                if self.level >= level_learned:
-                    move = Move(self.json['moves'][i]['move']['url'])
+def message_box():
 
-                    # only include attack moves
-                    if move.power is not None:
-                        self.moves.append(move)
+    # draw a white box with black border
+    box = pygame.Surface(message_box_rect.size)
+    box.fill(white)
+    pygame.draw.rect(box, black, box.get_rect(), 3)
+    return box
 
-        # select up to 4 random moves
-        if len(self.moves) > 4:
-            self.moves = random.sample(self.moves, 4)
+def display_message(message):
+    global shown_message
 
-    def draw(self, alpha=255):
+    # the same message is already on screen
+    if message == shown_message:
+        renderer.present()
+        return
 
-        sprite = self.image.copy()
-        transparency = (255, 255, 255, alpha)
-        sprite.fill(transparency, None, pygame.BLEND_RGBA_MULT)
-        game.blit(sprite, (self.x, self.y))
+    box = message_box()
 
-    def draw_hp(self):
+    # display the message
+    text = typography.render(message, 18, black)
+    box.blit(text, (30 - message_box_rect.x, 410 - message_box_rect.y))
 
-        # display the health bar
-        bar_scale = 200 // self.max_hp
-        for i in range(self.max_hp):
-            bar = (self.hp_x + bar_scale * i, self.hp_y, bar_scale, 20)
-            pygame.draw.rect(game, red, bar)
+    renderer.put('message', 'box', box, message_box_rect.topleft)
+    shown_message = message
+    renderer.present()
 
-        for i in range(self.current_hp):
-            bar = (self.hp_x + bar_scale * i, self.hp_y, bar_scale, 20)
-            pygame.draw.rect(game, green, bar)
+def display_buttons(labels):
+    global shown_message
 
-        # display "HP" text
-        font = pygame.font.Font(pygame.font.get_default_font(), 16)
-        text = font.render(f'HP: {self.current_hp} / {self.max_hp}', True, black)
-        text_rect = text.get_rect()
-        text_rect.x = self.hp_x
-        text_rect.y = self.hp_y + 30
-        game.blit(text, text_rect)
+    box = message_box()
 
-    def get_rect(self):
+    # create a button for each move
+    for i, label in enumerate(labels):
+        button_width = 240
+        button_height = 70
+        left = 10 + i % 2 * button_width
+        top = 350 + i // 2 * button_height
+        text_center_x = left + 120
+        text_center_y = top + 35
+        create_button(box, button_width, button_height, left, top, text_center_x, text_center_y, label)
 
-        return Rect(self.x, self.y, self.image.get_width(), self.image.get_height())
+    # draw the black border
+    pygame.draw.rect(box, black, box.get_rect(), 3)
 
+    renderer.put('message', 'box', box, message_box_rect.topleft)
+    shown_message = None
+    renderer.present()
 
-#フォントパスの指定
-font_path = "PixelMplus-20130602/PixelMplus12-Regular.ttf"
+def create_button(box, width, height, left, top, text_cx, text_cy, label):
+    # buttons are drawn on the message box, in screen coordinates
+    button = Rect(left, top, width, height)
+    offset = (-message_box_rect.x, -message_box_rect.y)
 
-def display_message(message):
+    # highlight the button if mouse is pointing to it
+    pygame.draw.rect(box, white, button.move(offset))
 
-    # draw a white box with black border
-    pygame.draw.rect(game, white, (10, 350, 480, 140))
-    pygame.draw.rect(game, black, (10, 350, 480, 140), 3)
+    # add the label to the button
+    text = typography.render(f'{label}', 16, black)  # 日本語対応フォント（typography.py）
+    text_rect = text.get_rect(center=(text_cx + offset[0], text_cy + offset[1]))
+    box.blit(text, text_rect)
 
-    # display the message
-    font = pygame.font.Font(font_path, 18)
-    text = font.render(message, True, black)
-    text_rect = text.get_rect()
-    text_rect.x = 30
-    text_rect.y = 410
-    game.blit(text, text_rect)
+    return button
 
-    pygame.display.update()
+def clear_message():
+    global shown_message
 
-def create_button(width, height, left, top, text_cx, text_cy, label):
-    button = Rect(left, top, width, height)
+    renderer.remove('message', 'box')
+    shown_message = None
 
-    # highlight the button if mouse is pointing to it
-    pygame.draw.rect(game, white, button)
+def show_pokemons(*pokemons, hp=True):
 
-    # add the label to the button
-    font = pygame.font.Font(font_path, 16)  # 日本語対応フォントを指定
-    text = font.render(f'{label}', True, black)
-    text_rect = text.get_rect(center=(text_cx, text_cy))
-    game.blit(text, text_rect)
+    # replace the sprites (and hp bars) on screen with these pokemons
+    renderer.clear('sprites', 'hp')
+    for pokemon in pokemons:
+        pokemon.draw()
+        if hp:
+            pokemon.draw_hp()
 
-    return button
+def fade(pokemon, duration, fade_in=True):
+
+    # fade the pokemon's sprite in or out over `duration` milliseconds
+    def draw_frame(progress):
+        pokemon.draw(255 * progress if fade_in else 255 * (1 - progress))
+
+    animate(renderer, duration, draw_frame)
+
+def flicker(old_pokemon, new_pokemon, duration):
+
+    # alternate the fading-out old sprite and the fading-in new one every frame
+    frames = [0]
+
+    def draw_frame(progress):
+        if frames[0] % 2 == 0:
+            renderer.remove('sprites', new_pokemon)
+            old_pokemon.draw(255 * (1 - progress))
+        else:
+            renderer.remove('sprites', old_pokemon)
+            new_pokemon.draw(255 * progress)
+        frames[0] += 1
+
+    animate(renderer, duration, draw_frame)
 
 # Add the waitFor function
 def waitFor(milliseconds):
@@ -261,8 +266,8 @@ def waitFor(milliseconds):
     finish_time = time_now + milliseconds   # finish time
 
     while time_now < finish_time:
-        # Handle user-input
-        for event in pygame.event.get():
+        # Handle user-input (speech results stay queued for the main loop)
+        for event in pygame.event.get(exclude=[ASR_RESULT, ASR_TIMEOUT]):
             if event.type == pygame.QUIT:
                 pygame.event.post(pygame.event.Event(pygame.QUIT))  # re-post to handle in the main loop
                 break
@@ -271,531 +276,591 @@ def waitFor(milliseconds):
                     break
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 break
-        pygame.display.update()  # Ensure display updates
-        pygame.time.wait(200)  # save some CPU for a split-second
+        renderer.present()  # Ensure display updates
+        renderer.tick()  # save some CPU until the next frame
         time_now = pygame.time.get_ticks()  # update the current time
 
 
-# create the starter pokemons
-level = 30
-bulbasaur = Pokemon('Bulbasaur', level, 25, 150)
-charmander = Pokemon('Charmander', level, 175, 150)
-squirtle = Pokemon('Squirtle', level, 325, 150)
-pokemons = [bulbasaur, charmander, squirtle]
-
-# the player's and rival's selected pokemon
-player_pokemon = None
-rival_pokemon = None
-
-# ポケモンの名前を英語から日本語へ直す辞書
-english_to_japanese = {
-    'Bulbasaur': 'フシギダネ',
-    'Charmander':'ヒトカゲ',
-    'Squirtle': 'ゼニガメ',
-    }
-
-#わざの名前を英語から日本語へ直す辞書
-english_to_japanese_moves = {'vine-whip': 'つるのムチ',
-                             'tackle': 'たいあたり',
-                             'razor-leaf': 'はっぱカッター',
-                             'scratch': 'ひっかく',
-                             'ember': 'ひのこ',
-                             'rage': 'いかり',
-                             'slash': 'きりさく',
-                             'bite': 'かみつく',
-                             'water-gun': 'みずでっぽう',
-                             'bubble': 'あわ'}
-
-
-# game loop
-game_status = 'select pokemon'
-while game_status != 'quit':
-
-    for event in pygame.event.get():
-        if event.type == QUIT:
-            game_status = 'quit'
-
-        # detect keypress
-        if event.type == KEYDOWN:
-
-            # play again
-            if event.key == K_y:
-                # reset the pokemons
-                bulbasaur = Pokemon('Bulbasaur', level, 25, 150)
-                charmander = Pokemon('Charmander', level, 175, 150)
-                squirtle = Pokemon('Squirtle', level, 325, 150)
-                pokemons = [bulbasaur, charmander, squirtle]
-                game_status = 'select pokemon'
+class StartupProfile():
+    """ Wall-clock marks from the module import to the first interactive frame (--profile-startup) """
 
-            # quit
-            elif event.key == K_n:
-                game_status = 'quit'
+    def __init__(self, enabled=False):
 
-    # pokemon select screen
-    if game_status == 'select pokemon':
+        self.enabled = enabled
+        self.marks = [('start', startup_started)]
+        self.lock = threading.Lock()
 
-        game.fill(white)
+    def mark(self, name):
 
-        # draw the starter pokemons
-        bulbasaur.draw()
-        charmander.draw()
-        squirtle.draw()
+        with self.lock:
+            self.marks.append((name, time.perf_counter()))
 
-        pygame.display.update()
+    def report(self):
 
-        waitFor(1000)
+        if not self.enabled:
+            return
+
+        print('起動プロファイル:')
+        with self.lock:
+            marks = sorted(self.marks, key=lambda mark: mark[1])
+        for (_, previous), (name, at) in zip(marks, marks[1:]):
+            print(f'  {name:<24} +{(at - previous) * 1000:8.1f} ms  {(at - startup_started) * 1000:8.1f} ms')
+        print(f'  api: hits {api_source.hits}, misses {api_source.misses}; '
+              f'records: hits {records.hits}, misses {records.misses}; '
+              f'sprites: hits {sprite_store.hits}, misses {sprite_store.misses}')
+
+
+class StarterLoader():
+    """
+    Parses the starters' species records, fetches their sprites into the api cache
+    and starts Julius on a background thread, so the title screen is drawn while they load.
+    """
+
+    def __init__(self, profile):
 
+        self.profile = profile
+        self.species = None
+        self.error = None
 
-        julius_command = [
-            "julius",
-            "-C",
-            "dialogue-demo/asr/grammar-mic.jconf",
-            "-input",
-            "mic"
-        ]
+        # set once the starters are loaded (or failed), and once Julius is up too
+        self.loaded = threading.Event()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.load, daemon=True)
+
+    def start(self):
+
+        self.thread.start()
+        return self
+
+    def load(self):
 
         try:
-            process = subprocess.Popen(
-                julius_command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-
-            while True:
-                line = process.stdout.readline()
-                if line:
-                    # "sentence1:" で始まる行を取得
-                    match = re.match(r"sentence1:\s*(.*)", line)
-                    if match:
-                        result = match.group(1).strip()
-                        print(f"認識結果: {result}")  # デバッグ用出力
-                        if "フシギダネ" in result:
-                            player_pokemon = pokemons[0]
-                            rival_pokemon = pokemons[1]
-                        elif "ヒトカゲ" in result:
-                            player_pokemon = pokemons[1]
-                            rival_pokemon = pokemons[2]
-                        elif "ゼニガメ" in result:
-                            player_pokemon = pokemons[2]
-                            rival_pokemon = pokemons[0]
-                        else:
-                            continue
-                        # lower the rival pokemon's level to make the battle easier
-                        rival_pokemon.level = int(rival_pokemon.level * .75)
-                        player_pokemon.hp_x = 275
-                        player_pokemon.hp_y = 250
-                        rival_pokemon.hp_x = 50
-                        rival_pokemon.hp_y = 50
-
-                        game_status = 'prebattle'
-                        break
-                if process.poll() is not None:
-                    print("Julius プロセスが終了しました")
-                    break
+            urls = [f'{api_url}/pokemon/{name.lower()}' for name, _, _ in starters]
+            species = records.species_many(urls, api_source)
+            self.species = [species[url] for url in urls]
+
+            # warm the cache with every sprite the battle can show
+            sprite_urls = [record.sprites[side] for record in self.species
+                           for side in ('front_default', 'back_default')]
+            for url in sprite_urls:
+                api_source.get_bytes(url)
+            self.profile.mark('starter data (thread)')
+        except Exception as e:
+            self.error = e
+        self.loaded.set()
+
+        # the acoustic model takes a while to load, do it before the first listen
+        try:
+            recognizer.start()
+            self.profile.mark('julius ready (thread)')
         except Exception as e:
             print(f"Julius 実行中にエラーが発生しました: {str(e)}")
-            display_message("音声認識に失敗しました。リトライしてください。")
 
-        pygame.display.update()
+        self.done.set()
+
+
+def load_evolution():
+
+    # charizard's species, moves and sprites (runs on a prefetch thread)
+    species = records.species(f'{api_url}/pokemon/charizard', api_source)
+    moves = records.moves(species.learnable_move_urls(99), api_source)
+    for side in ('front_default', 'back_default'):
+        api_source.get_bytes(species.sprites[side])
+    return species, moves
+
+
+def load_moves(pokemon):
+
+    # the pokemon's candidate moves (waits for the prefetch if it is still running)
+    return prefetcher.get(('moves', pokemon.name), records.moves, pokemon.learnable_move_urls(), api_source)
+
+
+def play_music(path, loops):
+
+    # the wav was read into memory ahead of time
+    wav = prefetcher.get(('sound', path), read_file, path)
+    pygame.mixer.music.load(io.BytesIO(wav), 'wav')
+    pygame.mixer.music.play(loops)
+
+
+def prefetch_for(status, pokemons, player_pokemon):
+
+    # warm up in the background what the states after `status` will need
+    if status == 'select pokemon':
+        # any starter can be picked: everybody's moves, the battle music and ヒトカゲ's evolution
+        for pokemon in pokemons:
+            prefetcher.prefetch(('moves', pokemon.name), records.moves, pokemon.learnable_move_urls(), api_source)
+        prefetcher.prefetch(('sound', vs_sound), read_file, vs_sound)
+        prefetcher.prefetch('evolution', load_evolution)
+
+    elif status == 'prebattle':
+        prefetcher.prefetch(('sound', win_sound), read_file, win_sound)
+
+    elif status in ('player turn', 'rival turn') and player_pokemon.name == 'Charmander':
+        # decode charizard's sprites between turns, not in the middle of the cutscene
+        if prefetcher.ready('evolution'):
+            species, _ = prefetcher.get('evolution', load_evolution)
+            sprite_store.prebuild([('Charizard', 'front_default', 150, species.sprites['front_default']),
+                                   ('Charizard', 'back_default', 320, species.sprites['back_default'])])
+
+
+def create_starters(species):
 
-    # get moves from the API and reposition the pokemons
-    if game_status == 'prebattle':
-        if not is_battle_music_playing:
-            pygame.mixer.music.load(vs_sound)
-            pygame.mixer.music.play(-1)  # 無限ループ再生
-            is_battle_music_playing = True
+    # create the starter pokemons from their loaded species records
+    pokemons = [Pokemon(name, level, x, y, record) for (name, x, y), record in zip(starters, species)]
 
+    # decode and scale the starters' battle sprites ahead of time
+    for pokemon in pokemons:
+        sprite_store.prebuild(pokemon.sprite_atlas())
 
-        # draw the selected pokemon
-        game.fill(white)
-        player_pokemon.draw()
-        pygame.display.update()
+    return pokemons
 
-        player_pokemon.set_moves()
-        rival_pokemon.set_moves()
+# 一回の発話を待つ最大時間 [ms]（過ぎたら聞き直す）
+listen_timeout = 15000
 
-        # reposition the pokemons
-        player_pokemon.x = -50
-        player_pokemon.y = 100
-        rival_pokemon.x = 250
-        rival_pokemon.y = -50
 
-        # resize the sprites
-        player_pokemon.size = 300
-        rival_pokemon.size = 300
-        player_pokemon.set_sprite('back_default')
-        rival_pokemon.set_sprite('front_default')
 
-        game_status = 'start battle'
+def listen_for_command(status):
 
-        pygame.display.update()
+    # let julius listen in the background unless it already is
+    if recognizer.listening:
+        return
+
+    try:
+        recognizer.listen(state_grammars[status], listen_timeout)
+    except Exception as e:
+        print(f"Julius 実行中にエラーが発生しました: {str(e)}")
+        display_message("音声認識に失敗しました。リトライしてください。")
+        waitFor(1000)
+
+
+def show_title():
+
+    # title screen while the starters load
+    clear_message()
+    show_pokemons(hp=False)
+    title = typography.render('ポケモン　バトル', 32, black)
+    renderer.put('sprites', 'title', title, title.get_rect(center=(game_width // 2, 160)).topleft)
+    display_message('よみこみちゅう・・・')
+
+
+def configure_source(snapshot=None, url=base_url):
+    global api_source, api_url
+
+    # play from a snapshot file (in process) or from another PokeAPI, eg. a pokeapi_local server
+    api_url = url
+    if snapshot is not None:
+        api_source = SnapshotResolver(snapshot)
+        sprite_store.cache = api_source
+
+
+def init_display():
+    global game, renderer
+
+    pygame.init()
+    # create the game window
+    game = pygame.display.set_mode(size)
+    pygame.display.set_caption('Pokemon Battle')
+    renderer = Renderer(game)
 
-    # start battle animation
-    if game_status == 'start battle':
 
-        # rival sends out their pokemon
-        alpha = 0
-        while alpha < 255:
+def main(argv=None):
 
-            game.fill(white)
-            rival_pokemon.draw(alpha)
+    parser = argparse.ArgumentParser(description='Pokemon battle by voice')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='print where the time to the first frame and to the select screen goes')
+    parser.add_argument('--snapshot', help='play from a pokeapi_local snapshot instead of the PokeAPI')
+    parser.add_argument('--api-url', default=base_url, help='PokeAPI base url, eg. a pokeapi_local server')
+    args = parser.parse_args(argv)
+
+    configure_source(args.snapshot, args.api_url)
+
+    profile = StartupProfile(args.profile_startup)
+    profile.mark('imports')
+
+    init_display()
+    profile.mark('window')
+
+    # the title screen is up while the starters load in the background
+    loader = StarterLoader(profile).start()
+    show_title()
+    profile.mark('first frame')
+
+    pokemons = []
+    player_pokemon = None
+    rival_pokemon = None
+    battle = None
+    is_battle_music_playing = False
+
+    # the listening state whose screen is already drawn, the state whose next states are prefetched
+    prompted_status = None
+    prefetched_status = None
+
+    # game loop
+    game_status = 'title'
+    while game_status != 'quit':
+
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                game_status = 'quit'
+
+            # detect keypress
+            if event.type == KEYDOWN:
+
+                # play again
+                if event.key == K_y:
+                    # reset the pokemons (the loader retries if the first load failed)
+                    if loader.species is None:
+                        if loader.loaded.is_set():
+                            loader = StarterLoader(profile).start()
+                            show_title()
+                        continue
+                    pokemons = create_starters(loader.species)
+                    game_status = 'select pokemon'
+                    prompted_status = None
+                    recognizer.cancel()
+
+                # quit
+                elif event.key == K_n:
+                    game_status = 'quit'
+
+            # Julius が一定時間なにも認識しなかった（次のフレームで聞き直す）
+            if event.type == ASR_TIMEOUT:
+                print("音声認識がタイムアウトしました")
+
+            # 音声認識の結果に応じてゲームロジックを実行
+            if event.type == ASR_RESULT:
+                result = event.text
+
+                # プロセスが終了した場合
+                if result is None:
+                    print("Julius プロセスが終了しました")
+                    display_message("音声認識に失敗しました。リトライしてください。")
+                    continue
+
+                print(f"認識結果: {result}")  # デバッグ用出力
+                status_before = game_status
+
+                if game_status == 'select pokemon':
+                    if "フシギダネ" in result:
+                        player_pokemon = pokemons[0]
+                        rival_pokemon = pokemons[1]
+                    elif "ヒトカゲ" in result:
+                        player_pokemon = pokemons[1]
+                        rival_pokemon = pokemons[2]
+                    elif "ゼニガメ" in result:
+                        player_pokemon = pokemons[2]
+                        rival_pokemon = pokemons[0]
+                    else:
+                        continue
+                    # lower the rival pokemon's level to make the battle easier
+                    rival_pokemon.level = int(rival_pokemon.level * .75)
+                    player_pokemon.hp_x = 275
+                    player_pokemon.hp_y = 250
+                    rival_pokemon.hp_x = 50
+                    rival_pokemon.hp_y = 50
+
+                    game_status = 'prebattle'
+
+                elif game_status == 'player turn':
+                    if "たたかう" in result or "いけ" in result or "ヒトカゲ" in result or "ゼニガメ" in result or "フシギダネ" in result :
+                        game_status = 'player move'
+                        # game_status = 'fainted'
+                    elif "かいふく" in result :
+                        # force to attack if there are no more potions
+                        if player_pokemon.num_potions == 0:
+                            display_message('キズぐすりが　ありません')
+                            waitFor(500)
+                            game_status = 'player move'
+                        else:
+                            play_turn(battle, ('potion',))
+                            display_message('キズぐすりを　つかった！')
+                            waitFor(500)
+                            game_status = 'rival turn'
+
+                elif game_status == 'player move':
+                    if "つるのムチ" in result or (player_pokemon.name == "Squirtle" and "たいあたり" in result) or "ひっかく" in result :
+                        play_turn(battle, ('attack', 0))
+                        game_status = 'rival turn'
+                        # game_status = 'fainted'
+                        print("技" + result)
+                    elif (player_pokemon.name == "Bulbasaur" and "たいあたり" in result) or "ひのこ" in result or "かみつく" in result:
+                        play_turn(battle, ('attack', 1))
+                        game_status = 'rival turn'
+                        # game_status = 'fainted'
+                        print("技" + result)
+                    elif "はっぱカッター" in result or "いかり" in result or "みずでっぽう" in result:
+                        play_turn(battle, ('attack', 2))
+                        game_status = 'rival turn'
+                        # game_status = 'fainted'
+                        print("技" + result)
+                    elif "きりさく" in result or "あわ" in result :
+                        play_turn(battle, ('attack', 3))
+                        game_status = 'rival turn'
+                        # game_status = 'fainted'
+                        print("技" + result)
+
+                # the next listening state draws its own prompt
+                if game_status != status_before:
+                    prompted_status = None
+
+        # start loading what the next states need whenever the state changes
+        if game_status != prefetched_status:
+            prefetch_for(game_status, pokemons, player_pokemon)
+            prefetched_status = game_status
+
+        # wait on the title screen until the starters are loaded
+        if game_status == 'title' and loader.loaded.is_set():
+            if loader.species is not None:
+                pokemons = create_starters(loader.species)
+                profile.mark('starters')
+                game_status = 'select pokemon'
+            elif prompted_status != game_status:
+                print(f"データの読み込みに失敗しました: {loader.error}")
+                display_message('よみこみに　しっぱいしました (Y で　リトライ)')
+                prompted_status = game_status
+
+        # pokemon select screen
+        if game_status == 'select pokemon':
+
+            if prompted_status != game_status:
+                # draw the starter pokemons
+                clear_message()
+                renderer.remove('sprites', 'title')
+                show_pokemons(*pokemons, hp=False)
+
+                renderer.present()
+                if 'interactive' not in dict(profile.marks):
+                    profile.mark('interactive')
+                    profile.report()
+                prompted_status = game_status
+
+            if loader.done.is_set():
+                listen_for_command(game_status)
+
+        # get moves from the API and reposition the pokemons
+        if game_status == 'prebattle':
+            if not is_battle_music_playing:
+                play_music(vs_sound, -1)  # 無限ループ再生
+                is_battle_music_playing = True
+
+
+            # draw the selected pokemon
+            show_pokemons(player_pokemon, hp=False)
+            renderer.present()
+
+            # moves were prefetched on the select screen
+            moves = {}
+            for pokemon in (player_pokemon, rival_pokemon):
+                moves.update(load_moves(pokemon))
+            for pokemon in (player_pokemon, rival_pokemon):
+                pokemon.set_moves(moves)
+
+            # reposition the pokemons
+            player_pokemon.x = -50
+            player_pokemon.y = 100
+            rival_pokemon.x = 250
+            rival_pokemon.y = -50
+
+            # resize the sprites
+            player_pokemon.size = 300
+            rival_pokemon.size = 300
+            player_pokemon.set_sprite('back_default')
+            rival_pokemon.set_sprite('front_default')
+
+            # the battle engine keeps the rules, the rest of the loop only draws
+            battle = Battle(player_pokemon, rival_pokemon, evolutions={'Charmander': evolve})
+
+            game_status = 'start battle'
+
+        # start battle animation
+        if game_status == 'start battle':
+
+            # rival sends out their pokemon
+            show_pokemons(hp=False)
             if rival_pokemon.name == 'Bulbasaur':
                 display_message('ライバルは　フシギダネを　くりだした！!')
             elif rival_pokemon.name == 'Charmander':
                 display_message('ライバルは　ヒトカゲを　くりだした！')
             elif rival_pokemon.name == 'Squirtle':
                 display_message('ライバルは　ゼニガメを　くりだした！')
-            alpha += .4
-
-            pygame.display.update()
-
-        # pause for 1 second
-        waitFor(1000)
+            fade(rival_pokemon, send_out_duration)
 
-        # player sends out their pokemon
-        alpha = 0
-        while alpha < 255:
+            # pause for 1 second
+            waitFor(1000)
 
-            game.fill(white)
-            rival_pokemon.draw()
-            player_pokemon.draw(alpha)
+            # player sends out their pokemon
             if player_pokemon.name == 'Bulbasaur':
                 display_message('ゆけっ！　フシギダネ！')
             elif player_pokemon.name == 'Charmander':
                 display_message('ゆけっ！　ヒトカゲ！')
             elif player_pokemon.name == 'Squirtle':
                 display_message('ゆけっ！　ゼニガメ！')
-            alpha += .4
+            fade(player_pokemon, send_out_duration)
 
-            pygame.display.update()
-
-        # draw the hp bars
-        player_pokemon.draw_hp()
-        rival_pokemon.draw_hp()
-
-        # determine who goes first
-        if rival_pokemon.speed > player_pokemon.speed:
-            game_status = 'rival turn'
-        else:
-            game_status = 'player turn'
+            # draw the hp bars
+            player_pokemon.draw_hp()
+            rival_pokemon.draw_hp()
 
-        pygame.display.update()
+            # determine who goes first
+            if battle.turn == 'rival':
+                game_status = 'rival turn'
+            else:
+                game_status = 'player turn'
 
-        # pause for 1 second
-        waitFor(1000)
+            renderer.present()
 
-    # display the fight and use potion buttons
-    if game_status == 'player turn':
-        game.fill(white)
-        player_pokemon.draw()
-        rival_pokemon.draw()
-        player_pokemon.draw_hp()
-        rival_pokemon.draw_hp()
+            # pause for 1 second
+            waitFor(1000)
 
-        # ボタンを使わない表示にする場合
-        display_message(f'{english_to_japanese[player_pokemon.name]}は　どうする？（たたかう　かいふく）')
+        # display the fight and use potion buttons
+        if game_status == 'player turn':
 
-        # draw the black border
-        pygame.draw.rect(game, black, (10, 350, 480, 140), 3)
+            if prompted_status != game_status:
+                show_pokemons(player_pokemon, rival_pokemon)
 
-        pygame.display.update()
+                # ボタンを使わない表示にする場合（メッセージ枠の黒い縁つき）
+                display_message(f'{english_to_japanese[player_pokemon.name]}は　どうする？（たたかう　かいふく）')
+                prompted_status = game_status
 
-        # Julius コマンドを直接実行
-        julius_command = [
-            "julius",
-            "-C",
-            "dialogue-demo/asr/grammar-mic.jconf",
-            "-input",
-            "mic"
-        ]
+            # 常駐している Julius で認識する（結果は ASR_RESULT で届く、起動を待ってから）
+            if loader.done.is_set():
+                listen_for_command(game_status)
 
-        try:
-            process = subprocess.Popen(
-                julius_command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            # 音声認識の結果をリアルタイムで取得
-            while True:
-                line = process.stdout.readline()
-                if line:
-                    # "sentence1:" で始まる行を取得
-                    match = re.match(r"sentence1:\s*(.*)", line)
-                    if match:
-                        result = match.group(1).strip()
-                        print(f"認識結果: {result}")  # デバッグ用出力
-
-                        # 音声認識結果に応じてゲームロジックを実行
-                        if "たたかう" in result or "いけ" in result or "ヒトカゲ" in result or "ゼニガメ" in result or "フシギダネ" in result :
-                            game_status = 'player move'
-                            # game_status = 'fainted'
-                            break
-                        elif "かいふく" in result :
-                            # force to attack if there are no more potions
-                            if player_pokemon.num_potions == 0:
-                                display_message('キズぐすりが　ありません')
-                                waitFor(500)
-                                game_status = 'player move'
-                            else:
-                                player_pokemon.use_potion()
-                                display_message('キズぐすりを　つかった！')
-                                waitFor(500)
-                                game_status = 'rival turn'
-                            break
-                # プロセスが終了した場合
-                if process.poll() is not None:
-                    print("Julius プロセスが終了しました")
-                    break
+        if game_status == 'player move':
 
-        except Exception as e:
-            print(f"Julius 実行中にエラーが発生しました: {str(e)}")
-            display_message("音声認識に失敗しました。リトライしてください。")
+            # 常駐している Julius で認識する（結果は ASR_RESULT で届く、起動を待ってから）
+            if loader.done.is_set():
+                listen_for_command(game_status)
 
-        # 描画を更新
-        pygame.display.update()
+            if prompted_status != game_status:
+                show_pokemons(player_pokemon, rival_pokemon)
 
-    if game_status == 'player move':
-        # Julius コマンドを直接実行
-        julius_command = [
-            "julius",
-            "-C",
-            "dialogue-demo/asr/grammar-mic.jconf",
-            "-input",
-            "mic"
-        ]
+                display_message("ポケモンに指示を出すんだ！！！")
 
-        try:
-            process = subprocess.Popen(
-                julius_command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            game.fill(white)
-            player_pokemon.draw()
-            rival_pokemon.draw()
-            player_pokemon.draw_hp()
-            rival_pokemon.draw_hp()
+                waitFor(1500)
 
-            display_message("ポケモンに指示を出すんだ！！！")
-
-            waitFor(1500)
-
-            # create a button for each move
-            for i in range(4):
-                button_width = 240
-                button_height = 70
-                left = 10 + i % 2 * button_width
-                top = 350 + i // 2 * button_height
-                text_center_x = left + 120
-                text_center_y = top + 35
-                if i < len(player_pokemon.moves):
-                    move = player_pokemon.moves[i]
-                    if move.name in english_to_japanese_moves:
-                        button = create_button(button_width, button_height, left, top, text_center_x, text_center_y, english_to_japanese_moves[move.name])
+                # one button label per move
+                labels = []
+                for i in range(4):
+                    if i < len(player_pokemon.moves):
+                        move = player_pokemon.moves[i]
+                        if move.name in english_to_japanese_moves:
+                            labels.append(english_to_japanese_moves[move.name])
+                        else:
+                            labels.append(move.name.capitalize())
                     else:
-                        button = create_button(button_width, button_height, left, top, text_center_x, text_center_y, move.name.capitalize())
-                else:
-                    button = create_button(button_width, button_height, left, top, text_center_x, text_center_y, ' ')
-            # draw the black border
-            pygame.draw.rect(game, black, (10, 350, 480, 140), 3)
-            pygame.display.update()
-
-            waitFor(2000)
-
-            # 音声認識の結果をリアルタイムで取得
-            while True:
-                line = process.stdout.readline()
-                if line:
-                    # "sentence1:" で始まる行を取得
-                    match = re.match(r"sentence1:\s*(.*)", line)
-                    if match:
-                        result = match.group(1).strip()
-                        print(f"認識結果: {result}")  # デバッグ用出力
-
-                        # 音声認識結果に応じてゲームロジックを実行
-                        if "つるのムチ" in result or (player_pokemon.name == "Squirtle" and "たいあたり" in result) or "ひっかく" in result :
-                            player_pokemon.perform_attack(rival_pokemon, player_pokemon.moves[0])
-                            game_status = 'rival turn'
-                            # game_status = 'fainted'
-                            print("技" + result)
-                            break
-                        elif (player_pokemon.name == "Bulbasaur" and "たいあたり" in result) or "ひのこ" in result or "かみつく" in result:
-                            player_pokemon.perform_attack(rival_pokemon, player_pokemon.moves[1])
-                            game_status = 'rival turn'
-                            # game_status = 'fainted'
-                            print("技" + result)
-                            break
-                        elif "はっぱカッター" in result or "いかり" in result or "みずでっぽう" in result:
-                            player_pokemon.perform_attack(rival_pokemon, player_pokemon.moves[2])
-                            game_status = 'rival turn'
-                            # game_status = 'fainted'
-                            print("技" + result)
-                            break
-                        elif "きりさく" in result or "あわ" in result :
-                            player_pokemon.perform_attack(rival_pokemon, player_pokemon.moves[3])
-                            game_status = 'rival turn'
-                            # game_status = 'fainted'
-                            print("技" + result)
-                            break
-
-                # プロセスが終了した場合
-                if process.poll() is not None:
-                    print("Julius プロセスが終了しました")
-                    break
-            # print("ループを抜けました")
+                        labels.append(' ')
 
-            # Julius のエラー出力を取得してデバッグ
-            # stderr_output = process.stderr.read()
-            # print(stderr_output)
-            # if stderr_output:
-            #     print(f"Julius エラー: {stderr_output}")
+                # 描画を更新
+                display_buttons(labels)
+                prompted_status = game_status
 
-        except Exception as e:
-            print(f"Julius 実行中にエラーが発生しました: {str(e)}")
-            display_message("音声認識に失敗しました。リトライしてください。")
 
-        # 描画を更新
-        pygame.display.update()
+        # rival selects a random move to attack with
+        if game_status == 'rival turn':
 
+            # check if the rival's pokemon fainted
+            if battle.winner is not None:
+                game_status = 'fainted'
+            else:
+                show_pokemons(player_pokemon, rival_pokemon)
+
+                # empty the display box and pause for 2 seconds before attacking
+                display_message('')
+                waitFor(2000)
+
+                # the engine selects a random move
+                play_turn(battle)
+
+            # check if the player's pokemon fainted (ヒトカゲ evolves instead)
+            if battle.player is not player_pokemon:
+                show_pokemons(player_pokemon, rival_pokemon)
+                renderer.present()
+                waitFor(4000)
+                game_status = 'evolution'
+            elif battle.winner is not None:
+                game_status = 'fainted'
+            else:
+                game_status = 'player turn'
+            renderer.present()
 
-    # rival selects a random move to attack with
-    if game_status == 'rival turn':
-
-        # check if the rival's pokemon fainted
-        if rival_pokemon.current_hp == 0:
-            game_status = 'fainted'
-        else:
-            game.fill(white)
-            player_pokemon.draw()
-            rival_pokemon.draw()
-            player_pokemon.draw_hp()
+        if game_status == 'evolution':
+            # フェードアウトと白い点滅演出
+            clear_message()
+            show_pokemons(rival_pokemon, player_pokemon, hp=False)
             rival_pokemon.draw_hp()
+            fade(player_pokemon, evolution_duration, fade_in=False)  # 徐々に透明にする
 
-            # empty the display box and pause for 2 seconds before attacking
-            display_message('')
-            waitFor(2000)
+            show_pokemons(hp=False)  # 画面を白く塗りつぶす
+            display_message("おや？ ヒトカゲのようすが・・・？？？")
+            waitFor(2000)  # メッセージ表示待機
 
-            # select a random move
-            move = random.choice(rival_pokemon.moves)
-            rival_pokemon.perform_attack(player_pokemon, move)
+            # the battle engine already swapped in the evolution (see evolve)
+            charmander = player_pokemon
+            player_pokemon = battle.player
 
-        # check if the player's pokemon fainted
-        if player_pokemon.current_hp == 0 and (player_pokemon.name == "Charmander"):
-            game.fill(white)
-            player_pokemon.draw()
-            rival_pokemon.draw()
-            player_pokemon.draw_hp()
-            rival_pokemon.draw_hp()
-            pygame.display.update()
-            waitFor(4000)
-            game_status = 'evolution'
-        elif player_pokemon.current_hp == 0 or rival_pokemon.current_hp == 0:
-            game_status = 'fainted'
-        else:
-            game_status = 'player turn'
-        pygame.display.update()
-
-    if game_status == 'evolution':
-        # フェードアウトと白い点滅演出
-        alpha = 0
-        while alpha < 255:
-            game.fill(white)  # 画面を白く塗りつぶす
-            rival_pokemon.draw()
-            rival_pokemon.draw_hp()
-            player_pokemon.draw(alpha=255 - alpha)  # 徐々に透明にする
-            pygame.display.update()
-            alpha += .4
-
-        game.fill(white)
-        display_message("おや？ ヒトカゲのようすが・・・？？？")
-        waitFor(2000)  # メッセージ表示待機
-
-        charmander = player_pokemon
-
-        level = 99
-        player_pokemon = Pokemon('Charizard', level, -40, 120)
-        player_pokemon.set_moves()
-        player_pokemon.current_hp = 1
-        player_pokemon.size = 320
-        player_pokemon.set_sprite('back_default')
-        player_pokemon.hp_x = 275
-        player_pokemon.hp_y = 250
-
-        show_charmander = True
-        alpha = 0
-        while alpha < 255:
-            game.fill(white)
-            if show_charmander:
-                charmander.draw(alpha=255 - alpha)
-            else:
-                player_pokemon.draw(alpha=alpha)
-            show_charmander = not show_charmander
-            rival_pokemon.draw()
+            clear_message()
+            show_pokemons(rival_pokemon, hp=False)
             rival_pokemon.draw_hp()
-            # player_pokemon.draw_hp()
-            pygame.display.update()
-            alpha += 1
+            flicker(charmander, player_pokemon, flicker_duration)
 
-        player_pokemon.draw()
-        rival_pokemon.draw()
-        player_pokemon.draw_hp()
-        rival_pokemon.draw_hp()
-        pygame.display.update()
+            show_pokemons(player_pokemon, rival_pokemon)
+            renderer.present()
 
-        display_message("ヒトカゲは　リザードンに　しんかした！")
-        waitFor(3000)
-
-        player_pokemon.perform_attack(rival_pokemon, player_pokemon.moves[0])
-        waitFor(1000)
-        if rival_pokemon.current_hp == 0:
-            game_status = 'fainted'
+            display_message("ヒトカゲは　リザードンに　しんかした！")
+            waitFor(3000)
 
-    # one of the pokemons fainted
-    if game_status == 'fainted':
+            play_turn(battle, ('attack', 0))
+            waitFor(1000)
+            if battle.winner is not None:
+                game_status = 'fainted'
+            else:
+                game_status = 'rival turn'
 
-        alpha = 255
-        while alpha > 0:
+        # one of the pokemons fainted
+        if game_status == 'fainted':
 
-            game.fill(white)
-            player_pokemon.draw_hp()
-            rival_pokemon.draw_hp()
+            show_pokemons(player_pokemon, rival_pokemon)
 
             # determine which pokemon fainted
             if rival_pokemon.current_hp == 0:
-                player_pokemon.draw()
-                rival_pokemon.draw(alpha)
                 if rival_pokemon.name == 'Bulbasaur':
                     display_message("てきの　フシギダネ　は　たおれた！")
                 elif rival_pokemon.name == 'Charmander':
                     display_message("てきの　ヒトカゲ　は　たおれた！")
                 elif rival_pokemon.name == 'Squirtle':
                     display_message("てきの　ゼニガメ　は　たおれた！")
+                fade(rival_pokemon, faint_duration, fade_in=False)
             else:
-                player_pokemon.draw(alpha)
-                rival_pokemon.draw()
                 if player_pokemon.name == 'Bulbasaur':
                     display_message("フシギダネ　は　たおれた！")
                 elif player_pokemon.name == 'Charmander':
                     display_message("ヒトカゲ　は　たおれた！")
                 elif player_pokemon.name == 'Squirtle':
                     display_message("ゼニガメ　は　たおれた！")
-            alpha -= .4
+                fade(player_pokemon, faint_duration, fade_in=False)
+
+            game_status = 'gameover'
+
+        # gameover screen
+        if game_status == 'gameover':
+            if is_battle_music_playing:
+                pygame.mixer.music.stop()
+                is_battle_music_playing = False
+                play_music(win_sound, 0)
 
-            pygame.display.update()
+            display_message('もういちど　たたかいますか？ (Y/N)?')
 
-        game_status = 'gameover'
+        # keep the window responsive at a fixed frame rate while julius listens
+        renderer.present()
+        renderer.tick()
 
-    # gameover screen
-    if game_status == 'gameover':
-        if is_battle_music_playing:
-            pygame.mixer.music.stop()
-            is_battle_music_playing = False
-            pygame.mixer.music.load(win_sound)
-            pygame.mixer.music.play(0)
+    recognizer.close()
+    prefetcher.close()
+    print(f"文字キャッシュ: hits {typography.hits}, misses {typography.misses}")  # デバッグ用出力
+    pygame.quit()
 
-        display_message('もういちど　たたかいますか？ (Y/N)?')
 
-pygame.quit()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# background loads running at once (they mostly wait on the network or the disk)
+default_max_workers = 2
+
+
+class Prefetcher():
+    """
+    Keyed background loads for the game states to come.
+
+    prefetch(key, function, *args) starts function(*args) on a worker thread
+    unless `key` is already loading or loaded; get() with the same arguments
+    returns its result, waiting only for whatever is still in flight, or runs
+    it right away if nobody prefetched it. A load that failed is started again
+    on the next prefetch() or get().
+    """
+
+    def __init__(self, max_workers=default_max_workers):
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def prefetch(self, key, function, *args):
+
+        with self.lock:
+            future = self.futures.get(key)
+            if future is None or (future.done() and future.exception() is not None):
+                future = self.executor.submit(function, *args)
+                self.futures[key] = future
+            return future
+
+    def ready(self, key):
+
+        future = self.futures.get(key)
+        return future is not None and future.done()
+
+    def get(self, key, function, *args):
+
+        return self.prefetch(key, function, *args).result()
+
+    def close(self):
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def read_file(path):
+
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+# background loads shared by the whole game
+prefetcher = Prefetcher()
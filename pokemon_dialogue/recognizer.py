@@ -0,0 +1,275 @@
+import os
+import re
+import socket
+import subprocess
+import threading
+import time
+
+import pygame
+
+# Julius の設定
+default_jconf = 'dialogue-demo/asr/grammar-mic.jconf'
+default_grammar_dir = 'dialogue-demo/asr/grammar'
+default_port = 10500
+
+# grammars available in default_grammar_dir
+grammars = ['pokemon', 'pokemon_select', 'pokemon_turn', 'pokemon_move', 'attendant', 'maid', 'introduction']
+
+# module mode output, eg. <WHYPO WORD="ヒトカゲ" CLASSID="1" PHONE="h i t o k a g e" CM="0.873"/>
+whypo_pattern = re.compile(r'<WHYPO WORD="([^"]*)".*?CM="([0-9.]+)"')
+
+# pygame events posted by the recognizer
+# ASR_RESULT has .text (None if Julius exited), .confidence and .grammar
+ASR_RESULT = pygame.event.custom_type()
+ASR_TIMEOUT = pygame.event.custom_type()
+
+
+def post_pygame_event(event_type, **attributes):
+
+    pygame.event.post(pygame.event.Event(event_type, **attributes))
+
+
+class JuliusRecognizer():
+    """
+    One long-lived Julius process in module mode (the protocol jcontrol speaks).
+
+    The acoustic model and grammar are loaded once in start(); afterwards input
+    is paused between turns, resumed for each listen() and the active grammar
+    is swapped with CHANGEGRAM only when a different one is requested.
+
+    listen() does not block: a reader thread parses Julius' messages and hands
+    the result to `on_event` (by default posted as a pygame ASR_RESULT event),
+    so the game loop keeps drawing and handling QUIT while the user speaks.
+    """
+
+    def __init__(self, jconf=default_jconf, grammar_dir=default_grammar_dir, grammar='pokemon',
+                 host='localhost', port=default_port, on_event=post_pygame_event):
+
+        self.jconf = jconf
+        self.grammar_dir = grammar_dir
+        self.host = host
+        self.port = port
+
+        # the grammar the jconf file loads at startup
+        self.grammar = grammar
+
+        self.on_event = on_event
+
+        self.process = None
+        self.sock = None
+        self.reader = None
+        self.reader_thread = None
+
+        # socket writes and the listening flag are shared with the reader thread
+        self.lock = threading.RLock()
+        self.listening = False
+        self.timer = None
+
+    def start(self, connect_timeout=30):
+
+        if self.process is not None:
+            return
+
+        julius_command = [
+            "julius",
+            "-C",
+            self.jconf,
+            "-input",
+            "mic",
+            "-module",
+            str(self.port)
+        ]
+        self.process = subprocess.Popen(
+            julius_command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+        # Julius only opens the port once the models are loaded
+        deadline = time.time() + connect_timeout
+        while True:
+            try:
+                self.sock = socket.create_connection((self.host, self.port))
+                break
+            except OSError:
+                if self.process.poll() is not None or time.time() > deadline:
+                    self.close()
+                    raise RuntimeError('Julius モジュールモードに接続できませんでした')
+                time.sleep(0.2)
+
+        self.reader = self.sock.makefile('r', encoding='utf-8', errors='replace')
+
+        # do not recognize anything until somebody listens
+        self.pause()
+
+        self.reader_thread = threading.Thread(target=self.read_loop, args=(self.reader,), daemon=True)
+        self.reader_thread.start()
+
+    def send(self, command):
+
+        with self.lock:
+            self.sock.sendall(command.encode('utf-8') + b'\n')
+
+    def pause(self):
+
+        self.send('PAUSE')
+
+    def resume(self):
+
+        self.send('RESUME')
+
+    def terminate(self):
+
+        # like pause, but drop the utterance that is being recognized
+        self.send('TERMINATE')
+
+    def use_grammar(self, name):
+
+        self.start()
+        if name == self.grammar:
+            return
+
+        # CHANGEGRAM replaces every grammar of the process with the .dfa/.dict we send
+        prefix = os.path.join(self.grammar_dir, name)
+        with open(f'{prefix}.dfa', 'rb') as dfa:
+            dfa_data = dfa.read().replace(b'\r\n', b'\n').rstrip(b'\n') + b'\n'
+        with open(f'{prefix}.dict', 'rb') as dict_file:
+            dict_data = dict_file.read().replace(b'\r\n', b'\n').rstrip(b'\n') + b'\n'
+
+        with self.lock:
+            self.send(f'CHANGEGRAM {name}')
+            self.sock.sendall(dfa_data)
+            self.send('DFAEND')
+            self.sock.sendall(dict_data)
+            self.send('DICEND')
+
+        self.grammar = name
+
+    def read_message(self, reader):
+        """ Read one module message (the lines up to a single '.'), or None if Julius exited """
+
+        lines = []
+        while True:
+            try:
+                line = reader.readline()
+            except (OSError, ValueError):
+                line = ''
+            if not line:
+                return None
+            line = line.strip()
+            if line == '.':
+                return lines
+            lines.append(line)
+
+    def parse_recogout(self, lines):
+
+        words = []
+        confidences = []
+        for line in lines:
+            match = whypo_pattern.search(line)
+            if match and match.group(1):
+                words.append(match.group(1))
+                confidences.append(float(match.group(2)))
+
+            # only the best hypothesis
+            if line.startswith('</SHYPO>'):
+                break
+
+        confidence = sum(confidences) / len(confidences) if confidences else 0.0
+        return ' '.join(words), confidence
+
+    def read_loop(self, reader):
+
+        while True:
+            lines = self.read_message(reader)
+
+            # Julius exited: report it to whoever is listening
+            if lines is None:
+                with self.lock:
+                    was_listening = self.stop_listening()
+                if was_listening:
+                    self.on_event(ASR_RESULT, text=None, confidence=0.0, grammar=self.grammar)
+                return
+
+            if not lines or not lines[0].startswith('<RECOGOUT>'):
+                continue
+
+            with self.lock:
+                if not self.listening:
+                    # the listen was cancelled while this utterance was being decoded
+                    continue
+                self.stop_listening()
+                self.pause()
+
+            text, confidence = self.parse_recogout(lines)
+            self.on_event(ASR_RESULT, text=text, confidence=confidence, grammar=self.grammar)
+
+    def stop_listening(self):
+        """ Clear the listening state (call with the lock held), return whether it was set """
+
+        was_listening = self.listening
+        self.listening = False
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        return was_listening
+
+    def listen(self, grammar=None, timeout=None):
+        """ Start listening for one utterance (timeout in milliseconds), the result arrives as an ASR_RESULT event """
+
+        if self.process is not None and self.process.poll() is not None:
+            # Julius died since the last turn, start a fresh one
+            self.close()
+
+        self.start()
+        if grammar is not None:
+            self.use_grammar(grammar)
+
+        with self.lock:
+            self.stop_listening()
+            self.listening = True
+            if timeout is not None:
+                self.timer = threading.Timer(timeout / 1000, self.time_out)
+                self.timer.daemon = True
+                self.timer.start()
+            self.resume()
+
+    def cancel(self):
+
+        with self.lock:
+            if self.stop_listening() and self.sock is not None:
+                self.terminate()
+
+    def time_out(self):
+
+        with self.lock:
+            if not self.listening:
+                return
+            self.cancel()
+        self.on_event(ASR_TIMEOUT, grammar=self.grammar)
+
+    def close(self):
+
+        with self.lock:
+            self.stop_listening()
+
+        if self.sock is not None:
+            try:
+                self.send('DIE')
+            except OSError:
+                pass
+            self.sock.close()
+            self.sock = None
+            self.reader = None
+
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=3)
+            except subprocess.TimeoutExpired:
+                self.process.terminate()
+                self.process.wait()
+            self.process = None
+
+
+# recognizer shared by every game state
+recognizer = JuliusRecognizer()
@@ -0,0 +1,214 @@
+import json
+import os
+import threading
+
+from pokemon_dialogue.api_cache import api_cache, default_cache_path
+
+# parsed records live next to the api cache (can be overridden with an environment variable)
+default_records_path = os.environ.get(
+    'POKEMON_DIALOGUE_RECORDS',
+    os.path.join(os.path.dirname(os.path.abspath(default_cache_path)), 'records.json'))
+
+# bump when the record layout changes, older files are ignored
+records_version = 1
+
+
+class Species():
+    """ What the battle needs from a /pokemon/{name} payload, without the payload """
+
+    __slots__ = ('name', 'hp', 'attack', 'defense', 'speed', 'types', 'learnset', 'sprites')
+
+    def __init__(self, name, hp, attack, defense, speed, types, learnset, sprites):
+
+        self.name = name
+        self.hp = hp
+        self.attack = attack
+        self.defense = defense
+        self.speed = speed
+        self.types = tuple(types)
+
+        # (level learned at, move url) of the red-blue level-up moves, in API order
+        self.learnset = tuple((level, url) for level, url in learnset)
+
+        # {'front_default': url, 'back_default': url}
+        self.sprites = sprites
+
+    @classmethod
+    def from_json(cls, json):
+
+        # get the pokemon's stats from the API
+        stats = {}
+        for stat in json['stats']:
+            stats[stat['stat']['name']] = stat['base_stat']
+
+        # set the pokemon's types
+        types = [type['type']['name'] for type in json['types']]
+
+        learnset = []
+        for move in json['moves']:
+
+            # get the move from different game versions
+            for version in move['version_group_details']:
+
+                # only get moves from red-blue version
+                if version['version_group']['name'] != 'red-blue':
+                    continue
+
+                # only get moves that can be learned from leveling up (ie. exclude TM moves)
+                if version['move_learn_method']['name'] != 'level-up':
+                    continue
+
+                learnset.append((version['level_learned_at'], move['move']['url']))
+
+        sprites = {side: json['sprites'][side] for side in ('front_default', 'back_default')}
+        return cls(json['name'], stats['hp'], stats['attack'], stats['defense'], stats['speed'],
+                   types, learnset, sprites)
+
+    def learnable_move_urls(self, level):
+
+        # add move if pokemon level is high enough
+        return [url for level_learned, url in self.learnset if level >= level_learned]
+
+    def to_record(self):
+
+        return [self.name, self.hp, self.attack, self.defense, self.speed,
+                list(self.types), [list(move) for move in self.learnset], self.sprites]
+
+    @classmethod
+    def from_record(cls, record):
+
+        return cls(*record)
+
+
+class Move():
+    """ A move's name, power (None for status moves) and type """
+
+    __slots__ = ('name', 'power', 'type')
+
+    def __init__(self, name, power, type):
+
+        self.name = name
+        self.power = power
+        self.type = type
+
+    @classmethod
+    def from_json(cls, json):
+
+        return cls(json['name'], json['power'], json['type']['name'])
+
+    def to_record(self):
+
+        return [self.name, self.power, self.type]
+
+    @classmethod
+    def from_record(cls, record):
+
+        return cls(*record)
+
+
+class RecordStore():
+    """
+    Species and moves parsed once per url and shared read-only.
+
+    Every payload is parsed the first time its url is asked for and the raw
+    JSON is dropped right away; the records are memoized in memory and written
+    to a small JSON file, so the next start does not even read the payloads.
+    """
+
+    def __init__(self, path=default_records_path):
+
+        self.path = path
+        self.species_records = {}
+        self.move_records = {}
+        self.loaded = False
+        self.lock = threading.RLock()
+
+        # number of records answered from memory / parsed from a payload
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """ Read the records file once (call with the lock held) """
+
+        if self.loaded:
+            return
+        self.loaded = True
+
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != records_version:
+            return
+
+        for url, record in data['species'].items():
+            self.species_records[url] = Species.from_record(record)
+        for url, record in data['moves'].items():
+            self.move_records[url] = Move.from_record(record)
+
+    def save(self):
+
+        with self.lock:
+            data = {
+                'version': records_version,
+                'species': {url: species.to_record() for url, species in self.species_records.items()},
+                'moves': {url: move.to_record() for url, move in self.move_records.items()},
+            }
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                temporary_path = f'{self.path}.tmp'
+                with open(temporary_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, separators=(',', ':'))
+                os.replace(temporary_path, self.path)
+            except OSError:
+                # the records are only a shortcut, the payloads are still in the api cache
+                pass
+
+    def species_many(self, urls, source=None):
+        """ Return {url: Species}, fetching the payloads that were never parsed in parallel """
+
+        with self.lock:
+            self.load()
+            # a url asked for twice in one call is one lookup
+            unique_urls = list(dict.fromkeys(urls))
+            missing = [url for url in unique_urls if url not in self.species_records]
+            self.hits += len(unique_urls) - len(missing)
+
+        if missing:
+            payloads = (source or api_cache).get_many_json(missing)
+            with self.lock:
+                for url in missing:
+                    self.species_records[url] = Species.from_json(payloads[url])
+                self.misses += len(missing)
+                self.save()
+
+        return {url: self.species_records[url] for url in urls}
+
+    def species(self, url, source=None):
+
+        return self.species_many([url], source)[url]
+
+    def moves(self, urls, source=None):
+        """ Return {url: Move}, fetching the payloads that were never parsed in parallel """
+
+        with self.lock:
+            self.load()
+            # a url asked for twice in one call is one lookup
+            unique_urls = list(dict.fromkeys(urls))
+            missing = [url for url in unique_urls if url not in self.move_records]
+            self.hits += len(unique_urls) - len(missing)
+
+        if missing:
+            payloads = (source or api_cache).get_many_json(missing)
+            with self.lock:
+                for url in missing:
+                    self.move_records[url] = Move.from_json(payloads[url])
+                self.misses += len(missing)
+                self.save()
+
+        return {url: self.move_records[url] for url in urls}
+
+
+# records shared by the whole game
+records = RecordStore()
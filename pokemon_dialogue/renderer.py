@@ -0,0 +1,145 @@
+from collections import OrderedDict
+
+import pygame
+from pygame.locals import Rect
+
+# drawing order, back to front
+default_layers = ('sprites', 'hp', 'message')
+
+# the text box at the bottom of the screen
+message_box_rect = Rect(10, 350, 480, 140)
+
+# redraw the whole screen instead once the dirty area gets this large
+full_redraw_ratio = .6
+
+# frames per second (only dirty rectangles are updated, which leaves the kiosk boards' CPU to Julius)
+default_fps = 60
+
+# fixed steps simulated at most per frame after a stall
+max_catch_up = 5
+
+
+class FrameClock():
+    """
+    Fixed timestep on top of pygame.time.Clock.
+
+    tick() sleeps until the next frame and returns how many fixed steps of
+    `step` milliseconds have elapsed since the last call, so animations
+    advance by wall-clock time rather than by how fast the loop spins.
+    """
+
+    def __init__(self, fps=default_fps):
+
+        self.fps = fps
+        self.step = 1000 / fps
+        self.clock = pygame.time.Clock()
+        self.lag = 0
+
+    def tick(self):
+
+        self.lag += self.clock.tick(self.fps)
+        steps = int(self.lag // self.step)
+        self.lag -= steps * self.step
+        return min(steps, max_catch_up)
+
+
+class Renderer():
+    """
+    Retained layers of (surface, position) items drawn with dirty rectangles.
+
+    put() and remove() only record what changed; present() repaints the
+    background and the overlapping items inside the changed rectangles and
+    hands just those rectangles to pygame.display.update(). An item put again
+    with the same surface object at the same position costs nothing.
+    """
+
+    def __init__(self, screen, background=(255, 255, 255), layers=default_layers, fps=default_fps):
+
+        self.screen = screen
+        self.background = background
+        self.layers = OrderedDict((layer, OrderedDict()) for layer in layers)
+        self.dirty = []
+        self.clock = FrameClock(fps)
+
+        # the first present() paints the whole screen
+        self.invalidate()
+
+    def invalidate(self, rect=None):
+
+        self.dirty.append(Rect(rect) if rect is not None else self.screen.get_rect())
+
+    def put(self, layer, key, surface, position):
+
+        rect = surface.get_rect(topleft=position)
+        items = self.layers[layer]
+        old = items.get(key)
+        if old is not None and old[0] is surface and old[1] == rect:
+            return
+
+        if old is not None:
+            self.invalidate(old[1])
+        self.invalidate(rect)
+        items[key] = (surface, rect)
+
+    def refresh(self, layer, key):
+
+        # the item's surface was drawn on in place
+        item = self.layers[layer].get(key)
+        if item is not None:
+            self.invalidate(item[1])
+
+    def remove(self, layer, key):
+
+        old = self.layers[layer].pop(key, None)
+        if old is not None:
+            self.invalidate(old[1])
+
+    def clear(self, *layers):
+
+        for layer in layers or self.layers:
+            for key in list(self.layers[layer]):
+                self.remove(layer, key)
+
+    def dirty_rects(self):
+        """ Merge overlapping dirty rectangles (clipped to the screen) """
+
+        screen_rect = self.screen.get_rect()
+        rects = [rect.clip(screen_rect) for rect in self.dirty]
+        rects = [rect for rect in rects if rect.width and rect.height]
+
+        merged = []
+        while rects:
+            rect = rects.pop()
+            overlapping = rect.collidelist(merged)
+            while overlapping != -1:
+                rect.union_ip(merged.pop(overlapping))
+                overlapping = rect.collidelist(merged)
+            merged.append(rect)
+
+        area = sum(rect.width * rect.height for rect in merged)
+        if area > full_redraw_ratio * screen_rect.width * screen_rect.height:
+            return [screen_rect]
+        return merged
+
+    def present(self):
+        """ Repaint the dirty rectangles and update only them on the display """
+
+        rects = self.dirty_rects()
+        self.dirty = []
+        if not rects:
+            return
+
+        for rect in rects:
+            self.screen.set_clip(rect)
+            self.screen.fill(self.background, rect)
+            for items in self.layers.values():
+                for surface, item_rect in items.values():
+                    if item_rect.colliderect(rect):
+                        self.screen.blit(surface, item_rect)
+        self.screen.set_clip(None)
+
+        pygame.display.update(rects)
+
+    def tick(self):
+
+        return self.clock.tick()
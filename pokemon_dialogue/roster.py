@@ -0,0 +1,29 @@
+# the starter pokemons and where they stand on the select screen
+level = 30
+starters = [('Bulbasaur', 25, 150), ('Charmander', 175, 150), ('Squirtle', 325, 150)]
+
+# ポケモンの名前を英語から日本語へ直す辞書
+english_to_japanese = {
+    'Bulbasaur': 'フシギダネ',
+    'Charmander':'ヒトカゲ',
+    'Squirtle': 'ゼニガメ',
+    }
+
+#わざの名前を英語から日本語へ直す辞書
+english_to_japanese_moves = {'vine-whip': 'つるのムチ',
+                             'tackle': 'たいあたり',
+                             'razor-leaf': 'はっぱカッター',
+                             'scratch': 'ひっかく',
+                             'ember': 'ひのこ',
+                             'rage': 'いかり',
+                             'slash': 'きりさく',
+                             'bite': 'かみつく',
+                             'water-gun': 'みずでっぽう',
+                             'bubble': 'あわ'}
+
+# 各状態で Julius に使わせる文法（dialogue-demo/asr/grammar の pokemon 文法をその状態で通じる文に絞ったもの）
+state_grammars = {
+    'select pokemon': 'pokemon_select',
+    'player turn': 'pokemon_turn',
+    'player move': 'pokemon_move',
+    }
@@ -0,0 +1,431 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+
+from pokemon_dialogue.api_cache import api_cache
+from pokemon_dialogue.battle import Battle, Combatant, Evolution, base_url, rival_handicap
+from pokemon_dialogue.records import records
+from pokemon_dialogue.roster import english_to_japanese, english_to_japanese_moves, level, starters, state_grammars
+
+default_host = 'localhost'
+default_port = 8766
+
+# sounds the client plays (same files as the game)
+vs_sound = "pokemon_dialogue/vstrainer.wav"
+win_sound = "pokemon_dialogue/winpokemon.wav"
+
+# わざのボタンの位置で選ぶときのキーワード（ゲームと同じ）
+move_keywords = [('つるのムチ', 'ひっかく'), ('ひのこ', 'かみつく'),
+                 ('はっぱカッター', 'いかり', 'みずでっぽう'), ('きりさく', 'あわ')]
+
+
+class SessionPokemon(Combatant):
+    """ Combatant with the position, sprite and hp bar the client draws it with """
+
+    def __init__(self, name, level, x, y, species, size=150, side='front_default'):
+
+        Combatant.__init__(self, name, level, species)
+
+        self.x = x
+        self.y = y
+        self.size = size
+        self.side = side
+
+        # where the hp bar is drawn
+        self.hp_x = 0
+        self.hp_y = 0
+
+    def sprite(self):
+
+        return {'name': self.name, 'url': self.species.sprites[self.side], 'side': self.side,
+                'size': self.size, 'x': self.x, 'y': self.y}
+
+    def hp_bar(self):
+
+        return {'name': self.name, 'hp': self.current_hp, 'max_hp': self.max_hp, 'x': self.hp_x, 'y': self.hp_y}
+
+
+class BattleData():
+    """
+    Species, moves and the evolution template shared read-only by every session.
+
+    Sessions only copy Combatants out of it, so one load serves any number of
+    booths; nothing here is changed after load().
+    """
+
+    def __init__(self, species, moves, evolution):
+
+        self.species = species
+        self.moves = moves
+        self.evolution = evolution
+
+    @classmethod
+    def load(cls, source=None, api_url=base_url):
+
+        names = [name for name, _, _ in starters] + ['Charizard']
+        urls = [f'{api_url}/pokemon/{name.lower()}' for name in names]
+        species = records.species_many(urls, source or api_cache)
+        species = {name: species[url] for name, url in zip(names, urls)}
+
+        # every move the starters and リザードン can learn, parsed once for all sessions
+        move_urls = []
+        for name in names:
+            move_urls.extend(species[name].learnable_move_urls(99 if name == 'Charizard' else level))
+        moves = records.moves(move_urls, source or api_cache)
+
+        # ヒトカゲ → リザードン（レベル 99、HP 1 で復活）
+        charizard = SessionPokemon('Charizard', 99, -40, 120, species['Charizard'], 320, 'back_default')
+        charizard.hp_x = 275
+        charizard.hp_y = 250
+        charizard.set_moves(moves)
+
+        return cls(species, moves, Evolution(charizard))
+
+
+def attack_message(pokemon, move):
+
+    try:
+        return f'{english_to_japanese[pokemon.name]}の　{english_to_japanese_moves[move.name]}　攻撃！'
+    except KeyError:
+        return 'リザードンは　ほのおのうずを　はいた！'
+
+
+def move_label(move):
+
+    return english_to_japanese_moves.get(move.name, move.name.capitalize())
+
+
+class BattleSession():
+    """
+    One booth's game without a window.
+
+    The states and messages are the ones of pokemon.main(); hear() takes a
+    recognized utterance and returns the events the client has to play until
+    it needs to listen again: 'scene' (sprites and hp bars to draw), 'hp' (a
+    bar to drain), 'message' (text to show and speak, `duration` is how long
+    the game waited on it), 'fade', 'buttons', 'sound', 'listen' (the grammar
+    to recognize with next) and 'gameover'.
+    """
+
+    def __init__(self, data, seed=None):
+
+        self.data = data
+        self.rng = random.Random(seed)
+
+        self.status = None
+        self.pokemons = []
+        self.player = None
+        self.rival = None
+        self.battle = None
+        self.events = []
+
+    def emit(self, event, **fields):
+
+        self.events.append(dict(event=event, **fields))
+
+    def scene(self, *pokemons, hp=True):
+
+        self.emit('scene', sprites=[pokemon.sprite() for pokemon in pokemons],
+                  hp=[pokemon.hp_bar() for pokemon in pokemons] if hp else [])
+
+    def message(self, text, duration=0):
+
+        self.emit('message', text=text, duration=duration)
+
+    def flush(self):
+
+        events = self.events
+        self.events = []
+        return events
+
+    def start(self):
+        """ New starters and the select screen (also how a booth plays again) """
+
+        self.pokemons = [SessionPokemon(name, level, x, y, self.data.species[name])
+                         for name, x, y in starters]
+        self.player = None
+        self.rival = None
+        self.battle = None
+
+        self.status = 'select pokemon'
+        self.scene(*self.pokemons, hp=False)
+        self.emit('listen', grammar=state_grammars[self.status])
+        return self.flush()
+
+    def hear(self, text):
+
+        if self.status == 'select pokemon':
+            self.select(text)
+        elif self.status == 'player turn':
+            if "たたかう" in text or "いけ" in text or any(name in text for name in english_to_japanese.values()):
+                self.prompt_move()
+            elif "かいふく" in text:
+                self.use_potion()
+        elif self.status == 'player move':
+            self.choose_move(text)
+
+        # nothing matched: listen again with the same grammar
+        if self.status in state_grammars and not any(event['event'] == 'listen' for event in self.events):
+            self.emit('listen', grammar=state_grammars[self.status])
+        return self.flush()
+
+    def select(self, text):
+
+        for i, (name, _, _) in enumerate(starters):
+            if english_to_japanese[name] in text:
+                self.player = self.pokemons[i]
+                self.rival = self.pokemons[(i + 1) % len(self.pokemons)]
+                break
+        else:
+            return
+
+        # lower the rival pokemon's level to make the battle easier
+        self.rival.level = int(self.rival.level * rival_handicap)
+        self.player.hp_x, self.player.hp_y = 275, 250
+        self.rival.hp_x, self.rival.hp_y = 50, 50
+
+        # prebattle: moves come from the shared records, the pokemons take their battle places
+        self.emit('sound', path=vs_sound, loops=-1)
+        for pokemon in (self.player, self.rival):
+            pokemon.set_moves(self.data.moves, self.rng)
+        self.player.x, self.player.y, self.player.size, self.player.side = -50, 100, 300, 'back_default'
+        self.rival.x, self.rival.y, self.rival.size, self.rival.side = 250, -50, 300, 'front_default'
+
+        self.battle = Battle(self.player, self.rival, rng=self.rng,
+                             evolutions={'Charmander': self.data.evolution})
+
+        # start battle: the rival and then the player send out their pokemon
+        self.scene()
+        self.message(f'ライバルは　{english_to_japanese[self.rival.name]}を　くりだした！', 1000)
+        self.emit('fade', name=self.rival.name, fade_in=True)
+        self.message(f'ゆけっ！　{english_to_japanese[self.player.name]}！')
+        self.emit('fade', name=self.player.name, fade_in=True)
+        self.scene(self.player, self.rival)
+        self.message('', 1000)
+
+        if self.battle.turn == 'rival':
+            self.rival_turn()
+        else:
+            self.prompt_turn()
+
+    def prompt_turn(self):
+
+        self.status = 'player turn'
+        self.scene(self.player, self.rival)
+        self.message(f'{english_to_japanese.get(self.player.name, self.player.name)}は　どうする？（たたかう　かいふく）')
+        self.emit('listen', grammar=state_grammars[self.status])
+
+    def prompt_move(self):
+
+        self.status = 'player move'
+        self.scene(self.player, self.rival)
+        self.message("ポケモンに指示を出すんだ！！！", 1500)
+
+        # one button label per move
+        labels = [move_label(move) for move in self.player.moves]
+        self.emit('buttons', labels=labels + [' '] * (4 - len(labels)))
+        self.emit('listen', grammar=state_grammars[self.status])
+
+    def use_potion(self):
+
+        # force to attack if there are no more potions
+        if self.player.num_potions == 0:
+            self.message('キズぐすりが　ありません', 500)
+            self.prompt_move()
+            return
+
+        self.play_turn(('potion',))
+        self.message('キズぐすりを　つかった！', 500)
+        self.rival_turn()
+
+    def choose_move(self, text):
+
+        # the move whose label was said, else the game's keywords for each button
+        for i, move in enumerate(self.player.moves):
+            if move_label(move) in text:
+                break
+        else:
+            for i, keywords in enumerate(move_keywords[:len(self.player.moves)]):
+                if any(keyword in text for keyword in keywords):
+                    break
+            else:
+                return
+
+        self.play_turn(('attack', i))
+        self.rival_turn()
+
+    def play_turn(self, action=None):
+
+        for event in self.battle.step(action):
+            if event.kind == 'attack':
+                self.message(attack_message(event.actor, event.move), 2000)
+                self.emit('hp', **event.target.hp_bar())
+            elif event.kind == 'potion':
+                self.emit('hp', **event.actor.hp_bar())
+
+    def rival_turn(self):
+
+        self.status = 'rival turn'
+
+        # check if the rival's pokemon fainted
+        if self.battle.winner is not None:
+            self.fainted()
+            return
+
+        self.scene(self.player, self.rival)
+        self.message('', 2000)
+        self.play_turn()
+
+        # check if the player's pokemon fainted (ヒトカゲ evolves instead)
+        if self.battle.player is not self.player:
+            self.evolution()
+        elif self.battle.winner is not None:
+            self.fainted()
+        else:
+            self.prompt_turn()
+
+    def evolution(self):
+
+        self.status = 'evolution'
+        charmander = self.player
+        self.player = self.battle.player
+
+        self.scene(self.rival, charmander)
+        self.emit('fade', name=charmander.name, fade_in=False)
+        self.scene()
+        self.message("おや？ ヒトカゲのようすが・・・？？？", 2000)
+        self.scene(self.rival)
+        self.emit('flicker', old=charmander.sprite(), new=self.player.sprite())
+        self.scene(self.player, self.rival)
+        self.message("ヒトカゲは　リザードンに　しんかした！", 3000)
+
+        self.play_turn(('attack', 0))
+        if self.battle.winner is not None:
+            self.fainted()
+        else:
+            self.rival_turn()
+
+    def fainted(self):
+
+        self.status = 'gameover'
+        self.scene(self.player, self.rival)
+
+        if self.rival.current_hp == 0:
+            self.message(f'てきの　{english_to_japanese[self.rival.name]}　は　たおれた！')
+            self.emit('fade', name=self.rival.name, fade_in=False)
+        else:
+            self.message(f'{english_to_japanese.get(self.player.name, self.player.name)}　は　たおれた！')
+            self.emit('fade', name=self.player.name, fade_in=False)
+
+        self.emit('sound', path=win_sound, loops=0)
+        self.message('もういちど　たたかいますか？ (Y/N)?')
+        self.emit('gameover', winner=self.battle.winner)
+
+
+class BattleServer():
+    """
+    Many booths in one asyncio process, one session per connection.
+
+    The protocol is one JSON object per line each way. Clients send
+    {"type": "utterance", "text": "ヒトカゲ"} for every recognition result,
+    {"type": "restart"} to play again and {"type": "quit"}; the server answers
+    each with the list of events of BattleSession, one per line, the first
+    being {"event": "session", "id": n}. Sessions share the BattleData, so
+    a booth costs a few Combatants and not a copy of the caches.
+    """
+
+    def __init__(self, data):
+
+        self.data = data
+        self.sessions = {}
+        self.ids = itertools.count(1)
+
+    async def send(self, writer, events):
+
+        writer.write(b''.join(json.dumps(event, ensure_ascii=False).encode('utf-8') + b'\n'
+                              for event in events))
+        await writer.drain()
+
+    async def handle_client(self, reader, writer):
+
+        session_id = next(self.ids)
+        session = BattleSession(self.data)
+        self.sessions[session_id] = session
+
+        try:
+            await self.send(writer, [{'event': 'session', 'id': session_id}] + session.start())
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                try:
+                    request = json.loads(line)
+                    kind = request['type']
+                except (ValueError, KeyError, TypeError):
+                    await self.send(writer, [{'event': 'error', 'reason': 'bad request'}])
+                    continue
+
+                if kind == 'utterance':
+                    events = session.hear(str(request.get('text', '')))
+                elif kind == 'restart':
+                    events = session.start()
+                elif kind == 'quit':
+                    break
+                else:
+                    events = [{'event': 'error', 'reason': f'unknown request type {kind!r}'}]
+                await self.send(writer, events)
+
+        except ConnectionError:
+            pass
+        finally:
+            del self.sessions[session_id]
+            writer.close()
+            try:
+                # let the transport flush and close before the handler returns
+                await writer.wait_closed()
+            except ConnectionError:
+                # the booth already went away
+                pass
+
+    async def serve(self, host=default_host, port=default_port, path=None):
+
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path)
+            print(f'battle server: {path}')
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+            print(f'battle server: {host}:{port}')
+
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Battle sessions for many booths over a local socket')
+    parser.add_argument('--host', default=default_host)
+    parser.add_argument('--port', type=int, default=default_port)
+    parser.add_argument('--unix', help='listen on a unix socket instead of TCP')
+    parser.add_argument('--snapshot', help='read the pokemons from a pokeapi_local snapshot instead of the api')
+    parser.add_argument('--api-url', default=base_url, help='PokeAPI base url, eg. a pokeapi_local server')
+    args = parser.parse_args(argv)
+
+    source = None
+    if args.snapshot is not None:
+        from pokemon_dialogue.pokeapi_local import SnapshotResolver
+        source = SnapshotResolver(args.snapshot)
+
+    # the only blocking load, before the first booth connects
+    server = BattleServer(BattleData.load(source, args.api_url))
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
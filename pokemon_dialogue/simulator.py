@@ -0,0 +1,230 @@
+import argparse
+import time
+
+import numpy as np
+
+from pokemon_dialogue.battle import crit_range, crit_threshold, load_matchup, potion_hp, rival_handicap
+from pokemon_dialogue.pokeapi_local import SnapshotResolver
+
+# the same pairs the game uses when the player picks a starter
+starter_matchups = [('Bulbasaur', 'Charmander'), ('Charmander', 'Squirtle'), ('Squirtle', 'Bulbasaur')]
+
+# winner codes
+running = 0
+player_won = 1
+rival_won = 2
+
+
+def damage_table(attacker, defender):
+    """ Damage of every move in the attacker's pool before the crit roll (same float operations as calc_damage) """
+
+    damages = []
+    for move in attacker.move_pool:
+        damage = (2 * attacker.level + 10) / 250 * attacker.attack / defender.defense * move.power
+
+        # same type attack bonus (STAB)
+        if move.type in attacker.types:
+            damage *= 1.5
+        damages.append(damage)
+
+    return np.array(damages, dtype=np.float64)
+
+
+def sample_moves(rng, n, pool_size):
+    """ Up to 4 distinct move indices per battle, like Combatant.choose_moves """
+
+    if pool_size <= 4:
+        return np.tile(np.arange(pool_size), (n, 1))
+
+    keys = rng.random((n, pool_size), dtype=np.float32)
+    return np.argpartition(keys, 4, axis=1)[:, :4]
+
+
+def pad_moves(damages, width=4):
+
+    padded = np.zeros((len(damages), width))
+    padded[:, :damages.shape[1]] = damages
+    return padded
+
+
+class SimulationResult():
+
+    def __init__(self, winners, turns, evolved, movesets):
+
+        self.winners = winners
+        self.turns = turns
+        self.evolved = evolved
+        self.movesets = movesets
+
+    @property
+    def battles(self):
+
+        return len(self.winners)
+
+    @property
+    def win_rate(self):
+
+        return np.mean(self.winners == player_won)
+
+    @property
+    def confidence(self):
+
+        # half width of the 95% interval of the win rate
+        p = self.win_rate
+        return 1.96 * np.sqrt(p * (1 - p) / self.battles)
+
+    def moveset_win_rates(self, min_battles=100):
+        """ Win rate of each distinct 4-move set the player was dealt (sets seen at least min_battles times) """
+
+        movesets, inverse = np.unique(self.movesets, return_inverse=True)
+        counts = np.bincount(inverse)
+        wins = np.bincount(inverse, weights=self.winners == player_won)
+        keep = counts >= min_battles
+        return movesets[keep], wins[keep] / counts[keep], counts[keep]
+
+
+def simulate_chunk(rng, player, rival, evolution, n, max_turns):
+
+    # damage of each battle's 4 moves: (n, 4) tables gathered from the pools
+    player_pool = damage_table(player, rival)
+    rival_pool = damage_table(rival, player)
+    player_moves = sample_moves(rng, n, len(player_pool))
+    rival_moves = sample_moves(rng, n, len(rival_pool))
+    player_damage = pad_moves(player_pool[player_moves])
+    rival_damage = pad_moves(rival_pool[rival_moves])
+    player_num_moves = np.full(n, player_moves.shape[1])
+    rival_num_moves = rival_moves.shape[1]
+
+    # moves of every battle, packed as a sorted key so identical sets compare equal
+    movesets = np.sort(player_moves, axis=1) @ (len(player_pool) ** np.arange(player_moves.shape[1]))
+
+    player_hp = np.full(n, player.max_hp, dtype=np.int64)
+    player_max_hp = np.full(n, player.max_hp, dtype=np.int64)
+    player_potions = np.full(n, player.num_potions, dtype=np.int64)
+    rival_hp = np.full(n, rival.max_hp, dtype=np.int64)
+
+    # determine who goes first
+    player_turn = np.full(n, not rival.speed > player.speed)
+    winners = np.zeros(n, dtype=np.int8)
+    turns = np.zeros(n, dtype=np.int64)
+    evolved = np.zeros(n, dtype=bool)
+
+    if evolution is not None:
+        evolved_pool = damage_table(evolution.template, rival)
+        rival_vs_evolved_pool = damage_table(rival, evolution.template)
+
+    for _ in range(max_turns):
+        active = np.flatnonzero(winners == running)
+        if len(active) == 0:
+            break
+
+        # player's turn (simple_policy): heal below 1/3 hp while potions last, else a random move
+        acting = active[player_turn[active]]
+        heal = (player_hp[acting] < player_max_hp[acting] / 3) & (player_potions[acting] > 0)
+        healing = acting[heal]
+        player_hp[healing] = np.minimum(player_hp[healing] + potion_hp, player_max_hp[healing])
+        player_potions[healing] -= 1
+
+        attacking = acting[~heal]
+        move = (rng.random(len(attacking)) * player_num_moves[attacking]).astype(np.int64)
+        damage = player_damage[attacking, move]
+        critical = rng.integers(1, crit_range + 1, len(attacking)) <= crit_threshold
+        damage = np.floor(np.where(critical, damage * 1.5, damage)).astype(np.int64)
+        rival_hp[attacking] = np.maximum(rival_hp[attacking] - damage, 0)
+
+        # rival's turn: always a random move
+        attacking = active[~player_turn[active]]
+        move = (rng.random(len(attacking)) * rival_num_moves).astype(np.int64)
+        damage = rival_damage[attacking, move]
+        critical = rng.integers(1, crit_range + 1, len(attacking)) <= crit_threshold
+        damage = np.floor(np.where(critical, damage * 1.5, damage)).astype(np.int64)
+        player_hp[attacking] = np.maximum(player_hp[attacking] - damage, 0)
+
+        turns[active] += 1
+        player_turn[active] = ~player_turn[active]
+
+        # the player's pokemon evolves instead of fainting once per battle
+        fainted = active[player_hp[active] == 0]
+        if evolution is not None:
+            evolving = fainted[~evolved[fainted]]
+            fainted = fainted[evolved[fainted]]
+            if len(evolving):
+                evolved_moves = sample_moves(rng, len(evolving), len(evolved_pool))
+                player_damage[evolving] = pad_moves(evolved_pool[evolved_moves])
+                player_num_moves[evolving] = evolved_moves.shape[1]
+                rival_damage[evolving] = pad_moves(rival_vs_evolved_pool[rival_moves[evolving]])
+                player_hp[evolving] = evolution.current_hp
+                player_max_hp[evolving] = evolution.template.max_hp
+                player_potions[evolving] = evolution.template.num_potions
+                player_turn[evolving] = True
+                evolved[evolving] = True
+
+        winners[fainted] = rival_won
+        winners[active[rival_hp[active] == 0]] = player_won
+
+    return SimulationResult(winners, turns, evolved, movesets)
+
+
+def simulate(player_name, rival_name, battles, seed=0, chunk_size=250000, max_turns=1000,
+             level=30, handicap=rival_handicap, source=None):
+    """ Simulate `battles` battles of one matchup as NumPy arrays, `chunk_size` battles at a time """
+
+    player, rival, evolutions = load_matchup(player_name, rival_name, level, handicap, source)
+    evolution = evolutions.get(player_name)
+
+    rng = np.random.default_rng(seed)
+    chunks = []
+    for start in range(0, battles, chunk_size):
+        n = min(chunk_size, battles - start)
+        chunks.append(simulate_chunk(rng, player, rival, evolution, n, max_turns))
+
+    return SimulationResult(*(np.concatenate([getattr(chunk, name) for chunk in chunks])
+                              for name in ('winners', 'turns', 'evolved', 'movesets')))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Vectorized Monte-Carlo battle simulator')
+    parser.add_argument('player', nargs='?', help='player pokemon (default: every starter matchup)')
+    parser.add_argument('rival', nargs='?', help='rival pokemon')
+    parser.add_argument('-n', '--battles', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=250000)
+    parser.add_argument('--level', type=int, default=30)
+    parser.add_argument('--handicap', type=float, default=rival_handicap)
+    parser.add_argument('--snapshot', help='read the pokemons from a pokeapi_local snapshot instead of the api')
+    args = parser.parse_args()
+
+    # one matchup needs both pokemons (without either, every starter matchup is simulated)
+    if (args.player is None) != (args.rival is None):
+        parser.error('give both the player and the rival pokemon, or neither')
+
+    source = None
+    if args.snapshot is not None:
+        source = SnapshotResolver(args.snapshot)
+
+    matchups = starter_matchups
+    if args.player is not None:
+        matchups = [(args.player.capitalize(), args.rival.capitalize())]
+
+    for player_name, rival_name in matchups:
+        start = time.time()
+        result = simulate(player_name, rival_name, args.battles, args.seed, args.chunk_size,
+                          level=args.level, handicap=args.handicap, source=source)
+        elapsed = time.time() - start
+
+        print(f'{player_name} vs {rival_name}: {result.battles} battles in {elapsed:.2f}s')
+        print(f'  win rate {result.win_rate:.4f} ± {result.confidence:.4f} (95%), '
+              f'evolutions {np.mean(result.evolved):.4f}, unfinished {np.mean(result.winners == running):.4f}')
+        print(f'  turns: average {np.mean(result.turns):.2f}, '
+              f'p10/p50/p90 {np.percentile(result.turns, 10):.0f}/{np.percentile(result.turns, 50):.0f}/'
+              f'{np.percentile(result.turns, 90):.0f}')
+
+        _, win_rates, counts = result.moveset_win_rates()
+        if len(win_rates):
+            print(f'  win rate over {len(win_rates)} player movesets: min {win_rates.min():.4f}, '
+                  f'median {np.median(win_rates):.4f}, max {win_rates.max():.4f}')
+
+
+if __name__ == '__main__':
+    main()
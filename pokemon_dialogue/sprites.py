@@ -0,0 +1,79 @@
+import io
+from collections import OrderedDict
+
+import pygame
+
+from pokemon_dialogue.api_cache import api_cache
+
+default_max_surfaces = 32
+
+
+class SpriteStore():
+    """
+    Pre-decoded, pre-scaled sprite surfaces keyed by (pokemon, side, size).
+
+    The raw PNG bytes live on disk in the api cache, the decoded and scaled
+    surfaces live in memory and the least recently used ones are dropped once
+    there are more than `max_surfaces`. The unscaled decode of a sprite is kept
+    under size None so that rescaling never decodes the PNG again.
+    """
+
+    def __init__(self, cache=api_cache, max_surfaces=default_max_surfaces):
+
+        self.cache = cache
+        self.max_surfaces = max_surfaces
+        self.surfaces = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def remember(self, key, surface):
+
+        self.surfaces[key] = surface
+        self.surfaces.move_to_end(key)
+        while len(self.surfaces) > self.max_surfaces:
+            self.surfaces.popitem(last=False)
+
+    def decode(self, name, side, url):
+
+        key = (name, side, None)
+        if key in self.surfaces:
+            self.surfaces.move_to_end(key)
+            return self.surfaces[key]
+
+        image_stream = self.cache.get_bytes(url)
+        image_file = io.BytesIO(image_stream)
+        surface = pygame.image.load(image_file).convert_alpha()
+        self.remember(key, surface)
+        return surface
+
+    def get(self, name, side, size, url):
+        """ Return the sprite of the pokemon scaled to `size` pixels wide (shared, do not draw on it) """
+
+        key = (name, side, size)
+        if key in self.surfaces:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return self.surfaces[key]
+
+        self.misses += 1
+        image = self.decode(name, side, url)
+
+        # scale the image
+        scale = size / image.get_width()
+        new_width = image.get_width() * scale
+        new_height = image.get_height() * scale
+        surface = pygame.transform.scale(image, (new_width, new_height))
+
+        self.remember(key, surface)
+        return surface
+
+    def prebuild(self, sprites):
+        """ Decode and scale a list of (name, side, size, url) ahead of time """
+
+        for name, side, size, url in sprites:
+            self.get(name, side, size, url)
+
+
+# sprites shared by the whole game
+sprite_store = SpriteStore()
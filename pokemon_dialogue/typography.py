@@ -0,0 +1,59 @@
+from collections import OrderedDict
+
+import pygame
+
+black = (0, 0, 0)
+
+# 日本語対応フォント
+default_font_path = "PixelMplus-20130602/PixelMplus12-Regular.ttf"
+
+# rendered text surfaces kept in memory
+default_max_texts = 256
+
+
+class Typography():
+    """
+    Loaded fonts and rendered text surfaces.
+
+    Each (path, size) font is loaded from disk once. Rendered text is kept in
+    an LRU keyed by (text, size, color, path) so the same message or button
+    label is rasterized once; the returned surfaces are shared, do not draw on
+    them. `hits` and `misses` count render() calls answered from the LRU or
+    rasterized.
+    """
+
+    def __init__(self, default_path=default_font_path, max_texts=default_max_texts):
+
+        self.default_path = default_path
+        self.max_texts = max_texts
+        self.fonts = {}
+        self.texts = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, size, path=None):
+
+        key = (path or self.default_path, size)
+        if key not in self.fonts:
+            self.fonts[key] = pygame.font.Font(*key)
+        return self.fonts[key]
+
+    def render(self, text, size, color=black, path=None):
+
+        key = (text, size, color, path or self.default_path)
+        if key in self.texts:
+            self.hits += 1
+            self.texts.move_to_end(key)
+            return self.texts[key]
+
+        self.misses += 1
+        surface = self.font(size, path).render(text, True, color)
+        self.texts[key] = surface
+        while len(self.texts) > self.max_texts:
+            self.texts.popitem(last=False)
+        return surface
+
+
+# fonts and text shared by the whole game
+typography = Typography()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the speaker identification scripts import each other as top-level modules (import htk, from spkid import ...)
+sid_bin = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dialogue-demo', 'sid', 'bin')
+if sid_bin not in sys.path:
+    sys.path.insert(0, sid_bin)
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+from pokemon_dialogue.api_cache import LazyApiCache
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_does_not_open_the_cache(tmp_path):
+
+    env = dict(os.environ, HOME=str(tmp_path), PYTHONPATH=root)
+    env.pop('POKEMON_DIALOGUE_CACHE', None)
+    env.pop('POKEMON_DIALOGUE_RECORDS', None)
+    subprocess.run([sys.executable, '-c', 'import pokemon_dialogue.battle, pokemon_dialogue.pokeapi_local'],
+                   env=env, check=True)
+    assert not os.path.exists(tmp_path / '.cache')
+
+
+def test_opened_on_first_use(tmp_path):
+
+    path = tmp_path / 'cache' / 'pokeapi.sqlite3'
+    cache = LazyApiCache(path=str(path), offline=True)
+    assert not path.parent.exists()
+
+    cache.store('https://pokeapi.test/api/v2/pokemon/1', b'{"name": "bulbasaur"}')
+    assert path.exists()
+    assert cache.get_json('https://pokeapi.test/api/v2/pokemon/1') == {'name': 'bulbasaur'}
+    assert cache.hits == 1 and cache.get() is cache.instance
+    cache.close()
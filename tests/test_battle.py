@@ -0,0 +1,91 @@
+import random
+import sys
+
+import pytest
+
+from pokemon_dialogue import battle
+from pokemon_dialogue.records import Move, Species
+
+move_url = 'https://pokeapi.test/api/v2/move/{}'
+
+moves = {
+    move_url.format(1): Move('scratch', 40, 'normal'),
+    move_url.format(2): Move('ember', 40, 'fire'),
+    move_url.format(3): Move('growl', None, 'normal'),
+    move_url.format(4): Move('slash', 70, 'normal'),
+    move_url.format(5): Move('flamethrower', 90, 'fire'),
+    move_url.format(6): Move('tackle', 35, 'normal'),
+    move_url.format(7): Move('bubble', 20, 'water'),
+    move_url.format(8): Move('water-gun', 40, 'water'),
+}
+
+
+def species(name, stats, types, move_ids):
+
+    learnset = [(1 + 5 * i, move_url.format(m)) for i, m in enumerate(move_ids)]
+    return Species(name, *stats, types, learnset, {'front_default': None, 'back_default': None})
+
+
+def combatant(name, level, stats, types, move_ids):
+
+    pokemon = battle.Combatant(name, level, species(name.lower(), stats, types, move_ids))
+    pokemon.set_moves(moves, rng=random.Random(0))
+    return pokemon
+
+
+def matchup():
+
+    # a weaker player, so that some battles are only won by evolving
+    player = combatant('Charmander', 20, (39, 52, 43, 65), ['fire'], [1, 2, 3, 4, 5])
+    rival = combatant('Squirtle', 30, (44, 48, 65, 43), ['water'], [6, 3, 7, 8])
+    charizard = combatant('Charizard', 99, (78, 84, 78, 100), ['fire', 'flying'], [1, 2, 4, 5])
+    return player, rival, {'Charmander': battle.Evolution(charizard)}
+
+
+def play(seed):
+
+    # one battle with the simulation's player policy, events reduced to comparable values
+    player, rival, evolutions = matchup()
+    game = battle.Battle(player, rival, seed=seed, evolutions=evolutions)
+    events = []
+    while game.winner is None:
+        action = battle.simple_policy(game) if game.turn == 'player' else None
+        for event in game.step(action):
+            events.append((event.kind, event.actor.name, getattr(event.target, 'name', None),
+                           getattr(event.move, 'name', None), event.damage, event.critical))
+    return events, game.winner
+
+
+def stats_tuple(stats):
+
+    return (stats.battles, stats.player_wins, stats.turns, stats.evolutions)
+
+
+def test_same_seed_same_battle():
+
+    events, winner = play(42)
+    assert (events, winner) == play(42)
+    assert events[-1][0] == 'faint'
+    assert play(42) != play(43)
+
+
+def test_same_seed_same_stats():
+
+    player, rival, evolutions = matchup()
+    first = battle.run_battles(player, rival, 200, 'seed-0', evolutions)
+    second = battle.run_battles(player, rival, 200, 'seed-0', evolutions)
+    assert stats_tuple(first) == stats_tuple(second)
+    assert first.battles == 200 and 0 < first.evolutions < 200
+
+    # the templates are copied, never played
+    assert player.current_hp == player.max_hp and player.num_potions == 3
+
+
+@pytest.mark.parametrize('argv', [['pikachu'], ['--seed', '1', 'pikachu']])
+def test_player_without_rival_is_a_usage_error(monkeypatch, capsys, argv):
+
+    monkeypatch.setattr(sys, 'argv', ['battle.py'] + argv)
+    with pytest.raises(SystemExit) as exit:
+        battle.main()
+    assert exit.value.code == 2
+    assert 'rival' in capsys.readouterr().err
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pytest
+
+import frontend
+import htk
+
+data = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# speech.wav: 0.6 s of synthetic speech (silence, a voiced glide, a fricative, silence) at 16 kHz;
+# speech.mfcc: HTK 3.4.1 HCopy -C dialogue-demo/sid/config/config.HCopy speech.wav speech.mfcc
+wav = os.path.join(data, 'speech.wav')
+reference = os.path.join(data, 'speech.mfcc')
+
+
+def test_matches_hcopy_within_tolerance():
+
+    header = htk.open_htk(reference)[0]
+    assert header.parm_kind == htk.parm_kind_code(frontend.PARM_KIND)
+    assert header.samp_period == frontend.TARGET_RATE
+
+    error = frontend.check(wav, reference)
+    assert error.shape == (26,)
+    assert np.max(error) <= frontend.TOLERANCE
+
+
+def test_batch_matches_single():
+
+    samples = frontend.read_wav(wav)
+    single = frontend.frontend.compute(samples)
+    batch = frontend.frontend.compute_batch([samples[:8000], samples, samples[:300]])
+    np.testing.assert_array_equal(batch[1], single)
+    np.testing.assert_array_equal(batch[0], frontend.frontend.compute(samples[:8000]))
+    assert batch[2].shape == (0, 26)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_stream_matches_batch(seed):
+
+    samples = frontend.read_wav(wav)
+    batch = frontend.frontend.compute(samples)
+
+    # arbitrary chunks: empty ones, ones shorter than a frame shift and ones spanning several frames
+    rng = np.random.default_rng(seed)
+    bounds = np.sort(rng.integers(0, len(samples) + 1, 20))
+    stream = frontend.FrontendStream()
+    out = [stream.feed(chunk) for chunk in np.split(samples, bounds)]
+    out.append(stream.flush())
+    streamed = np.concatenate(out)
+
+    assert streamed.shape == batch.shape
+    cepstra = np.r_[0:frontend.NUMCEPS, frontend.NUMCEPS + 1:2 * frontend.NUMCEPS + 1]
+    np.testing.assert_allclose(streamed[:, cepstra], batch[:, cepstra], rtol=0, atol=1e-5)
+
+    # the energy is normalised by the loudest frame so far, which is the utterance's from that frame on
+    loudest = int(np.argmax(batch[:, frontend.NUMCEPS]))
+    np.testing.assert_allclose(streamed[loudest:], batch[loudest:], rtol=0, atol=1e-5)
+
+
+def test_stream_accepts_bytes():
+
+    samples = frontend.read_wav(wav)
+    stream = frontend.FrontendStream()
+    streamed = np.concatenate([stream.feed(samples[:5000].tobytes()), stream.feed(samples[5000:].tobytes()),
+                               stream.flush()])
+    assert streamed.shape == frontend.frontend.compute(samples).shape
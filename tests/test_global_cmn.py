@@ -0,0 +1,91 @@
+import shutil
+import sys
+
+import numpy as np
+import pytest
+
+import global_cmn
+import htk
+
+
+@pytest.fixture
+def mfcc_files(tmp_path):
+    # a few MFCC_E_D files of random frames, with an offset in the raw MFCC for the CMN to remove
+    rng = np.random.default_rng(0)
+    filenames = []
+    for i, nframes in enumerate([120, 37, 1]):
+        frames = rng.standard_normal((nframes, global_cmn.D)) + np.r_[rng.uniform(-5, 5, global_cmn.D_MFCC),
+                                                                       np.zeros(global_cmn.D - global_cmn.D_MFCC)]
+        filename = str(tmp_path / ('utt%d.mfcc' % i))
+        htk.write_htk(filename, frames, 'MFCC_E_D')
+        filenames.append(filename)
+    listfile = tmp_path / 'list.txt'
+    listfile.write_text(''.join(filename + '\n' for filename in filenames))
+    return filenames, str(listfile)
+
+
+def run(monkeypatch, *argv):
+    monkeypatch.setattr(sys, 'argv', ['global_cmn.py'] + list(argv))
+    global_cmn.main()
+
+
+def test_batch_in_place_and_archive_agree(tmp_path, monkeypatch, mfcc_files):
+    filenames, listfile = mfcc_files
+    originals = [np.array(htk.read(filename)) for filename in filenames]
+
+    # one file at a time
+    for i, filename in enumerate(filenames):
+        run(monkeypatch, filename, str(tmp_path / ('batch%d.mfcc' % i)))
+    batch = [np.array(htk.read(str(tmp_path / ('batch%d.mfcc' % i)))) for i in range(len(filenames))]
+
+    # the whole list into an archive
+    ark, scp = str(tmp_path / 'cmn.ark'), str(tmp_path / 'cmn.scp')
+    run(monkeypatch, '-l', listfile, ark, scp)
+    archived = [np.array(htk.read(spec)) for spec in htk.read_list(scp)]
+
+    # the whole list overwritten in place, on copies
+    copies = []
+    for i, filename in enumerate(filenames):
+        copies.append(str(tmp_path / ('inplace%d.mfcc' % i)))
+        shutil.copy(filename, copies[-1])
+    (tmp_path / 'copies.txt').write_text(''.join(copy + '\n' for copy in copies))
+    run(monkeypatch, '-l', str(tmp_path / 'copies.txt'), '--in-place')
+    in_place = [np.array(htk.read(copy)) for copy in copies]
+
+    for original, b, a, p in zip(originals, batch, archived, in_place):
+        assert b.tobytes() == a.tobytes() == p.tobytes()
+
+        # the raw MFCC has zero mean, the energy and deltas are left as they were
+        np.testing.assert_allclose(np.mean(b[:, :global_cmn.D_MFCC], axis=0), 0, atol=1e-5)
+        np.testing.assert_array_equal(b[:, global_cmn.D_MFCC:], original[:, global_cmn.D_MFCC:])
+        np.testing.assert_allclose(b, global_cmn.global_cmn(original.astype(np.float64)), rtol=0, atol=1e-5)
+
+
+@pytest.mark.parametrize('window', [1, 16, 1000])
+def test_online_cmn_is_global_cmn_of_its_window(tmp_path, monkeypatch, mfcc_files, window):
+    filenames, listfile = mfcc_files
+    mfcc = np.array(htk.read(filenames[0]), dtype=np.float64)
+    online = global_cmn.online_cmn(mfcc, window)
+
+    # each frame is normalized by the mean of the window that ends on it
+    for t in range(len(mfcc)):
+        expected = global_cmn.global_cmn(mfcc[max(t - window + 1, 0):t + 1])[-1]
+        np.testing.assert_allclose(online[t], expected, rtol=0, atol=1e-12)
+
+    # so a window of the whole file ends on the batch result
+    if window >= len(mfcc):
+        np.testing.assert_allclose(online[-1], global_cmn.global_cmn(mfcc)[-1], rtol=0, atol=1e-12)
+
+    # in chunks as they come from the microphone, and through --online
+    cmn = global_cmn.OnlineCMN(window)
+    chunks = [cmn.process(mfcc[begin:end]) for begin, end in [(0, 0), (0, 7), (7, 8), (8, 90), (90, len(mfcc))]]
+    np.testing.assert_allclose(np.concatenate(chunks), online, rtol=0, atol=1e-12)
+
+    ark, scp = str(tmp_path / 'online.ark'), str(tmp_path / 'online.scp')
+    run(monkeypatch, '--online', '--window', str(window), '-l', listfile, ark, scp)
+    np.testing.assert_allclose(htk.read(htk.read_list(scp)[0]), online, rtol=0, atol=1e-5)
+
+
+def test_online_in_place_is_refused(monkeypatch, mfcc_files):
+    with pytest.raises(SystemExit):
+        run(monkeypatch, '--online', '-l', mfcc_files[1], '--in-place')
@@ -0,0 +1,76 @@
+import numpy as np
+
+import htk
+
+
+def features(rng, nframes, dim=26):
+    # float32 frames with the values a byte-for-byte copy has to keep: -0, inf, nan and a denormal
+    frames = rng.standard_normal((nframes, dim)).astype(np.float32)
+    if nframes:
+        frames[0, :4] = [-0.0, np.inf, np.nan, np.float32(1e-45)]
+    return frames
+
+
+def test_archive_round_trip(tmp_path):
+
+    rng = np.random.default_rng(0)
+    records = [('a0', features(rng, 58), 'MFCC_E_D', 100000),
+               ('a1', features(rng, 0), 'MFCC_E_D', 100000),
+               ('b0', features(rng, 3, dim=13), 'MFCC_0', 50000),
+               ('b1', features(rng, 1000), htk.parm_kind_code('MFCC_E_D_N'), 100000)]
+    ark, scp = str(tmp_path / 'feats.ark'), str(tmp_path / 'feats.scp')
+    with htk.ArchiveWriter(ark, scp) as writer:
+        for key, frames, parm_kind, samp_period in records:
+            writer.write(key, frames, parm_kind, samp_period)
+
+    entries = htk.read_scp(scp)
+    assert [key for key, _ in entries] == [key for key, _, _, _ in records]
+    assert htk.read_keyed_list(scp) == entries
+    assert htk.read_list(scp) == [spec for _, spec in entries]
+
+    for (key, spec), (_, frames, parm_kind, samp_period) in zip(entries, records):
+        header, read = htk.open_htk(spec)
+        assert (header.nsamples, header.dim, header.samp_period) == (len(frames), frames.shape[1], samp_period)
+        assert header.parm_kind == (parm_kind if isinstance(parm_kind, int) else htk.parm_kind_code(parm_kind))
+        assert read.dtype == np.dtype('<f4') and read.shape == frames.shape
+        assert read.tobytes() == frames.tobytes()
+
+    # the records are laid end to end: the archive is nothing but the HTK files
+    with open(ark, 'rb') as f:
+        data = f.read()
+    assert len(data) == sum(htk.HEADER.size + frames.nbytes for _, frames, _, _ in records)
+
+
+def test_pack_keeps_the_files_bytes(tmp_path):
+
+    rng = np.random.default_rng(1)
+    filenames = []
+    for i, nframes in enumerate([5, 17, 0]):
+        filename = str(tmp_path / ('utt%d.mfcc' % i))
+        htk.write_htk(filename, features(rng, nframes), 'MFCC_E_D')
+        filenames.append(filename)
+
+    ark, scp = str(tmp_path / 'packed.ark'), str(tmp_path / 'packed.scp')
+    htk.pack(ark, scp, filenames)
+
+    with open(ark, 'rb') as f:
+        data = f.read()
+    for filename, (key, spec) in zip(filenames, htk.read_scp(scp)):
+        assert key == htk.utterance_key(filename)
+        with open(filename, 'rb') as f:
+            original = f.read()
+        offset = htk.split_spec(spec)[1]
+        assert data[offset:offset + len(original)] == original
+        assert htk.read(spec).tobytes() == htk.read(filename).tobytes()
+
+
+def test_rewritten_archive_is_read_again(tmp_path):
+
+    # the archive is mmapped once, writing it again must not leave the old mapping behind
+    rng = np.random.default_rng(2)
+    ark, scp = str(tmp_path / 'feats.ark'), str(tmp_path / 'feats.scp')
+    for nframes in (4, 9):
+        frames = features(rng, nframes)
+        with htk.ArchiveWriter(ark, scp) as writer:
+            writer.write('utt', frames, 'MFCC_E_D')
+        assert htk.read(htk.read_list(scp)[0]).tobytes() == frames.tobytes()
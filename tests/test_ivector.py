@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+import pytest
+
+import htk
+import spkid
+
+sid = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dialogue-demo', 'sid')
+data = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def random_ubm(rng, ndim=4, nmix=3):
+    mu = rng.standard_normal((ndim, nmix))
+    sigma = rng.uniform(0.5, 2.0, (ndim, nmix))
+    w = rng.dirichlet(np.ones(nmix))
+    return spkid.UBM(mu, sigma, w)
+
+
+def direct_ivector(T, ubm, N, F):
+    # (I + sum_c N_c T_c Σ_c^-1 T_c^T)^-1 T Σ^-1 F, with T stored tv_dim * (ndim*nmix)
+    inv_S = np.reshape(1. / ubm.sigma.T, ubm.ndim * ubm.nmix)
+    L = np.eye(len(T))
+    for c in range(ubm.nmix):
+        sv = slice(c * ubm.ndim, (c + 1) * ubm.ndim)
+        L += N[c] * np.dot(T[:, sv] * inv_S[sv], T[:, sv].T)
+    return np.linalg.solve(L, np.dot(T * inv_S, F))
+
+
+@pytest.mark.parametrize('tv_dim, solve_block, batch_size', [(5, 64, 32), (11, 4, 2)])
+def test_extract_batch_matches_direct_formula(monkeypatch, tv_dim, solve_block, batch_size):
+    # several triangular blocks and several cholesky batches, plus a partial last one of each
+    monkeypatch.setattr(spkid, 'SOLVE_BLOCK', solve_block)
+    rng = np.random.default_rng(0)
+    ubm = random_ubm(rng)
+    T = rng.standard_normal((tv_dim, ubm.ndim * ubm.nmix))
+    extractor = spkid.IvectorExtractor(T, ubm, batch_size=batch_size)
+
+    nfiles = 5
+    N = rng.uniform(0, 50, (nfiles, ubm.nmix))
+    F = rng.standard_normal((nfiles, ubm.ndim * ubm.nmix)) * 10
+    iv = extractor.extract_batch(N, F)
+
+    assert iv.shape == (nfiles, tv_dim)
+    for ix in range(nfiles):
+        np.testing.assert_allclose(iv[ix], direct_ivector(T, ubm, N[ix], F[ix]), rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(extractor.extract(N[2], F[2]), iv[2], rtol=1e-12)
+
+
+def test_extract_batch_accepts_transposed_T():
+    # the T matrix files are stored (ndim*nmix) * tv_dim as well
+    rng = np.random.default_rng(1)
+    ubm = random_ubm(rng)
+    T = rng.standard_normal((3, ubm.ndim * ubm.nmix))
+    N = rng.uniform(0, 50, ubm.nmix)
+    F = rng.standard_normal(ubm.ndim * ubm.nmix)
+    np.testing.assert_allclose(spkid.IvectorExtractor(T.T, ubm).extract(N, F),
+                               direct_ivector(T, ubm, N, F), rtol=1e-9)
+
+
+def test_bw_stats_frames_ignore_energy():
+    # statistics of MFCC_E_D frames are those of the 25 dimensions without the energy column
+    rng = np.random.default_rng(2)
+    ubm = random_ubm(rng, ndim=spkid.D - 1, nmix=4)
+    mfcc = rng.standard_normal((30, spkid.D))
+    N, F = ubm.bw_stats_frames(mfcc)
+    N_ref, F_ref = ubm.bw_stats(np.delete(mfcc, spkid.E_INDEX, axis=1).T)
+    np.testing.assert_allclose(N, N_ref, rtol=1e-12)
+    np.testing.assert_allclose(F, F_ref, rtol=1e-10, atol=1e-12)
+
+
+def write_htk_gmm(filename, ubm):
+    # a one-state HTK GMM like UBM/jmodel
+    lines = ['~o', '<STREAMINFO> 1 %d' % ubm.ndim, '<VECSIZE> %d<NULLD><MFCC_E_D_N><DIAGC>' % ubm.ndim,
+             '~h "jmodel"', '<BEGINHMM>', '<NUMSTATES> 3', '<STATE> 2', '<NUMMIXES> %d' % ubm.nmix]
+    for c in range(ubm.nmix):
+        lines += ['<MIXTURE> %d %r' % (c + 1, float(ubm.w[c])),
+                  '<MEAN> %d' % ubm.ndim, ' '.join(repr(float(x)) for x in ubm.mu[:, c]),
+                  '<VARIANCE> %d' % ubm.ndim, ' '.join(repr(float(x)) for x in ubm.sigma[:, c])]
+    lines += ['<ENDHMM>']
+    with open(filename, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def test_bundles_are_rebuilt_only_when_jmodel_or_T_changes(tmp_path, monkeypatch):
+    written = []
+    write_bundle = spkid.write_bundle
+    monkeypatch.setattr(spkid, 'write_bundle', lambda bundle, *args: written.append(os.path.basename(bundle))
+                        or write_bundle(bundle, *args))
+
+    rng = np.random.default_rng(3)
+    ubm = random_ubm(rng)
+    T = rng.standard_normal((ubm.ndim * ubm.nmix, 5))
+    jmodel, T_matrix = str(tmp_path / 'jmodel'), str(tmp_path / 'tvmatrix.npy')
+    write_htk_gmm(jmodel, ubm)
+    np.save(T_matrix, T)
+
+    def load():
+        loaded = spkid.UBM.load(jmodel)
+        return loaded, spkid.IvectorExtractor.load(T_matrix, loaded)
+
+    # the first load builds both bundles, from what the text and the .npy give
+    loaded, extractor = load()
+    assert written == ['jmodel.bundle', 'tvmatrix.npy.bundle']
+    for name in spkid.UBM_ARRAYS:
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(ubm, name))
+    direct = spkid.IvectorExtractor(T, ubm)
+    for name in spkid.TV_ARRAYS:
+        np.testing.assert_array_equal(getattr(extractor, name), getattr(direct, name))
+
+    # unchanged files: both bundles are mapped as they are
+    loaded, extractor = load()
+    assert written == ['jmodel.bundle', 'tvmatrix.npy.bundle']
+    assert not loaded.mu.flags.writeable and not extractor.TT.flags.writeable
+
+    # a new T rebuilds its bundle only
+    np.save(T_matrix, 2 * T)
+    loaded, extractor = load()
+    assert written[2:] == ['tvmatrix.npy.bundle']
+    np.testing.assert_array_equal(extractor.T, 2 * direct.T)
+
+    # a new jmodel rebuilds both, since T_invS and TT are computed with its variances
+    ubm = spkid.UBM(ubm.mu, ubm.sigma * 2, ubm.w)
+    write_htk_gmm(jmodel, ubm)
+    loaded, extractor = load()
+    assert written[3:] == ['jmodel.bundle', 'tvmatrix.npy.bundle']
+    np.testing.assert_array_equal(loaded.sigma, ubm.sigma)
+    np.testing.assert_array_equal(extractor.TT, spkid.IvectorExtractor(2 * T, ubm).TT)
+
+    load()
+    assert len(written) == 5
+
+    # a UBM from the text dumps has no hash to check a T bundle against
+    spkid.IvectorExtractor.load(T_matrix, spkid.UBM(ubm.mu, ubm.sigma, ubm.w))
+    assert len(written) == 5
+
+
+# the drift of Gaussian selection documented in sid/readme.txt: (top, clusters) --> mean and min cosine
+documented_drift = {(20, 0): (0.99, 0.95), (20, 16): (0.97, 0.85)}
+
+
+@pytest.mark.parametrize('top, clusters', sorted(documented_drift))
+def test_gaussian_selection_drift(top, clusters):
+    # utterances drawn from the real UBM, each from its own mixture weights, plus the HCopy test file
+    ubm = spkid.UBM(*spkid.read_htk_gmm(os.path.join(sid, 'UBM', 'jmodel')))
+    rng = np.random.default_rng(0)
+    utterances = []
+    for nframes in (100, 300, 1000, 2500, 600, 150):
+        comp = rng.choice(ubm.nmix, size=nframes, p=rng.dirichlet(np.full(ubm.nmix, 0.3)))
+        x = ubm.mu[:, comp] + np.sqrt(ubm.sigma[:, comp]) * rng.standard_normal((ubm.ndim, nframes))
+        utterances.append(np.insert(x.T, spkid.E_INDEX, rng.standard_normal(nframes), axis=1))
+    speech = np.array(htk.read(os.path.join(data, 'speech.mfcc')), dtype=np.float64)
+    utterances.append(speech - np.r_[np.mean(speech[:, :spkid.E_INDEX], axis=0), np.zeros(spkid.D - spkid.E_INDEX)])
+
+    T = rng.standard_normal((100, ubm.ndim * ubm.nmix)) * 0.05
+    extractor = spkid.IvectorExtractor(T, ubm)
+    exact = [extractor.extract(*ubm.bw_stats_frames(mfcc)) for mfcc in utterances]
+
+    selection = spkid.GaussianSelection(ubm, top, clusters)
+    drift = spkid.ivector_drift(exact, [extractor.extract(*selection.bw_stats_frames(mfcc)) for mfcc in utterances])
+    mean_cosine, min_cosine = documented_drift[top, clusters]
+    assert drift['files'] == len(utterances)
+    assert drift['mean_cosine'] >= mean_cosine and drift['min_cosine'] >= min_cosine, spkid.format_drift(drift)
+
+    # every mixture kept: only the float32 arithmetic is left
+    selection = spkid.GaussianSelection(ubm, ubm.nmix)
+    drift = spkid.ivector_drift(exact, [extractor.extract(*selection.bw_stats_frames(mfcc)) for mfcc in utterances])
+    assert drift['max_relative_error'] < 1e-5, spkid.format_drift(drift)
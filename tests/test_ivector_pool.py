@@ -0,0 +1,104 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+import calc_ivector
+import htk
+import ivector_pool
+import spkid
+from tests.test_ivector import random_ubm
+
+
+@pytest.fixture
+def model(tmp_path):
+    # a small UBM as extract_mu_sigma_w text dumps, a T matrix and 40 MFCC_E_D files of different lengths
+    rng = np.random.default_rng(0)
+    ubm = random_ubm(rng, ndim=spkid.D - 1, nmix=4)
+    names = []
+    for name, array in (('mu', ubm.mu), ('sigma', ubm.sigma), ('w', ubm.w)):
+        names.append(str(tmp_path / (name + '.txt')))
+        np.savetxt(names[-1], array, delimiter=' ')
+    names.append(str(tmp_path / 'tvmatrix.npy'))
+    np.save(names[-1], rng.standard_normal((ubm.ndim * ubm.nmix, 6)))
+
+    filenames = []
+    for i in range(40):
+        filenames.append(str(tmp_path / ('utt%02d.mfcc' % i)))
+        htk.write_htk(filenames[-1], rng.standard_normal((rng.integers(5, 200), spkid.D)), 'MFCC_E_D')
+    return names, filenames
+
+
+@pytest.fixture
+def shared_directories(monkeypatch):
+    # the directories IvectorPool puts the model in
+    created = []
+    mkdtemp = tempfile.mkdtemp
+    monkeypatch.setattr(ivector_pool.tempfile, 'mkdtemp', lambda *args, **kwargs: created.append(
+        mkdtemp(*args, **kwargs)) or created[-1])
+    return created
+
+
+def calc(monkeypatch, capsys, jobs, listfile, names, top=0):
+    monkeypatch.setattr(sys, 'argv', ['calc_ivector.py', '-j', str(jobs), '--top', str(top), listfile] + names)
+    calc_ivector.main()
+    return np.array([[float(value.split(':')[1]) for value in line.split()]
+                     for line in capsys.readouterr().out.splitlines()])
+
+
+@pytest.mark.parametrize('top', [0, 2])
+def test_pool_keeps_the_list_order(tmp_path, monkeypatch, capsys, model, shared_directories, top):
+    names, filenames = model
+
+    # an archive in an order of its own: the output follows the scp, not the file names
+    order = np.random.default_rng(1).permutation(len(filenames))
+    ark, scp = str(tmp_path / 'feats.ark'), str(tmp_path / 'feats.scp')
+    htk.pack(ark, scp, [filenames[i] for i in order])
+
+    one = calc(monkeypatch, capsys, 1, scp, names, top)
+    assert shared_directories == []
+    two = calc(monkeypatch, capsys, 2, scp, names, top)
+    assert one.shape == two.shape == (len(filenames), 6)
+    np.testing.assert_allclose(two, one, rtol=1e-9, atol=1e-12)
+
+    # and the rows are those of the files in that order
+    extractor = spkid.IvectorExtractor.load(names[3], spkid.UBM(*(np.loadtxt(name) for name in names[:3])))
+    stats = spkid.GaussianSelection(extractor.ubm, top) if top else extractor.ubm
+    for row, i in zip(two, order):
+        np.testing.assert_allclose(row, extractor.extract(*stats.bw_stats_frames(htk.read(filenames[i]))),
+                                   rtol=1e-9, atol=1e-12)
+
+    # the shared model is gone once the list is done
+    assert len(shared_directories) == 1
+    assert shared_directories[0].startswith('/dev/shm/') or not os.path.isdir('/dev/shm')
+    assert not os.path.exists(shared_directories[0])
+
+
+def test_shared_model_is_removed_on_error(tmp_path, monkeypatch, capsys, model, shared_directories):
+    names, filenames = model
+    listfile = tmp_path / 'list.txt'
+    listfile.write_text('\n'.join(filenames[:20] + [str(tmp_path / 'missing.mfcc')] + filenames[20:]) + '\n')
+
+    # the missing file fails the same way in one process and in the workers
+    with pytest.raises(FileNotFoundError):
+        calc(monkeypatch, capsys, 1, str(listfile), names)
+    with pytest.raises(FileNotFoundError):
+        calc(monkeypatch, capsys, 2, str(listfile), names)
+
+    assert len(shared_directories) == 1
+    assert not os.path.exists(shared_directories[0])
+
+
+def test_shared_model_is_removed_when_the_pool_cannot_start(monkeypatch, model, shared_directories):
+    names, _ = model
+    extractor = spkid.IvectorExtractor.load(names[3], spkid.UBM(*(np.loadtxt(name) for name in names[:3])))
+
+    def no_pool(*args):
+        raise OSError('no more processes')
+    monkeypatch.setattr(ivector_pool.multiprocessing, 'Pool', no_pool)
+    with pytest.raises(OSError):
+        ivector_pool.IvectorPool(extractor, 2)
+    assert len(shared_directories) == 1
+    assert not os.path.exists(shared_directories[0])
@@ -0,0 +1,85 @@
+import types
+
+import numpy as np
+
+import global_cmn
+import spkid
+
+
+class FakeSVM(object):
+    # one-vs-one votes chosen by the test instead of a trained model
+    def __init__(self, votes, label=(7, 8, 9)):
+        self.label = list(label)
+        self.nr_class = len(label)
+        self.fixed = votes
+        self.calls = 0
+
+    def votes(self, x):
+        self.calls += 1
+        return np.array(self.fixed)
+
+
+def fake_identifier(votes, seed=0, nmix=4, tv_dim=6):
+    rng = np.random.default_rng(seed)
+    ndim = spkid.D - 1
+    ubm = spkid.UBM(rng.standard_normal((ndim, nmix)), rng.uniform(0.5, 2.0, (ndim, nmix)),
+                    rng.dirichlet(np.ones(nmix)))
+    extractor = spkid.IvectorExtractor(rng.standard_normal((tv_dim, ndim * nmix)), ubm)
+    return types.SimpleNamespace(ubm=ubm, stats=ubm, extractor=extractor, svm=FakeSVM(votes))
+
+
+def random_chunks(rng, nframes):
+    # arbitrary chunk sizes, empty ones included, that straddle the update boundaries
+    bounds = np.sort(rng.integers(0, nframes + 1, 12))
+    return np.split(np.arange(nframes), bounds)
+
+
+def test_chunked_accumulation_matches_batch():
+    rng = np.random.default_rng(1)
+    identifier = fake_identifier([1, 1, 1])
+    mfcc = rng.standard_normal((437, spkid.D))
+
+    online = spkid.OnlineIdentifier(identifier, update=50, min_frames=10**6, window=100)
+    for chunk in random_chunks(rng, len(mfcc)):
+        online.feed_frames(mfcc[chunk])
+
+    # the sliding-window CMN does not depend on the chunking either
+    N, F = identifier.ubm.bw_stats_frames(global_cmn.online_cmn(mfcc, 100))
+    assert online.nframes == len(mfcc)
+    np.testing.assert_allclose(online.N, N, rtol=1e-10)
+    np.testing.assert_allclose(online.F, F, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(online.ivector(), identifier.extractor.extract_batch(N, F)[0], rtol=1e-8, atol=1e-10)
+
+    # one decision every update frames, wherever the chunks end
+    assert len(online.history) == len(mfcc) // 50
+    assert not online.final
+    decision = online.finish()
+    assert decision.final and decision.nframes == len(mfcc)
+    assert (decision.label, decision.confidence) == (7, 0.5)
+
+
+def test_stops_once_the_decision_is_stable():
+    rng = np.random.default_rng(2)
+    identifier = fake_identifier([0, 2, 1])
+    mfcc = rng.standard_normal((300, spkid.D))
+
+    online = spkid.OnlineIdentifier(identifier, update=20, min_frames=50, stable=3)
+    decisions = [online.feed_frames(mfcc[start:start + 7]) for start in range(0, len(mfcc), 7)]
+
+    # decisions at 20, 40 and 60 frames are unanimous, and 60 >= min_frames: final at 60
+    final = [d for d in decisions if d is not None and d.final]
+    assert len(final) == 1
+    assert final[0] == spkid.Decision(8, 1.0, 60, True)
+    assert online.final and online.nframes == 60
+    assert identifier.svm.calls == 3
+
+    # frames after the decision are ignored
+    N, F = identifier.ubm.bw_stats_frames(global_cmn.online_cmn(mfcc[:60]))
+    np.testing.assert_allclose(online.N, N, rtol=1e-10)
+    np.testing.assert_allclose(online.F, F, rtol=1e-9, atol=1e-9)
+    assert online.feed_frames(mfcc[:10]) is None
+    assert online.finish() == final[0]
+
+    # and the next utterance starts from scratch
+    online.reset()
+    assert not online.final and online.nframes == 0 and not online.N.any()
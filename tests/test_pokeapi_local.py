@@ -0,0 +1,79 @@
+import json
+
+from pokemon_dialogue.pokeapi_local import SnapshotResolver, import_snapshot
+
+api_url = 'https://pokeapi.test/api/v2'
+
+
+def pokemon_json(name, move_ids):
+
+    return {
+        'name': name,
+        'stats': [{'stat': {'name': stat}, 'base_stat': 50} for stat in ('hp', 'attack', 'defense', 'speed')],
+        'types': [{'type': {'name': 'normal'}}],
+        'moves': [{'move': {'url': f'{api_url}/move/{m}/'},
+                   'version_group_details': [{'version_group': {'name': 'red-blue'},
+                                              'move_learn_method': {'name': 'level-up'},
+                                              'level_learned_at': 1}]}
+                  for m in move_ids],
+        'sprites': {'front_default': f'https://sprites.test/{name}.png',
+                    'back_default': f'https://sprites.test/back/{name}.png'},
+    }
+
+
+class FakeSource():
+
+    def __init__(self):
+
+        self.payloads = {}
+        for name, move_ids in (('bulbasaur', [1, 2]), ('charmander', [2, 3])):
+            pokemon = pokemon_json(name, move_ids)
+            self.payloads[f'{api_url}/pokemon/{name}'] = json.dumps(pokemon).encode('utf-8')
+            for side in ('front_default', 'back_default'):
+                self.payloads[pokemon['sprites'][side]] = bytes(1000)
+        for m in (1, 2, 3):
+            move = {'name': f'move-{m}', 'power': 40, 'type': {'name': 'normal'}, 'padding': 'x' * 1000}
+            self.payloads[f'{api_url}/move/{m}/'] = json.dumps(move).encode('utf-8')
+
+    def get_bytes(self, url):
+
+        return self.payloads[url]
+
+    def get_many_json(self, urls):
+
+        return {url: json.loads(self.payloads[url]) for url in urls}
+
+
+def test_payload_cache_is_bounded(tmp_path):
+
+    source = FakeSource()
+    path = tmp_path / 'snapshot.bin'
+    assert import_snapshot(str(path), ['bulbasaur', 'charmander'], source, api_url) == len(source.payloads)
+
+    resolver = SnapshotResolver(str(path), max_payload_bytes=2500)
+    for url, payload in source.payloads.items():
+        assert resolver.get_bytes(url) == payload
+        assert resolver.payload_bytes <= 2500
+        assert resolver.payload_bytes == sum(len(p) for p in resolver.payloads.values())
+    assert resolver.misses == len(source.payloads)
+
+    # the most recent payload is still there, the first ones were dropped and are decompressed again
+    last = list(source.payloads)[-1]
+    first = list(source.payloads)[0]
+    assert resolver.get_bytes(last.rstrip('/').replace('https://', 'http://')) == source.payloads[last]
+    assert resolver.hits == 1
+    assert resolver.get_json(first)['name'] == 'bulbasaur'
+    assert resolver.misses == len(source.payloads) + 1
+
+
+def test_payload_larger_than_the_budget_is_still_served(tmp_path):
+
+    source = FakeSource()
+    path = tmp_path / 'snapshot.bin'
+    import_snapshot(str(path), ['bulbasaur'], source, api_url)
+
+    resolver = SnapshotResolver(str(path), max_payload_bytes=10)
+    url = f'{api_url}/pokemon/bulbasaur'
+    assert resolver.get_bytes(url) == source.payloads[url]
+    assert resolver.get_bytes(url) == source.payloads[url]
+    assert resolver.hits == 1 and len(resolver.payloads) == 1
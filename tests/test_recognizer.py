@@ -0,0 +1,195 @@
+import os
+import queue
+import socket
+import threading
+
+import pytest
+
+from pokemon_dialogue.recognizer import ASR_RESULT, ASR_TIMEOUT, JuliusRecognizer, grammars
+from pokemon_dialogue.roster import state_grammars
+
+grammar_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dialogue-demo', 'asr', 'grammar')
+
+# what Julius -module sends for one utterance (two hypotheses, -output 2)
+recogout = """<RECOGOUT>
+  <SHYPO RANK="1" SCORE="-2634.98" GRAM="0">
+    <WHYPO WORD="silB" CLASSID="6" PHONE="silB" CM="1.000"/>
+    <WHYPO WORD="行け" CLASSID="0" PHONE="i k e" CM="0.600"/>
+    <WHYPO WORD="ヒトカゲ" CLASSID="1" PHONE="h i t o k a g e" CM="0.800"/>
+    <WHYPO WORD="silE" CLASSID="7" PHONE="silE" CM="1.000"/>
+  </SHYPO>
+  <SHYPO RANK="2" SCORE="-2701.11" GRAM="0">
+    <WHYPO WORD="ゼニガメ" CLASSID="1" PHONE="z e n i g a m e" CM="0.100"/>
+  </SHYPO>
+</RECOGOUT>
+.
+"""
+startrecog = """<STARTRECOG TIME="1700000000"/>
+.
+<ENDRECOG TIME="1700000001"/>
+.
+"""
+
+
+class FakeJulius():
+    """ The julius process, as far as the recognizer looks at it """
+
+    def poll(self):
+
+        return None
+
+    def wait(self, timeout=None):
+
+        return 0
+
+
+@pytest.fixture
+def julius():
+    """ A recognizer connected to a socket the test plays Julius on, and the events it posts """
+
+    events = queue.Queue()
+    recognizer = JuliusRecognizer(grammar_dir=grammar_dir,
+                                  on_event=lambda event_type, **attributes: events.put((event_type, attributes)))
+    recognizer.sock, julius_end = socket.socketpair()
+    recognizer.process = FakeJulius()
+    recognizer.reader = recognizer.sock.makefile('r', encoding='utf-8', errors='replace')
+    recognizer.reader_thread = threading.Thread(target=recognizer.read_loop, args=(recognizer.reader,), daemon=True)
+    recognizer.reader_thread.start()
+
+    yield recognizer, julius_end, events
+
+    recognizer.close()
+    julius_end.close()
+
+
+def commands(julius_end):
+    """ Everything the recognizer has sent so far """
+
+    julius_end.settimeout(0.2)
+    data = b''
+    try:
+        while True:
+            chunk = julius_end.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    except socket.timeout:
+        pass
+    return data.decode('utf-8')
+
+
+def test_parse_recogout():
+
+    recognizer = JuliusRecognizer()
+    # the lines as read_message() hands them over
+    text, confidence = recognizer.parse_recogout([line.strip() for line in recogout.splitlines()[:-1]])
+
+    # only the best hypothesis, its words in order and their mean confidence
+    assert text.split() == ['silB', '行け', 'ヒトカゲ', 'silE']
+    assert confidence == pytest.approx((1.0 + 0.6 + 0.8 + 1.0) / 4)
+    assert recognizer.parse_recogout(['<RECOGOUT>', '</RECOGOUT>']) == ('', 0.0)
+
+
+def test_result_is_posted_and_input_paused(julius):
+
+    recognizer, julius_end, events = julius
+    recognizer.listen(timeout=10000)
+    assert commands(julius_end) == 'RESUME\n'
+
+    julius_end.sendall((startrecog + recogout).encode('utf-8'))
+    event_type, attributes = events.get(timeout=5)
+    assert event_type == ASR_RESULT
+    assert 'ヒトカゲ' in attributes['text'].split() and 'ゼニガメ' not in attributes['text']
+    assert attributes['grammar'] == 'pokemon'
+    assert not recognizer.listening and recognizer.timer is None
+    assert commands(julius_end) == 'PAUSE\n'
+
+    # an utterance nobody listens for (it was being decoded when the listen was cancelled) is dropped
+    julius_end.sendall(recogout.encode('utf-8'))
+    julius_end.shutdown(socket.SHUT_WR)
+    recognizer.reader_thread.join(5)
+    assert events.empty()
+
+
+def test_timeout_is_posted_and_utterance_dropped(julius):
+
+    recognizer, julius_end, events = julius
+    recognizer.listen(timeout=50)
+
+    event_type, attributes = events.get(timeout=5)
+    assert event_type == ASR_TIMEOUT
+    assert attributes['grammar'] == 'pokemon'
+    assert not recognizer.listening
+    assert commands(julius_end) == 'RESUME\nTERMINATE\n'
+
+    # the late result of the timed out listen is not reported
+    julius_end.sendall(recogout.encode('utf-8'))
+    julius_end.shutdown(socket.SHUT_WR)
+    recognizer.reader_thread.join(5)
+    assert events.empty()
+
+
+def test_exit_while_listening_is_posted(julius):
+
+    recognizer, julius_end, events = julius
+    recognizer.listen()
+    julius_end.shutdown(socket.SHUT_WR)
+
+    event_type, attributes = events.get(timeout=5)
+    assert event_type == ASR_RESULT
+    assert attributes['text'] is None
+
+
+def test_grammar_changes_only_when_the_state_needs_another(julius):
+
+    recognizer, julius_end, events = julius
+    recognizer.listen(state_grammars['select pokemon'])
+    sent = commands(julius_end)
+
+    with open(os.path.join(grammar_dir, 'pokemon_select.dfa'), encoding='utf-8') as f:
+        dfa = f.read()
+    with open(os.path.join(grammar_dir, 'pokemon_select.dict'), encoding='utf-8') as f:
+        dict_data = f.read()
+    assert sent == f'CHANGEGRAM pokemon_select\n{dfa}DFAEND\n{dict_data}DICEND\nRESUME\n'
+    assert recognizer.grammar == 'pokemon_select'
+
+    recognizer.cancel()
+    recognizer.listen(state_grammars['select pokemon'])
+    assert commands(julius_end) == 'TERMINATE\nRESUME\n'
+
+
+def accepts(prefix, words):
+    """ Whether the grammar takes the sentence (the .dfa reads it from the end, silE first) """
+
+    with open(f'{prefix}.dfa', encoding='utf-8') as f:
+        arcs = [tuple(int(field) for field in line.split()) for line in f if line.strip()]
+    with open(f'{prefix}.dict', encoding='utf-8') as f:
+        categories = {}
+        for line in f:
+            category, output, _ = line.split('\t')
+            categories.setdefault(output.strip('[]'), set()).add(int(category))
+
+    states = {0}
+    for word in reversed(['silB'] + words + ['silE']):
+        states = {to for state, category, to, _, _ in arcs
+                  if state in states and category in categories.get(word, ())}
+    return any(state == accept for state in states for accept, category, _, final, _ in arcs if final)
+
+
+@pytest.mark.parametrize('status, said, heard', [
+    ('select pokemon', ['ヒトカゲ'], True),
+    ('select pokemon', ['行け', 'ゼニガメ'], True),
+    ('select pokemon', ['ひのこ'], False),
+    ('player turn', ['たたかう'], True),
+    ('player turn', ['かいふく'], True),
+    ('player turn', ['頑張れ', 'フシギダネ'], True),
+    ('player turn', ['つるのムチ'], False),
+    ('player move', ['ひのこ'], True),
+    ('player move', ['行け', 'ヒトカゲ', 'ひのこ', 'だ'], True),
+    ('player move', ['かいふく'], False),
+    ('player move', ['ヒトカゲ'], False),
+])
+def test_state_grammars(status, said, heard):
+
+    assert state_grammars[status] in grammars
+    assert accepts(os.path.join(grammar_dir, state_grammars[status]), said) == heard
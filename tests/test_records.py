@@ -0,0 +1,144 @@
+import json
+
+import pytest
+
+from pokemon_dialogue import records as records_module
+from pokemon_dialogue.records import Move, RecordStore, Species
+
+api_url = 'https://pokeapi.test/api/v2'
+
+
+def pokemon_json(name, moves):
+
+    # moves: [(move id, version group, learn method, level)]
+    return {
+        'name': name,
+        'stats': [{'stat': {'name': stat}, 'base_stat': value}
+                  for stat, value in (('hp', 39), ('attack', 52), ('defense', 43), ('speed', 65),
+                                      ('special-attack', 60))],
+        'types': [{'type': {'name': 'fire'}}],
+        'moves': [{'move': {'url': f'{api_url}/move/{m}/'},
+                   'version_group_details': [{'version_group': {'name': group},
+                                              'move_learn_method': {'name': method},
+                                              'level_learned_at': level}]}
+                  for m, group, method, level in moves],
+        'sprites': {'front_default': f'https://sprites.test/{name}.png',
+                    'back_default': f'https://sprites.test/back/{name}.png', 'other': {}},
+    }
+
+
+def move_json(m, power):
+
+    return {'name': f'move-{m}', 'power': power, 'type': {'name': 'normal'}, 'accuracy': 100}
+
+
+class FakeSource():
+
+    def __init__(self):
+
+        self.payloads = {
+            f'{api_url}/pokemon/charmander': pokemon_json('charmander', [
+                (10, 'red-blue', 'level-up', 1), (52, 'red-blue', 'level-up', 9),
+                (5, 'red-blue', 'machine', 0), (53, 'yellow', 'level-up', 15)]),
+            f'{api_url}/pokemon/squirtle': pokemon_json('squirtle', [(33, 'red-blue', 'level-up', 1)]),
+            f'{api_url}/move/10/': move_json(10, 40),
+            f'{api_url}/move/45/': move_json(45, None),
+        }
+        self.requests = []
+
+    def get_many_json(self, urls):
+
+        self.requests.append(list(urls))
+        return {url: self.payloads[url] for url in urls}
+
+
+def test_species_from_json():
+
+    species = Species.from_json(FakeSource().payloads[f'{api_url}/pokemon/charmander'])
+    assert (species.name, species.hp, species.attack, species.defense, species.speed) == ('charmander', 39, 52, 43, 65)
+    assert species.types == ('fire',)
+
+    # only the red-blue level-up moves, with the level they are learned at
+    assert species.learnset == ((1, f'{api_url}/move/10/'), (9, f'{api_url}/move/52/'))
+    assert species.learnable_move_urls(5) == [f'{api_url}/move/10/']
+    assert species.sprites == {'front_default': 'https://sprites.test/charmander.png',
+                               'back_default': 'https://sprites.test/back/charmander.png'}
+
+
+def test_record_round_trip():
+
+    species = Species.from_json(FakeSource().payloads[f'{api_url}/pokemon/charmander'])
+    copy = Species.from_record(json.loads(json.dumps(species.to_record())))
+    for name in Species.__slots__:
+        assert getattr(copy, name) == getattr(species, name)
+
+    for move in (Move('ember', 40, 'fire'), Move('growl', None, 'normal')):
+        copy = Move.from_record(json.loads(json.dumps(move.to_record())))
+        assert (copy.name, copy.power, copy.type) == (move.name, move.power, move.type)
+
+
+def test_parsed_once_and_saved(tmp_path):
+
+    source = FakeSource()
+    path = tmp_path / 'records.json'
+    store = RecordStore(str(path))
+    charmander, squirtle = f'{api_url}/pokemon/charmander', f'{api_url}/pokemon/squirtle'
+
+    first = store.species_many([charmander, charmander], source)
+    assert source.requests == [[charmander]]
+    assert (store.hits, store.misses) == (0, 1)
+
+    second = store.species_many([charmander, squirtle, squirtle], source)
+    assert source.requests == [[charmander], [squirtle]]
+    assert second[charmander] is first[charmander]
+    assert (store.hits, store.misses) == (1, 2)
+
+    moves = store.moves([f'{api_url}/move/10/', f'{api_url}/move/45/', f'{api_url}/move/10/'], source)
+    assert moves[f'{api_url}/move/45/'].power is None
+    assert (store.hits, store.misses) == (1, 4)
+
+    # a new store reads the file instead of the payloads
+    fresh_source = FakeSource()
+    fresh = RecordStore(str(path))
+    loaded = fresh.species_many([charmander, squirtle], fresh_source)
+    assert fresh_source.requests == []
+    assert loaded[charmander].learnset == first[charmander].learnset
+    assert fresh.moves([f'{api_url}/move/10/'], fresh_source)[f'{api_url}/move/10/'].name == 'move-10'
+    assert (fresh.hits, fresh.misses) == (3, 0)
+
+
+@pytest.mark.parametrize('contents', [
+    lambda data: dict(data, version=records_module.records_version + 1),
+    lambda data: {key: value for key, value in data.items() if key != 'version'},
+])
+def test_other_record_versions_are_ignored(tmp_path, contents):
+
+    source = FakeSource()
+    path = tmp_path / 'records.json'
+    url = f'{api_url}/pokemon/squirtle'
+    RecordStore(str(path)).species(url, source)
+
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(contents(data), f)
+
+    fresh_source = FakeSource()
+    store = RecordStore(str(path))
+    assert store.species(url, fresh_source).name == 'squirtle'
+    assert fresh_source.requests == [[url]]
+    assert store.misses == 1
+
+    # and the file is rewritten in the current version
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f)['version'] == records_module.records_version
+
+
+def test_unreadable_file_is_ignored(tmp_path):
+
+    path = tmp_path / 'records.json'
+    path.write_text('{not json', encoding='utf-8')
+    source = FakeSource()
+    store = RecordStore(str(path))
+    assert store.moves([f'{api_url}/move/10/'], source)[f'{api_url}/move/10/'].power == 40
+    assert store.misses == 1
@@ -0,0 +1,217 @@
+import asyncio
+import json
+
+from pokemon_dialogue.battle import Evolution
+from pokemon_dialogue.roster import state_grammars
+from pokemon_dialogue.server import BattleData, BattleServer, BattleSession, SessionPokemon
+from tests.test_battle import moves, species
+
+
+def battle_data(charmander_hp=39):
+
+    sprites = {'front_default': 'https://sprites.test/front.png', 'back_default': 'https://sprites.test/back.png'}
+    data = {
+        'Bulbasaur': species('bulbasaur', (45, 49, 49, 45), ['grass'], [6, 3]),
+        'Charmander': species('charmander', (charmander_hp, 52, 43, 65), ['fire'], [1, 2, 3, 4]),
+        'Squirtle': species('squirtle', (44, 48, 65, 43), ['water'], [6, 3, 7, 8]),
+        'Charizard': species('charizard', (78, 84, 78, 100), ['fire', 'flying'], [1, 2, 4, 5]),
+    }
+    for record in data.values():
+        record.sprites = sprites
+
+    charizard = SessionPokemon('Charizard', 99, -40, 120, data['Charizard'], 320, 'back_default')
+    charizard.set_moves(moves)
+    return BattleData(data, moves, Evolution(charizard))
+
+
+def listening(events):
+
+    return [event['grammar'] for event in events if event['event'] == 'listen']
+
+
+def answer(events):
+    """ What a player says to the events the client just played: fight, then the first move """
+
+    grammar = listening(events)[-1]
+    if grammar == state_grammars['player turn']:
+        return 'たたかう'
+    buttons = [event for event in events if event['event'] == 'buttons']
+    return buttons[-1]['labels'][0]
+
+
+def play(session, text):
+    """ Answer until the game is over, return every event on the way """
+
+    played = []
+    events = session.hear(text)
+    while True:
+        played.extend(events)
+        if events[-1]['event'] == 'gameover':
+            return played
+        assert len(played) < 10000
+        events = session.hear(answer(events))
+
+
+class Booth():
+    """ The client end of one connection, in memory """
+
+    def __init__(self):
+
+        self.reader = asyncio.StreamReader()
+        self.received = asyncio.StreamReader()
+        self.closed = False
+
+    # the server's StreamWriter
+
+    def write(self, data):
+
+        self.received.feed_data(data)
+
+    async def drain(self):
+
+        pass
+
+    def close(self):
+
+        self.closed = True
+        self.received.feed_eof()
+
+    async def wait_closed(self):
+
+        pass
+
+    # the booth
+
+    def send(self, request):
+
+        line = request if isinstance(request, bytes) else json.dumps(request, ensure_ascii=False).encode('utf-8')
+        self.reader.feed_data(line + b'\n')
+
+    async def events(self):
+        """ The events the server answered one request with (up to the next listen, gameover or error) """
+
+        events = []
+        while not events or events[-1]['event'] not in ('listen', 'gameover', 'error'):
+            events.append(json.loads(await asyncio.wait_for(self.received.readline(), 5)))
+        return events
+
+
+def test_session_select_turn_move_gameover():
+
+    session = BattleSession(battle_data(), seed=1)
+    events = session.start()
+    assert session.status == 'select pokemon'
+    assert listening(events) == [state_grammars['select pokemon']]
+    assert len(events[0]['sprites']) == 3 and events[0]['hp'] == []
+
+    # not a starter: nothing happens, listen again
+    assert session.hear('かいふく') == [{'event': 'listen', 'grammar': state_grammars['select pokemon']}]
+
+    events = session.hear('ゼニガメ')
+    assert (session.player.name, session.rival.name) == ('Squirtle', 'Bulbasaur')
+    assert session.rival.level == 22
+    assert {'event': 'sound', 'path': 'pokemon_dialogue/vstrainer.wav', 'loops': -1} in events
+    assert session.status == 'player turn'
+    assert listening(events) == [state_grammars['player turn']]
+
+    events = session.hear('たたかう')
+    assert session.status == 'player move'
+    assert listening(events) == [state_grammars['player move']]
+    labels = [event for event in events if event['event'] == 'buttons'][0]['labels']
+    assert labels == ['たいあたり', 'あわ', 'みずでっぽう', ' ']
+
+    played = play(session, labels[0])
+    assert session.status == 'gameover'
+    gameover = played[-1]
+    assert gameover['winner'] in ('player', 'rival')
+    assert [event for event in played if event['event'] == 'message'][-1]['text'] == 'もういちど　たたかいますか？ (Y/N)?'
+    hp = [event for event in played if event['event'] == 'hp']
+    assert min(event['hp'] for event in hp) == 0
+
+    # playing again starts over from the select screen
+    assert listening(session.start()) == [state_grammars['select pokemon']]
+    assert session.battle is None
+
+
+def test_session_charmander_evolves():
+
+    # a ヒトカゲ that faints on the first hit
+    data = battle_data(charmander_hp=1)
+    session = BattleSession(data, seed=3)
+    session.start()
+    played = play(session, 'ヒトカゲ')
+
+    flicker = [event for event in played if event['event'] == 'flicker']
+    assert len(flicker) == 1
+    assert (flicker[0]['old']['name'], flicker[0]['new']['name']) == ('Charmander', 'Charizard')
+    assert {'event': 'message', 'text': 'ヒトカゲは　リザードンに　しんかした！', 'duration': 3000} in played
+    assert session.player.name == 'Charizard'
+
+    # リザードン comes back with 1 hp and attacks at once, then the battle goes on to its end
+    after = played[played.index(flicker[0]):]
+    assert {'event': 'message', 'text': 'リザードンは　ほのおのうずを　はいた！', 'duration': 2000} in after
+    assert played[-1]['event'] == 'gameover'
+
+    # the shared template is copied, never played
+    assert data.evolution.template.current_hp == data.evolution.template.max_hp
+
+
+def test_server_plays_and_survives_bad_requests():
+
+    async def booth_session():
+
+        server = BattleServer(battle_data())
+        booth = Booth()
+        handler = asyncio.create_task(server.handle_client(booth.reader, booth))
+
+        events = await booth.events()
+        assert events[0] == {'event': 'session', 'id': 1}
+        assert listening(events) == [state_grammars['select pokemon']]
+        assert list(server.sessions) == [1]
+
+        # bad requests are answered with an error and the booth stays connected
+        booth.send(b'{not json')
+        assert await booth.events() == [{'event': 'error', 'reason': 'bad request'}]
+        booth.send({'text': 'ヒトカゲ'})
+        assert await booth.events() == [{'event': 'error', 'reason': 'bad request'}]
+        booth.send({'type': 'dance'})
+        assert await booth.events() == [{'event': 'error', 'reason': "unknown request type 'dance'"}]
+        assert not booth.closed and not handler.done()
+
+        # select, then fight with the first move until the battle is over
+        booth.send({'type': 'utterance', 'text': 'ヒトカゲ'})
+        events = await booth.events()
+        while events[-1]['event'] != 'gameover':
+            booth.send({'type': 'utterance', 'text': answer(events)})
+            events = await booth.events()
+
+        # play again, then leave
+        booth.send({'type': 'restart'})
+        assert listening(await booth.events()) == [state_grammars['select pokemon']]
+        booth.send({'type': 'quit'})
+        await asyncio.wait_for(handler, 5)
+        assert booth.closed
+        assert server.sessions == {}
+
+    asyncio.run(booth_session())
+
+
+def test_server_session_ends_when_the_booth_disconnects():
+
+    async def booth_session():
+
+        server = BattleServer(battle_data())
+        booths = [Booth(), Booth()]
+        handlers = [asyncio.create_task(server.handle_client(booth.reader, booth)) for booth in booths]
+        ids = [(await booth.events())[0]['id'] for booth in booths]
+        assert sorted(ids) == [1, 2]
+
+        booths[0].reader.feed_eof()
+        await asyncio.wait_for(handlers[0], 5)
+        assert list(server.sessions) == [ids[1]]
+
+        booths[1].send({'type': 'quit'})
+        await asyncio.wait_for(handlers[1], 5)
+        assert server.sessions == {}
+
+    asyncio.run(booth_session())
@@ -0,0 +1,52 @@
+import sys
+
+import numpy as np
+import pytest
+
+from pokemon_dialogue import battle, simulator
+from tests.test_battle import matchup
+
+# battle.run_battles on 10000 battles against the vectorized simulator on 100000: the win and
+# evolution rates have a standard error of about 0.005 and the average turns of about 0.1, so
+# these tolerances are about four standard errors
+rate_tolerance = 0.02
+turns_tolerance = 0.5
+
+
+@pytest.mark.parametrize('evolve', [True, False])
+def test_matches_run_battles(evolve):
+
+    player, rival, evolutions = matchup()
+    if not evolve:
+        evolutions = {}
+
+    stats = battle.run_battles(player, rival, 10000, 'simulator', evolutions)
+    result = simulator.simulate_chunk(np.random.default_rng(0), player, rival, evolutions.get('Charmander'),
+                                      100000, 1000)
+
+    assert result.battles == 100000
+    assert not np.any(result.winners == simulator.running)
+    assert abs(result.win_rate - stats.win_rate) <= rate_tolerance
+    assert abs(np.mean(result.turns) - stats.average_turns) <= turns_tolerance
+    assert abs(np.mean(result.evolved) - stats.evolutions / stats.battles) <= rate_tolerance
+    if not evolve:
+        assert 0.5 < result.win_rate < 0.8
+
+
+def test_same_seed_same_result():
+
+    player, rival, evolutions = matchup()
+    first = simulator.simulate_chunk(np.random.default_rng(7), player, rival, evolutions['Charmander'], 1000, 1000)
+    second = simulator.simulate_chunk(np.random.default_rng(7), player, rival, evolutions['Charmander'], 1000, 1000)
+    for name in ('winners', 'turns', 'evolved', 'movesets'):
+        np.testing.assert_array_equal(getattr(first, name), getattr(second, name))
+
+
+@pytest.mark.parametrize('argv', [['pikachu'], ['-n', '10', 'pikachu']])
+def test_player_without_rival_is_a_usage_error(monkeypatch, capsys, argv):
+
+    monkeypatch.setattr(sys, 'argv', ['simulator.py'] + argv)
+    with pytest.raises(SystemExit) as exit:
+        simulator.main()
+    assert exit.value.code == 2
+    assert 'rival' in capsys.readouterr().err
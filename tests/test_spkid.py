@@ -0,0 +1,125 @@
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+import spkid
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def test_svm_matches_svm_predict():
+
+    # svm_predict.txt is what libsvm 3.37 gives for svm_ivectors.npy through svm-scale -r scale_iv_it3.dat and
+    # svm-predict with model_iv_it3: the label, then the one-vs-one decision values (svm_predict_values)
+    svm = spkid.SVM(os.path.join(spkid.sid_path, 'SVM', 'model_iv_it3'),
+                    os.path.join(spkid.sid_path, 'SVM', 'scale_iv_it3.dat'))
+    ivectors = np.load(os.path.join(data_dir, 'svm_ivectors.npy'))
+    expected = np.loadtxt(os.path.join(data_dir, 'svm_predict.txt'))
+    assert sorted(set(expected[:, 0])) == svm.label
+
+    for x, row in zip(ivectors, expected):
+        assert svm.predict(x) == int(row[0])
+        # svm-scale writes the scaled values with %g, hence the tolerance
+        np.testing.assert_allclose(svm.decision_values(x), row[1:], rtol=0, atol=1e-6)
+        assert svm.votes(x).sum() == len(svm.rho)
+
+    # the training minimum and maximum of each dimension scale to the bounds exactly
+    np.testing.assert_array_equal(svm.scale(ivectors[-2]), svm.lower)
+    np.testing.assert_array_equal(svm.scale(ivectors[-1]), svm.upper)
+
+
+class FakeIdentifier(object):
+    """ What the server needs of a SpeakerIdentifier """
+
+    def __init__(self, models):
+
+        self.models = models
+
+    def identify(self, filename):
+
+        if not os.path.exists(filename):
+            raise IOError('no such file: ' + filename)
+        return 3
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """ A server on a free port that has read the model files in tmp_path, and the paths of those files """
+
+    models = {}
+    for name in ('ubm', 'tvmatrix', 'model', 'scale'):
+        models[name] = str(tmp_path / name)
+        open(models[name], 'w').close()
+    (tmp_path / 'speech.mfcc').write_bytes(b'')
+
+    server = spkid.SpeakerIdServer(('localhost', 0), FakeIdentifier(models))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.chdir(tmp_path)
+    yield server.server_address[1], models
+
+    server.shutdown()
+    server.server_close()
+    thread.join(5)
+
+
+def test_query_with_the_served_models(server, capsys):
+
+    port, models = server
+    assert spkid.query(['speech.mfcc'], port=port) == [3]
+
+    # relative and symlinked paths to the same files are the same models
+    os.symlink(models['model'], 'link')
+    same = dict(models, scale='scale', model='link')
+    assert spkid.query(['speech.mfcc', 'speech.mfcc'], port=port, models=same) == [3, 3]
+    assert capsys.readouterr().err == ''
+
+    with pytest.raises(RuntimeError, match='missing.mfcc'):
+        spkid.query(['missing.mfcc'], port=port, models=models)
+
+
+@pytest.mark.parametrize('name', ['model', 'scale', 'extra'])
+def test_query_with_other_models_warns(server, tmp_path, capsys, name):
+
+    port, models = server
+    (tmp_path / 'other').write_text('')
+    assert spkid.query(['speech.mfcc'], port=port, models=dict(models, **{name: 'other'})) is None
+
+    err = capsys.readouterr().err
+    assert 'Warning' in err and 'different models: %s %s' % (name, tmp_path / 'other') in err
+
+
+def test_query_falls_back_to_the_requested_models(server, tmp_path, monkeypatch, capsys):
+
+    port, models = server
+    loaded = []
+
+    class LocalIdentifier(FakeIdentifier):
+        """ The identifier main() loads when the server will not do """
+
+        def __init__(self, ubm, T_matrix, model, scale, *args):
+
+            loaded.append(dict(ubm=ubm, tvmatrix=T_matrix, model=model, scale=scale))
+            FakeIdentifier.__init__(self, loaded[-1])
+
+        def identify(self, filename):
+
+            return 4
+
+    monkeypatch.setattr(spkid, 'SpeakerIdentifier', LocalIdentifier)
+    argv = ['spkid.py', 'query', '--port', str(port)] + ['--%s=%s' % item for item in models.items()]
+
+    # the served models: the server answers
+    monkeypatch.setattr(sys, 'argv', argv + ['speech.mfcc'])
+    spkid.main()
+    assert capsys.readouterr().out == '3\n' and loaded == []
+
+    # another SVM: identified here with it
+    monkeypatch.setattr(sys, 'argv', argv + ['--model', 'other', 'speech.mfcc'])
+    spkid.main()
+    out, err = capsys.readouterr()
+    assert out == '4\n' and 'Warning' in err
+    assert loaded == [dict(models, model='other')]